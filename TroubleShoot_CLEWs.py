@@ -1,10 +1,31 @@
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, url_for
+import atexit
 import os
-import re
-import fnmatch
-from collections import defaultdict
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
+from itertools import chain
 import tempfile
-from werkzeug.utils import secure_filename
+import tracemalloc
+from clews_budget import CheckBudget, budgeted, errors_first
+from clews_cache import DiskModelCache, ParsedModelCache
+from clews_checks import (
+    check_all_checks, check_all_intro, check_all_report, check_all_text, check_data_consistency, check_data_ranges,
+    check_line_fields, check_rows, check_severity, check_technology_commodity_match, count_findings,
+    check_technology_commodity_match_output, consistency_params, data_ranges, default_target_params, did_you_mean,
+    duplicate_description, essential_items_in_model, iter_check_all_report, model_records, process_abrupt_changes,
+    process_zero_after_non_zero, process_zeros_in_params, read_gams_data_file5, read_gams_data_file_part3,
+    year_note,
+)
+from clews_diff import diff_models
+from clews_findings import dumps, ndjson_chunks, page
+from clews_incremental import revalidate
+from clews_jobs import JobQueue, MemoryJobStore, QueueFull, SQLiteJobStore
+from clews_metrics import Metrics, combine, timed_call, timing_record
+from clews_parser import as_parsed_model, iter_gams_sections, parse_gams_data_file_mmap
+from clews_upload import UploadError, spool_upload
+from clews_runner import iter_checks, run_checks_by_region
 
 application = Flask(__name__)
 
@@ -16,542 +37,105 @@ def home():
 
 @application.route('/upload', methods=['POST'])
 def upload():
+    """Parse an upload into the cache and return its SHA-256, for use as a later 'baseline'."""
     file = request.files.get('file')
     if not file:
         return jsonify({"error": "No file provided."})
-    file_path = os.path.join(tempfile.gettempdir(), secure_filename(file.filename))
-    file.save(file_path)
-
-all_flagged_lines = []
-
-
-def is_float(value):
-    try:
-        float(value)
-        return True
-    except ValueError:
-        return False
-
-#Part 1
-
-def read_gams_data_file(file_path):
-    with open(file_path, 'r') as file:
-        data = []
-        line_number = 0
-        skip_params = ['ResidualCapacity', 'TechnologyActivityByModeLowerLimit', 'TechnologyActivityByModeUpperLimit','TechnologyActivityIncreaseByModeLimit', 'TechnologyActivityDecreaseByModeLimit', 'InputActivityRatio', 'OutputActivityRatio']
-        skip_current_section = False
-        current_param_name = None
-        starting_year = None
-        for line in file:
-            line_number += 1
-            line_content = line.strip()
-            if line_content.startswith('*') or line_content.startswith('#') or not line_content:
-                continue
-            elif line_content.startswith("set YEAR"):
-                starting_year = int(re.search(r'\d+', line_content).group())
-            elif line_content.startswith("param"):
-                param_name = line_content.split()[1]
-                skip_current_section = any(param_name.startswith(p) for p in skip_params)
-                current_param_name = param_name
-            if skip_current_section:
-                continue
-            else:
-                float_values = [float(value) for value in line_content.split() if is_float(value)]
-                data.append((line_number, current_param_name, float_values))
-        return data, starting_year
-
-def flag_zero_after_non_zero(data):
-    flagged_lines = []
-    for line_number, param_name, float_values in data:
-        for i in range(1, len(float_values)):
-            if float_values[i] == 0 and float_values[i - 1] != 0:
-                flagged_lines.append((line_number, param_name, float_values))
-                break
-    return flagged_lines
-
-def process_zero_after_non_zero(filename):
-    data, starting_year = read_gams_data_file(filename)
-    flagged_lines = flag_zero_after_non_zero(data)
-
-    results = []
-
-    for line_number, param_name, float_values in flagged_lines:
-        with open(filename, "r") as file:
-            line_content = [line.strip() for index, line in enumerate(file, 1) if index == line_number][0]
-        technology, mode, *_ = line_content.split()
-
-        results.append((line_number, param_name, technology, starting_year + float_values.index(0)))
-
-    return results
-
-
-#Part 2
-
-def read_gams_data_file2(file_path):
-    with open(file_path, 'r') as file:
-        data = []
-        line_number = 0
-        current_param_name = None
-        current_section_lines = []
-        starting_year = None
-        for line in file:
-            line_number += 1
-            line_content = line.strip()
-            if line_content.startswith('*') or line_content.startswith('#') or not line_content:
-                continue
-            elif line_content.startswith("set YEAR"):
-                starting_year = int(re.search(r'\d+', line_content).group())
-            elif line_content.startswith("param"):
-                current_param_name = line_content.split()[1]
-            else:
-                if line_content.startswith('['):
-                    current_section_lines.append(line_content)
-                elif current_section_lines:
-                    split_values = current_section_lines[-1].strip("[]").split(',')
-                    technology, mode, commodity = split_values[1], split_values[0], split_values[2] if len(split_values) >= 3 else (None, None, None)
-                    float_values = [float(value) for value in line_content.split() if is_float(value)]
-                    data.append((line_number, current_param_name, technology, mode, commodity, float_values))
-                else:
-                    float_values = [float(value) for value in line_content.split() if is_float(value)]
-                    data.append((line_number, current_param_name, None, None, None, float_values))
-        return data, starting_year
-
-def flag_zeros_in_params(data, target_params):
-    flagged_lines = []
-    for line_number, param_name, technology, mode, commodity, float_values in data:
-        if param_name in target_params:
-            for i in range(len(float_values)):
-                if float_values[i] == 0:
-                    flagged_lines.append((line_number, param_name, technology, mode, commodity, float_values))
-                    break
-    return flagged_lines
-
-def process_zeros_in_params(filename, target_params):
-    data, starting_year = read_gams_data_file2(filename)
-    flagged_zeros = flag_zeros_in_params(data, target_params)
-
-    input_activity_ratios = []
-    output_activity_ratios = []
-
-    for line_number, param_name, technology, mode, commodity, float_values in flagged_zeros:
-        if param_name in target_params:
-            if param_name == 'InputActivityRatio':
-                input_activity_ratios.append((line_number, technology, mode, starting_year + float_values.index(0)))
-            elif param_name == 'OutputActivityRatio':
-                output_activity_ratios.append((line_number, technology, mode, starting_year + float_values.index(0)))
-
-    return input_activity_ratios, output_activity_ratios
-
-
-#Part 3
-
-def is_year(value):
+    file_path, digest = save_upload(file)
+    with saved_model(file_path, digest) as model:
+        return jsonify({'sha256': digest, 'lines': model.line_count})
+
+@application.errorhandler(UploadError)
+def upload_error(error):
+    return jsonify({'error': str(error)}), 400
+
+
+# Parsed uploads, keyed by the SHA-256 of the file content. A cached model
+# keeps the uploaded file it was parsed from until it is evicted and no
+# request is using it any more.
+def remove_model_file(model):
+    if os.path.exists(model.file_path):
+        os.remove(model.file_path)
+
+parsed_model_cache = ParsedModelCache(
+    max_entries=int(os.environ.get('CLEWS_CACHE_MAX_ENTRIES', 8)),
+    max_bytes=int(os.environ.get('CLEWS_CACHE_MAX_MB', 512)) * 1024 * 1024,
+    on_evict=remove_model_file,
+)
+atexit.register(parsed_model_cache.clear)
+
+# Parsed arrays saved to disk survive restarts and are shared between worker
+# processes. Set CLEWS_DISK_CACHE_DIR to an empty string to turn this off.
+disk_cache_dir = os.environ.get('CLEWS_DISK_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'clews-parse-cache'))
+disk_model_cache = DiskModelCache(
+    disk_cache_dir,
+    max_bytes=int(os.environ.get('CLEWS_DISK_CACHE_MAX_MB', 2048)) * 1024 * 1024,
+) if disk_cache_dir else None
+
+# Uploads that decompress to more than CLEWS_MAX_DATA_MB are refused (0: no limit)
+max_data_bytes = int(os.environ.get('CLEWS_MAX_DATA_MB', 0)) * 1024 * 1024 or None
+
+def save_upload(file):
+    """Stream an upload, decompressing .gz and .zip files, to a unique temp file; return (path, sha256).
+
+    The file is hashed on the way, so it is read and written only once.
+    """
+    return spool_upload(file.stream, max_bytes=max_data_bytes)
+
+@contextmanager
+def uploaded_model(file):
+    """Yield the parsed model for an upload, reusing the cached parse of an identical file."""
+    with saved_model(*save_upload(file)) as model:
+        yield model
+
+@contextmanager
+def saved_model(file_path, digest, baseline=None, timings=None):
+    """Yield the parsed model for an upload already saved by save_upload.
+
+    Given a ``baseline`` model, param blocks unchanged since it are not parsed
+    again. The parse is timed as the 'parse' stage, into ``timings`` too when
+    given; a model from the memory cache is not.
+    """
+    model = parsed_model_cache.get(digest, pin=True)
+    if model is not None:
+        os.remove(file_path)
+        try:
+            yield model
+        finally:
+            parsed_model_cache.unpin(model)
+        return
+    parse = as_parsed_model if baseline is None else partial(parse_gams_data_file_mmap, baseline=baseline)
+    if disk_model_cache is not None:
+        load = partial(disk_model_cache.load_or_parse, digest, file_path, parse=parse)
+    else:
+        load = partial(parse, file_path)
+    if stage_metrics.enabled or timings is not None:
+        model, timing = timed_call(load)
+        record_timing(model, 'parse', None, timing, timings=timings)
+    else:
+        model = load()
+    cached = parsed_model_cache.put(digest, model, pin=True)
     try:
-        year = int(value)
-        return 2015 <= year <= 2070
-    except ValueError:
-        return False
-
-def read_gams_data_file_part3(file_path, data_ranges):
-    data_file = open(file_path, "r")
-    data_sections = {}
-    current_section = None
-    line_number_mapping = defaultdict(list)
-    for line_number, line in enumerate(data_file, start=1):
-        line = line.strip()
-        if not line or line.startswith('*'):  # Skip empty lines or comments
-            continue
-        if line.startswith("set") or line.startswith("param"):
-            current_section = line.split()[1].strip(";")
-            data_sections[current_section] = []
-        elif current_section is not None and current_section in data_ranges:
-            data = line.strip().split()
-            if len(data) >= 6:  # Only append lines that have at least six fields
-                data_sections[current_section].append(data)
-                line_number_mapping[current_section].append(line_number)
-    data_file.close()
-    return data_sections, line_number_mapping
-
-data_ranges = {
-    'CapitalCost': (0, 7000),
-    'FixedCost': (0, 150),
-    'VariableCost': (-5, 100),
-    'OperationalLife': (0, 51),
-    'CapacityToActivityUnit': (0, 32),
-    'CapacityFactors': (0, 1),
-    'DiscountRate': (0, 1),
-    'ResidualCapacity': (0, 30),
-    'EmissionActivityRatio': (0, 1),
-    'YearSplit': (0, 1),
-    'SpecifiedAnnualDemand': (0, 200),
-    'SpecifiedDemandProfile': (0, 1),
-    'InputActivityRatio': (0.01, 3),
-    'OutputActivityRatio': (0.01, 20000),
-    'AccumulatedAnnualDemand': (0, 10000),
-}
-
-def check_data_ranges(data_sections, data_ranges, line_number_mapping):
-    out_of_range = []
-    processed_lines = set()
-    for param_name, data in data_sections.items():
-        if param_name not in data_ranges:
-            continue
-        index = 0
-        for row in data:
-            index += 1
-            line_number = line_number_mapping[param_name][index - 1]
-            if line_number in processed_lines:
-                continue
-            values = [float(v) for v in row[5:] if is_float(v) and not is_year(v)]  # Convert the values to float only if they are numbers and not years
-            for value in values:
-                if value < data_ranges[param_name][0]:
-                    out_of_range.append((param_name, line_number, "too small", value))
-                    processed_lines.add(line_number)
-                    break
-                elif value > data_ranges[param_name][1]:
-                    out_of_range.append((param_name, line_number, "too big", value))
-                    processed_lines.add(line_number)
-                    break
-
-    return out_of_range
-
-def process_data_ranges(file_path):
-    data_sections, line_number_mapping = read_gams_data_file_part3(file_path, data_ranges)
-    out_of_range = check_data_ranges(data_sections, data_ranges, line_number_mapping)
-
-    results = []
-    for param_name, line_number, size, value in out_of_range:
-        results.append((line_number, param_name, size, value))
-
-    return results
-
-
-#part 4
-
-def read_gams_data_file_part4(file_path, data_ranges):
-    data_file = open(file_path, "r")
-    data_sections = {}
-    current_section = None
-    line_number_mapping = defaultdict(list)
-    years = None
-    for line_number, line in enumerate(data_file, start=1):
-        line = line.strip()
-        if not line or line.startswith('*'):  # Skip empty lines or comments
-            continue
-        if line.startswith("set") or line.startswith("param"):
-            current_section = line.split()[1].strip(";")
-            data_sections[current_section] = []
-        elif current_section is not None and current_section in data_ranges:
-            data = line.strip().split()
-            if len(data) >= 6:  # Only append lines that have at least six fields
-                if not years:
-                    years = [int(y) for y in data[5:] if is_year(y)]
-                data_sections[current_section].append((data[:5], [float(v) for v in data[5:] if is_float(v)]))
-                line_number_mapping[current_section].append(line_number)
-    data_file.close()
-    return data_sections, line_number_mapping, years
-
-def check_abrupt_changes(data_sections, threshold, target_params, years, line_number_mapping):
-    flagged_lines = []
-    for param_name, data in data_sections.items():
-        if param_name not in target_params:
-            continue
-        index = 0
-        for row in data:
-            index += 1
-            float_values = row[1]  # Corrected here
-            for i in range(2, len(float_values)):
-                if (float_values[i - 1] == 0 and float_values[i] != 0) or (float_values[i - 1] != 0 and float_values[i] == 0):
-                    flagged_lines.append((param_name, line_number_mapping[param_name][index - 1], row[0][1], row[0][0], row[0][2] if len(row[0]) >= 3 else None, years[i - 1]))
-                elif float_values[i - 1] != 0 and float_values[i] != 0:
-                    ratio = float_values[i] / float_values[i - 1]
-                    if ratio < (1 - threshold) or ratio > (1 + threshold):
-                        year = years[i - 1]
-                        flagged_lines.append((param_name, line_number_mapping[param_name][index - 1], row[0][1], row[0][0], row[0][2] if len(row[0]) >= 3 else None, year))
-                        break
-    return flagged_lines
-
-def process_abrupt_changes(file_path, threshold=0.05):
-    target_params = {
-        'CapitalCost',
-        'FixedCost',
-        'VariableCost',
-        'CapacityFactors',
-        'DiscountRate',
-        'EmissionActivityRatio',
-        'YearSplit',
-        'SpecifiedAnnualDemand',
-        'SpecifiedDemandProfile',
-        'InputActivityRatio',
-        'OutputActivityRatio',
-        'AccumulatedAnnualDemand',
-        'TotalTechnologyAnnualActivityLowerLimit',
-        'TotalTechnologyAnnualActivityUpperLimit',
-    }
-
-    data_sections, line_number_mapping, years = read_gams_data_file_part4(file_path, target_params)
-    flagged_lines = check_abrupt_changes(data_sections, threshold, target_params, years, line_number_mapping)
-
-    flagged_lines_list = []
-    if flagged_lines:
-        for name, line_number, technology, mode, commodity, year in flagged_lines:
-            flagged_lines_list.append((line_number, name, mode, year))
-
-    return flagged_lines_list
-
-# Part 5
-
-def read_gams_data_file5(file_path):
-    data_sections = defaultdict(list)
-    current_section = None
-    with open(file_path, 'r') as file:
-        for line_number, line in enumerate(file, start=1):
-            line_content = line.strip()
-            if line_content.startswith('*') or line_content.startswith('#') or not line_content:
-                continue
-            elif line_content.startswith("param"):
-                current_section = line_content.split()[1]
-            else:
-                data_sections[current_section].append((line_number, line_content.split()))
-
-    return data_sections
-
-def check_data_consistency(data_sections):
-    duplicate_entries = defaultdict(list)
-    target_parameters = ['AccumulatedAnnualDemand', 'SpecifiedAnnualDemand']
-
-    for param, data in data_sections.items():
-        if param not in target_parameters:
-            continue
-
-        first_year = int(data[1][1][0])  # Updated to use the second row for first_year
-        for row in data:
-            line_number, row_data = row
-            if len(row_data) == 1:  # Skip the '[RE1,*,*]:' row
-                continue
-
-            seen_data = set()
-            commodity = row_data[0]
-            for col_index, value in enumerate(row_data[1:]):
-                if value != '0' and value in seen_data:
-                    year = first_year + col_index
-                    duplicate_entries[param].append((commodity, line_number, value, year))
-                else:
-                    seen_data.add(value)
-
-    return duplicate_entries
-
-def process_data_consistency(file_path):
-    data_sections = read_gams_data_file5(file_path)
-    duplicates = check_data_consistency(data_sections)
-
-    results = []
-    for param, duplicate_values in duplicates.items():
-        for commodity, line_number, value, year in duplicate_values:
-            results.append((line_number, param, commodity, year))
-
-    return results
-
-
-# Part 6
-
-necessary_commodities = {
-    'BIO', 'ELC001', 'ELC002', 'LFOR', 'LBLT', 'LWAT', 'LOTH', 'WTRPRC', 'AGRWAT', 'WTREVT',
-    'WTRGWT', 'WTRSUR', 'PUBWAT', 'PWRWAT', 'AGRDSL', 'TRABIO', 'PVR'
-}
-
-necessary_technologies = {
-    'MINLND', 'LNDFOR', 'LNDBLT', 'LNDWAT', 'LNDOTH', 'MINPRC', 'DEMAGRSURWAT', 'DEMAGRGWTWAT',
-    'DEMPUBSURWAT', 'DEMPUBGWTWAT', 'DEMPWRSURWAT', 'DEMPWRGWTWAT',
-    'DEMAGRDSL', 'DEMTRABIO'
-}
-
-def check_essential_items(file_path):
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
-        commodities_line = lines[7].strip()
-        technologies_line = lines[9].strip()
-
-    commodities = set(commodities_line.split()[1:])
-    technologies = set(technologies_line.split()[1:])
-
-    missing_commodities = necessary_commodities - commodities
-    missing_technologies = necessary_technologies - technologies
-
-    return missing_commodities, missing_technologies
-
-
-
-#part 7
-
-tech_commodity_mapping = {
-    "PWR*": {
-        "BIO": "BIO",
-        "TRN": "ELC001",
-        "OHC": ["OIL", "PWRWAT"],
-        "SOL": "SOL",
-        "PVR": "PVR",
-        "HYD": "HYD",
-        "COA": ["COA", "PWRWAT"],
-        "WND": "WND"
-    },
-    "LND*HR": ["LND", "WTRPRC", "AGRDSL"],
-    "LND*HI": ["LND", "WTRPRC", "AGRWAT", "AGRDSL"],
-    "DEMTRABIO": lambda commodity: commodity.startswith("CRP") and len(commodity) == 6,
-    "LNDFOR": ["LND", "WTRPRC"],
-    "LNDBLT": ["LND", "WTRPRC"],
-    "LNDWAT": ["LND", "WTRPRC"],
-    "LNDOTH": ["LND", "WTRPRC"],
-    "DEMAGRSURWAT": ["ELC002", "WTRSUR"],
-    "DEMAGRGWTWAT": ["ELC002", "WTRGWT"],
-    "DEMPUBSURWAT": ["ELC002", "WTRSUR"],
-    "DEMPUBGWTWAT": ["ELC002", "WTRGWT"],
-    "DEMPWRSURWAT": ["ELC002", "WTRSUR"],
-    "DEMPWRGWTWAT": ["ELC002", "WTRGWT"],
-}
-
-def get_mapping(tech):
-    for pattern, mapping in tech_commodity_mapping.items():
-        if fnmatch.fnmatch(tech, pattern) or tech == pattern:
-            if isinstance(mapping, dict):
-                for subpattern, commodity in mapping.items():
-                    if tech.startswith("PWR"):
-                        if re.search(subpattern, tech[3:]):
-                            return commodity
-            else:
-                return mapping
-    return None
-
-def check_technology_commodity_match(filename):
-    pattern = re.compile(r"\[RE1,(\w+),(\w+),[^,\]]+,\*")
-    flagged_lines = []
-
-    with open(filename, "r") as file:
-        in_input_activity_ratio_section = False
-
-        for line_number, line in enumerate(file, 1):
-            line = line.strip()
-            if line.startswith("param InputActivityRatio"):
-                in_input_activity_ratio_section = True
-            elif line.startswith("param") or line.startswith(";"):
-                in_input_activity_ratio_section = False
-            elif in_input_activity_ratio_section:
-                match = pattern.match(line)
-                if match:
-                    technology, commodity = match.groups()
-
-                    expected_commodity = get_mapping(technology)
-                    if expected_commodity:
-                        if isinstance(expected_commodity, list) and commodity not in expected_commodity:
-                            flagged_lines.append((line_number, technology, commodity))
-                        elif callable(expected_commodity) and not expected_commodity(commodity):
-                            flagged_lines.append((line_number, technology, commodity))
-                        elif not isinstance(expected_commodity, list) and not callable(expected_commodity) and commodity != expected_commodity:
-                            flagged_lines.append((line_number, technology, commodity))
-                    else:
-                        flagged_lines.append((line_number, technology, "UNEXPECTED"))
-
-    return flagged_lines
-
-
+        yield model
+    finally:
+        if cached:
+            parsed_model_cache.unpin(model)
+        else:
+            os.remove(file_path)
 
-        #Part 8
+@application.route('/metrics', methods=['GET'])
+def metrics():
+    """Totals per parse and check stage in the Prometheus text format."""
+    return stage_metrics.prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
 
-#Part 8
-
-tech_commodity_mapping_output = {
-    "MIN*": {
-        "BIO": "BIO",
-        "OIL": "OIL",
-        "SOL": "SOL",
-        "HYD": "HYD",
-        "COA": "COA",
-        "WND": "WND",
-        "LND": "LND",
-        "PRC": "WTRPRC",
-    },
-    "PWR*": {
-        "BIO": "ELC001",
-        "TRN": "ELC002",
-        "OHC": "ELC001",
-        "SOL": "ELC001",
-        "PVR": "ELC002",
-        "HYD": "ELC001",
-        "COA": "ELC001",
-        "WND": "ELC001",
-    },
-    "LND*": {
-        "FOR": ["LFOR", "WTREVT", "WTRGWT", "WTRSUR"],
-        "BLT": ["LBLT", "WTREVT", "WTRGWT", "WTRSUR"],
-        "WAT": ["LWAT", "WTREVT", "WTRGWT", "WTRSUR"],
-        "OTH": ["LOTH", "WTREVT", "WTRGWT", "WTRSUR"],
-    },
-    "MINPRC": "WTRPRC",
-    "DEMAGRSURWAT": "AGRWAT",
-    "DEMAGRGWTWAT": "AGRWAT",
-    "DEMPUBSURWAT": "PUBWAT",
-    "DEMPUBGWTWAT": "PUBWAT",
-    "DEMPWRSURWAT": "PWRWAT",
-    "DEMPWRGWTWAT": "PWRWAT",
-    "DEMAGRDSL": "AGRDSL",
-    "DEMTRABIO": "TRABIO",
-}
-
-def check_technology_commodity_match_output(filename):
-    pattern = re.compile(r"\[RE1,(\w+),(\w+),[^,\]]+,\*")
-    flagged_lines = []
-
-    with open(filename, "r") as file:
-        in_output_activity_ratio_section = False
-
-        for line_number, line in enumerate(file, 1):
-            line = line.strip()
-            if line.startswith("param OutputActivityRatio"):
-                in_output_activity_ratio_section = True
-            elif line.startswith("param") or line.startswith(";"):
-                in_output_activity_ratio_section = False
-            elif in_output_activity_ratio_section:
-                match = pattern.match(line)
-                if match:
-                    technology, commodity = match.groups()
-
-                    if not is_valid_mapping(technology, commodity, tech_commodity_mapping_output):
-                        flagged_lines.append((line_number, technology, commodity))
-
-    return flagged_lines
-
-def is_valid_mapping(technology, commodity, mappings):
-    prefix, rest = technology[:3], technology[3:]
-
-    if technology == "MINSOL" and commodity == "PVR":
-        return True
-
-    if prefix == "MIN":
-        if rest in mappings["MIN*"]:
-            return commodity == mappings["MIN*"][rest]
-        else:
-            return False
-    elif prefix == "IMP":
-        if len(rest) == 3:
-            return commodity.startswith("CRP") and rest == commodity[3:]
-        else:
-            return False
-    elif prefix == "LND":
-        if rest in ["FOR", "BLT", "WAT", "OTH"]:
-            return commodity in mappings["LND*"][rest]
-        else:
-            return commodity in ["WTREVT", "WTRGWT", "WTRSUR"] or (commodity.startswith("CRP") and (technology.endswith("HR") or technology.endswith("HI")))
-    elif prefix == "PWR":
-        tech_key = rest[:3]
-        if tech_key in mappings[prefix + "*"]:
-            return commodity == mappings[prefix + "*"][tech_key]
-        else:
-            return False
-    elif technology in mappings:
-        return commodity == mappings[technology]
-    else:
-        return False
+@application.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    stats = parsed_model_cache.stats()
+    if disk_model_cache is not None:
+        stats['disk'] = disk_model_cache.stats()
+    return jsonify(stats)
 
+all_flagged_lines = []
 
 #Section 2
 
@@ -561,9 +145,10 @@ def is_valid_mapping(technology, commodity, mappings):
 def zero_after_non_zero():
     file = request.files.get('file')
     if file:
-        file.save('temp_file.txt')
-        results = process_zero_after_non_zero('temp_file.txt')
-        os.remove('temp_file.txt')
+        with uploaded_model(file) as model:
+            results = process_zero_after_non_zero(model)
+        if response_format() != 'text':
+            return findings_response(model, [('zero_after_non_zero', results)], output=response_format())
 
         formatted_results = [
             f"• line {line_number}. {param_name}, {technology}, year {year}"
@@ -581,13 +166,14 @@ def zero_after_non_zero():
 def zeros_in_params():
     if 'file' in request.files:
         file = request.files['file']
-        file_path = os.path.join(tempfile.gettempdir(), secure_filename(file.filename))
-        file.save(file_path)
 
-        # Define your target_params here as a list of parameter names, for example:
-        target_params = ["InputActivityRatio", "OutputActivityRatio"]
+        target_params = default_target_params
 
-        input_activity_ratios, output_activity_ratios = process_zeros_in_params(file_path, target_params)
+        with uploaded_model(file) as model:
+            input_activity_ratios, output_activity_ratios = process_zeros_in_params(model, target_params)
+        if response_format() != 'text':
+            return findings_response(model, [('zeros_in_params', (input_activity_ratios, output_activity_ratios))],
+                                     target_params, output=response_format())
 
         formatted_iar = [
             f"• line {line_number}. {technology}, mode {mode}, year {year}"
@@ -617,17 +203,15 @@ def check_data_ranges_route():
     if file.filename == '':
         return jsonify({'error': 'No file provided'}), 400
 
-    file_path = os.path.join("temp", file.filename)
-    file.save(file_path)
-
-    data_sections, line_number_mapping = read_gams_data_file_part3(file_path, data_ranges)
-    out_of_range = check_data_ranges(data_sections, data_ranges, line_number_mapping)
-
-    os.remove(file_path)
+    with uploaded_model(file) as model:
+        data_sections, line_number_mapping = read_gams_data_file_part3(model, data_ranges)
+        out_of_range = check_data_ranges(data_sections, data_ranges, line_number_mapping)
+    if response_format() != 'text':
+        return findings_response(model, [('out_of_range', out_of_range)], output=response_format())
 
     if out_of_range:
         out_of_range_formatted = "\n".join(
-            [f"• '{param_name}' is {size} ({value}) at line {line_number}." for param_name, line_number, size, value in out_of_range])
+            [f"• '{param_name}' is {size} ({value}) at line {line_number}{year_note(year)}." for param_name, line_number, size, value, year in out_of_range])
         message = f"Whoa! We found a value that might be out of sensible range in:\n{out_of_range_formatted}"
     else:
         message = "All data values are within the specified ranges."
@@ -640,10 +224,11 @@ def check_data_ranges_route():
 def abrupt_changes():
     if 'file' in request.files:
         file = request.files['file']
-        file_path = os.path.join(tempfile.gettempdir(), secure_filename(file.filename))
-        file.save(file_path)
 
-        flagged_lines = process_abrupt_changes(file_path)
+        with uploaded_model(file) as model:
+            flagged_lines = process_abrupt_changes(model)
+        if response_format() != 'text':
+            return findings_response(model, [('abrupt_changes', flagged_lines)], output=response_format())
 
         formatted_lines = [
             f"• line {line_number}. See {name}, {mode}, year {year}"
@@ -663,14 +248,17 @@ def abrupt_changes():
 @application.route('/check_data_consistency', methods=['POST'])
 def check_data_consistency_route():
     file_path = request.form['file_path']
-    data_sections = read_gams_data_file5(file_path)
+    model = as_parsed_model(file_path, params=consistency_params)
+    data_sections = read_gams_data_file5(model)
     duplicates = check_data_consistency(data_sections)
+    if response_format() != 'text':
+        return findings_response(model, [('duplicates', duplicates)], output=response_format())
 
     duplicate_values_list = []
     for param, duplicate_values in duplicates.items():
         param_duplicate_values = f"• {param}:\n"
-        for commodity, line_number, value, year in duplicate_values:
-            param_duplicate_values += f"  - at line {line_number}. {commodity}, in year {year}, Value: '{value}'\n"
+        for label, line_number, value, year, run in duplicate_values:
+            param_duplicate_values += f"  - at line {line_number}. {duplicate_description(label, value, year, run)}\n"
         duplicate_values_list.append(param_duplicate_values)
 
     duplicate_values_text = "\n".join(duplicate_values_list)
@@ -685,10 +273,14 @@ def check_data_consistency_route():
 @application.route('/check_essential_items', methods=['POST'])
 def check_essential_items_route():
     file_path = request.form['file_path']
-    missing_commodities, missing_technologies = check_essential_items(file_path)
+    model = as_parsed_model(file_path, params=())
+    missing_commodities, missing_technologies, suggestions = essential_items_in_model(model)
+    if response_format() != 'text':
+        return findings_response(model, [('essential_items', (missing_commodities, missing_technologies, suggestions))],
+                                 output=response_format())
 
-    missing_commodities_list = "\n".join([f"• {commodity}" for commodity in missing_commodities])
-    missing_technologies_list = "\n".join([f"• {technology}" for technology in missing_technologies])
+    missing_commodities_list = "\n".join([f"• {did_you_mean(commodity, suggestions)}" for commodity in missing_commodities])
+    missing_technologies_list = "\n".join([f"• {did_you_mean(technology, suggestions)}" for technology in missing_technologies])
 
     commodities_message = (
         f"The following necessary commodities are missing or mispelt:\n{missing_commodities_list}"
@@ -711,7 +303,10 @@ def check_essential_items_route():
 @application.route('/check_technology_commodity_match', methods=['POST'])
 def check_technology_commodity_match_route():
     file_path = request.form['file_path']
-    flagged_lines = check_technology_commodity_match(file_path)
+    model = as_parsed_model(file_path, params=['InputActivityRatio'])
+    flagged_lines = check_technology_commodity_match(model)
+    if response_format() != 'text':
+        return findings_response(model, [('input_match', flagged_lines)], output=response_format())
 
     formatted_lines = [
         f"• 'UNEXPECTED' Commodity inputting to Technology '{technology}' (Line {line_number})"
@@ -731,7 +326,10 @@ def check_technology_commodity_match_route():
 @application.route('/check_technology_commodity_match_output', methods=['POST'])
 def check_technology_commodity_match_output_route():
     file_path = request.form['file_path']
-    flagged_lines = check_technology_commodity_match_output(file_path)
+    model = as_parsed_model(file_path, params=['OutputActivityRatio'])
+    flagged_lines = check_technology_commodity_match_output(model)
+    if response_format() != 'text':
+        return findings_response(model, [('output_match', flagged_lines)], output=response_format())
 
     if flagged_lines:
         message = "We found mismatched OUTPUT technology-commodity pairs:\n"
@@ -751,106 +349,435 @@ def check_all():
     file = request.files.get('file')
     if not file:
         return "Error: No file provided.", 400
-    file_path = os.path.join(tempfile.gettempdir(), secure_filename(file.filename))
-    file.save(file_path)
-
-    # Define your target_params here as a list of parameter names, for example:
-    target_params = ["InputActivityRatio", "OutputActivityRatio"]
-
-    # Call all the functions
-    # Make sure all these functions return plain text responses
-    zero_after_non_zero_result = process_zero_after_non_zero(file_path)
-    zeros_in_params_result = process_zeros_in_params(file_path, target_params)
-    abrupt_changes_result = process_abrupt_changes(file_path)
-    data_sections_part5 = read_gams_data_file5(file_path)
-    duplicates_result = check_data_consistency(data_sections_part5)
-    data_sections_part3, line_number_mapping = read_gams_data_file_part3(file_path, data_ranges)
-    out_of_range_result = check_data_ranges(data_sections_part3, data_ranges, line_number_mapping)
-    missing_commodities_set, missing_technologies_set = check_essential_items(file_path)
-    missing_commodities_result = list(missing_commodities_set)
-    missing_technologies_result = list(missing_technologies_set)
-    flagged_lines_input_result = check_technology_commodity_match(file_path)
-    flagged_lines_output_result = check_technology_commodity_match_output(file_path)
-
-    # Don't forget to clean up and remove the saved file
-    os.remove(file_path)
-
-    # Combine the results
-    combined_results = f"Zero After Non-Zero:\n{zero_after_non_zero_result}\n\n" \
-                       f"Zeros in Params:\n{zeros_in_params_result}\n\n" \
-                       f"Abrupt Changes:\n{abrupt_changes_result}\n\n" \
-                       f"Duplicates:\n{duplicates_result}\n\n" \
-                       f"Out of Range:\n{out_of_range_result}\n\n" \
-                       f"Missing Commodities:\n{missing_commodities_result}\n\n" \
-                       f"Missing Technologies:\n{missing_technologies_result}\n\n" \
-                       f"Flagged Lines Input:\n{flagged_lines_input_result}\n\n" \
-                       f"Flagged Lines Output:\n{flagged_lines_output_result}\n\n"
-
-
-    # Build the response string
-    response = ""
-    response = f"Line number refers to line in data file (open file in Notepad, use 'Ctrl G' to search line no. for extra clarity on issue)\n\n"
-    # Format Zero After Non-Zero
-    formatted_zero_after_non_zero = "\n".join([
-        f"- At line {line_number}: See {param_name}, {technology}, year {year}"
-        for line_number, param_name, technology, year in zero_after_non_zero_result
-    ])
-    if formatted_zero_after_non_zero:
-        response += f"Hey! We found a zero after a non-zero value at:\n{formatted_zero_after_non_zero}\n\n"
-
-    # Format Zeros in Params
-    formatted_zeros_in_params_input = "\n".join([
-        f"- At line {line_number}. See {param_name}, {technology}, year {year}"
-        for line_number, param_name, technology, year in zeros_in_params_result[0]
-    ])
-    formatted_zeros_in_params_output = "\n".join([
-        f"- At line {line_number}. See {param_name}, {technology}, year {year}"
-        for line_number, param_name, technology, year in zeros_in_params_result[1]
-    ])
-    if formatted_zeros_in_params_input or formatted_zeros_in_params_output:
-        response += f"Oi Muppet! We found a zero in the InputActivityRatio:\n{formatted_zeros_in_params_input}\n\n" \
-                    f"Oi Muppet! We found a zero in the OutputActivityRatio:\n{formatted_zeros_in_params_output}\n\n"
-
-    # Format Abrupt Changes
-    formatted_abrupt_changes = "\n".join([
-        f"- At line {line_number}. See {param_name}, {technology}, year {year}"
-        for line_number, param_name, technology, year in abrupt_changes_result
-    ])
-    if formatted_abrupt_changes:
-        response += f"Hmmm...We found an abrupt 5%+ change between values at\n{formatted_abrupt_changes}\n\n"
-
-    # Format Duplicates
-    formatted_duplicates = "\n".join([
-        f"- At line {line_number}. {commodity}, in year {year}, Value: '{value}'"
-        for param_name, duplicate_list in duplicates_result.items()
-        for commodity, line_number, value, year in duplicate_list
-    ])
-    if formatted_duplicates:
-        response += f"Uh-oh! We found duplicate values:\n{formatted_duplicates}\n\n"
-
-    # Format Out of Range
-    formatted_out_of_range = "\n".join([
-        f"- '{param_name}' is possibly {error_type} ({value}) at line {line_number}."
-        for param_name, line_number, error_type, value in out_of_range_result
-    ])
-    if formatted_out_of_range:
-        response += f"Whoa! We found a value that might be out of sensible range in:\n{formatted_out_of_range}\n\n"
-
-    # Format Missing Commodities and Missing Technologies
-    formatted_missing_commodities = "\n".join(missing_commodities_result)
-    formatted_missing_technologies = "\n".join(missing_technologies_result)
-
-    if formatted_missing_commodities:
-        response += f"Missing Commodities:\n{formatted_missing_commodities}\n\n"
-    else:
-        response += "All necessary commodities are present.\n\n"
 
-    if formatted_missing_technologies:
-        response += f"Missing Technologies:\n{formatted_missing_technologies}\n\n"
+    target_params = default_target_params
+
+    # 'Accept: application/json' asks for a page of finding records and
+    # 'Accept: application/x-ndjson' for all of them, one per line, paged by
+    # the 'offset' and 'limit' fields. NDJSON, and the text report when
+    # there is a 'stream' field, are sent as each check finishes. A 'timing'
+    # field adds the time, rows and findings of the parse and each check to
+    # the JSON. 'max_findings' caps the findings of each check, 'time_budget'
+    # (seconds) stops the checks when the time is up and 'fail_fast' stops
+    # them once one finds an error; the report then says which checks were cut short.
+    output = 'ndjson' if request.values.get('stream') == 'ndjson' else response_format()
+    ndjson = output == 'ndjson'
+    stream = ndjson or (output == 'text' and request.values.get('stream', '0') not in ('0', ''))
+    content_type = 'application/x-ndjson' if ndjson else 'text/plain'
+    offset, limit = request_page()
+    budget = request_budget()
+
+    file_path, digest = save_upload(file)
+    if os.path.getsize(file_path) >= stream_min_bytes and output != 'json':
+        return Response(stream_check_all(file_path, target_params, remove=True, ndjson=ndjson, offset=offset, limit=limit,
+                                         budget=budget),
+                        content_type=content_type)
+
+    # Parse the file once (or reuse the cached parse) and run every check against the same model.
+    # A 'baseline' field naming an earlier upload's SHA-256 (sent back in the
+    # X-Content-SHA256 header) re-checks only what changed since that upload.
+    baseline = request.form.get('baseline')
+    if stream:
+        return Response(stream_check_all_model(file_path, digest, target_params, baseline, ndjson=ndjson, offset=offset, limit=limit,
+                                               budget=budget),
+                        content_type=content_type, headers={'X-Content-SHA256': digest})
+    timing = {} if output == 'json' and request.values.get('timing', '0') not in ('0', '') else None
+    with saved_model(file_path, digest, parsed_model_cache.get(baseline) if baseline else None, timings=timing) as model:
+        if output == 'json':
+            results = check_all_results(model, target_params, digest=digest, baseline=baseline, timings=timing, budget=budget)
+            response = findings_response(model, results.items(), target_params, timing=timing, budget=budget)
+            response.headers['X-Content-SHA256'] = digest
+            return response
+        return check_all_model(model, target_params, digest=digest, baseline=baseline, budget=budget)
+
+# How check_all runs its checks: 'thread' (default), 'process' or 'serial',
+# on up to CLEWS_CHECK_WORKERS workers (default: one per CPU).
+check_executor = os.environ.get('CLEWS_CHECK_EXECUTOR', 'thread')
+check_workers = int(os.environ.get('CLEWS_CHECK_WORKERS', 0)) or None
+# Models with more than one region are split by region and each region's rows
+# checked on a process pool, unless CLEWS_SHARD_BY_REGION is 0.
+shard_by_region = os.environ.get('CLEWS_SHARD_BY_REGION', '1') != '0'
+# Uploads of at least CLEWS_STREAM_MIN_MB are checked a section at a time
+# and the report streamed back, instead of parsing the whole file first.
+stream_min_bytes = int(os.environ.get('CLEWS_STREAM_MIN_MB', 1024)) * 1024 * 1024
+# Time, rows and findings of every parse and check, served at /metrics,
+# unless CLEWS_METRICS is 0. CLEWS_TRACE_MEMORY=1 adds each one's peak
+# memory, at the cost of tracing every allocation. The peak is process-wide,
+# so the checks then run one at a time for each to get its own.
+stage_metrics = Metrics(enabled=os.environ.get('CLEWS_METRICS', '1') != '0')
+if os.environ.get('CLEWS_TRACE_MEMORY', '0') != '0':
+    tracemalloc.start()
+    check_executor = 'serial'
+
+def response_format():
+    """'text', 'json' or 'ndjson': whichever the request's Accept header prefers, text by default."""
+    return {
+        'application/json': 'json',
+        'application/x-ndjson': 'ndjson',
+    }.get(request.accept_mimetypes.best_match(['text/plain', 'application/json', 'application/x-ndjson']), 'text')
+
+def request_page():
+    """The request's 'offset' and 'limit' fields, neither below 0; a missing limit is None (no limit)."""
+    offset = max(request.values.get('offset', 0, type=int), 0)
+    limit = request.values.get('limit', type=int)
+    return offset, max(limit, 0) if limit is not None else None
+
+def request_budget():
+    """The CheckBudget asked for by the request's 'max_findings', 'time_budget' and 'fail_fast' fields, or None."""
+    max_findings = request.values.get('max_findings', type=int)
+    seconds = request.values.get('time_budget', type=float)
+    fail_fast = request.values.get('fail_fast', '0') not in ('0', '')
+    if max_findings is None and seconds is None and not fail_fast:
+        return None
+    return CheckBudget(max(max_findings, 0) if max_findings is not None else None, seconds, fail_fast)
+
+def findings_response(model, results, target_params=(), output='json', timing=None, budget=None):
+    """A JSON or NDJSON response of the findings in [(check name, result)].
+
+    The 'offset' and 'limit' fields of the request page through them; JSON
+    says where the next page starts in 'next_offset' (None on the last page)
+    and, given a ``timing`` dict, adds it as 'timing'. Given a ``budget``,
+    the checks it cut short are listed under 'truncated' in JSON and as
+    closing records in NDJSON.
+    """
+    offset, limit = request_page()
+    records = model_records(model, results, target_params)
+    if output == 'ndjson':
+        if budget is not None:
+            records = chain(records, budget.records())
+        return Response(ndjson_chunks(page(records, offset, limit)), content_type='application/x-ndjson')
+    findings = list(page(records, offset, limit + 1 if limit is not None else None))
+    next_offset = None
+    if limit is not None and len(findings) > limit:
+        findings.pop()
+        next_offset = offset + limit
+    body = {'findings': findings, 'offset': offset, 'limit': limit, 'next_offset': next_offset}
+    if timing is not None:
+        body['timing'] = timing
+    if budget is not None:
+        body['truncated'] = budget.truncated
+    return Response(dumps(body), content_type='application/json')
+
+
+# check_all results of recent uploads by (SHA-256, target params), so an
+# identical upload is answered straight away and a changed one can be
+# re-checked incrementally against the model it was edited from.
+check_results_cache = OrderedDict()
+check_results_lock = threading.Lock()
+check_results_max_entries = int(os.environ.get('CLEWS_CACHE_MAX_ENTRIES', 8))
+
+def cached_check_results(digest, target_params):
+    with check_results_lock:
+        results = check_results_cache.get((digest, tuple(target_params)))
+        if results is not None:
+            check_results_cache.move_to_end((digest, tuple(target_params)))
+        return results
+
+def cache_check_results(digest, target_params, results):
+    with check_results_lock:
+        check_results_cache[(digest, tuple(target_params))] = results
+        while len(check_results_cache) > check_results_max_entries:
+            check_results_cache.popitem(last=False)
+
+def record_timing(model, name, result, timing, target_params=(), timings=None):
+    """Add a stage's Timing, rows scanned and findings to /metrics, and to the ``timings`` dict when given."""
+    rows = check_rows(model, name, target_params)
+    findings = count_findings(name, result) if name in check_severity else 0
+    if stage_metrics.enabled:
+        stage_metrics.record(name, timing, rows, findings)
+    if timings is not None:
+        timings[name] = timing_record(timing, rows, findings)
+
+def iter_check_all_results(model, target_params, digest=None, baseline=None, timings=None, budget=None):
+    """Yield (name, result) for the check_all checks as each becomes available.
+
+    Each check that runs is timed for /metrics and, given a ``timings`` dict,
+    its timing record (see clews_metrics) stored there under its name.
+    Checks answered from the cache are not timed. Given a ``budget``, the
+    results are cut down to it and the checks stop once it is spent.
+    """
+    if not stage_metrics.enabled and timings is None:
+        results = run_check_all_checks(model, target_params, digest, baseline, budget=budget)
     else:
-        response += "All necessary technologies are present.\n\n"
-
-    return response, 200, {'Content-Type': 'text/plain'}
+        results = timed_check_all_results(model, target_params, digest, baseline, timings, budget)
+    if budget is not None:
+        results = budgeted(results, budget, [name for name, _ in check_all_checks(target_params)])
+    yield from results
+
+def timed_check_all_results(model, target_params, digest=None, baseline=None, timings=None, budget=None):
+    ran = {}
+    def on_timing(name, timing):
+        ran[name] = combine(ran.get(name), timing)
+    for name, result in run_check_all_checks(model, target_params, digest, baseline, on_timing, budget):
+        if name in ran:
+            record_timing(model, name, result, ran.pop(name), target_params, timings)
+        yield name, result
+
+def run_check_all_checks(model, target_params, digest=None, baseline=None, on_timing=None, budget=None):
+    """Yield (name, result) for the check_all checks, passing ``on_timing`` on to the runner.
+
+    Cached results for the upload are reused, and the full set is cached once
+    the last check is done. A ``budget`` with a time limit or fail-fast has
+    to be able to stop the checks part-way, so the model is not split by
+    region for it, and with fail-fast the checks whose findings are errors
+    come first, whether they are run or reused.
+    """
+    checks = check_all_checks(target_params)
+    order = errors_first(checks) if budget is not None and budget.fail_fast else checks
+    stoppable = budget is not None and (budget.deadline is not None or budget.fail_fast)
+    results = cached_check_results(digest, target_params) if digest else None
+    if results is None:
+        baseline_results = cached_check_results(baseline, target_params) if baseline else None
+        baseline_model = parsed_model_cache.get(baseline) if baseline_results is not None else None
+        if baseline_model is not None:
+            results = revalidate(baseline_model, baseline_results, model, checks, line_fields=check_line_fields,
+                                 model_checks={'essential_items'}, on_timing=on_timing)
+        elif shard_by_region and not stoppable and len(model.regions()) > 1:
+            results = run_checks_by_region(model, checks, line_fields=check_line_fields, model_checks={'essential_items'},
+                                           max_workers=check_workers, on_timing=on_timing)
+        if results is not None and digest:
+            cache_check_results(digest, target_params, results)
+    if results is not None:
+        for name, _ in order:
+            yield name, results[name]
+        return
+
+    results = {}
+    for name, result in iter_checks(model, order, executor=check_executor, max_workers=check_workers, on_timing=on_timing):
+        results[name] = result
+        yield name, result
+    if digest:
+        cache_check_results(digest, target_params, {name: results[name] for name, _ in checks})
+
+def check_all_results(model, target_params, digest=None, baseline=None, progress=None, timings=None, budget=None):
+    """{name: result} of the check_all checks, reusing cached results where the upload allows.
+
+    ``progress(name)`` is called as each check's result becomes available;
+    ``timings`` is as for iter_check_all_results. Given a ``budget``, results
+    are cut down to it and the checks it stopped before are left out.
+    """
+    results = {}
+    for name, result in iter_check_all_results(model, target_params, digest=digest, baseline=baseline, timings=timings,
+                                               budget=budget):
+        results[name] = result
+        if progress is not None:
+            progress(name)
+    return {name: results[name] for name, _ in check_all_checks(target_params) if name in results}
+
+
+def check_all_model(model, target_params, digest=None, baseline=None, budget=None):
+    results = check_all_results(model, target_params, digest=digest, baseline=baseline, budget=budget)
+
+    response = check_all_text(results, target_params)
+    if budget is not None:
+        response += budget.report()
+    headers = {'Content-Type': 'text/plain'}
+    if digest:
+        headers['X-Content-SHA256'] = digest
+    return response, 200, headers
+
+def stream_check_all_model(file_path, digest, target_params, baseline=None, ndjson=False, offset=0, limit=None, budget=None):
+    """Yield the check_all report for an upload saved by save_upload, a check at a time.
+
+    The checks run in parallel as usual. Text comes out in report order, each
+    check's section as soon as it and the ones above it are done; NDJSON
+    records come out in the order the checks finish, from ``offset`` on and
+    at most ``limit`` of them. Findings are formatted a chunk at a time, so
+    the response is never held in memory as a whole. A ``budget`` cuts the
+    results down as they come, and the report ends with its note.
+    """
+    with saved_model(file_path, digest, parsed_model_cache.get(baseline) if baseline else None) as model:
+        order = [name for name, _ in check_all_checks(target_params)]
+        results = iter_check_all_results(model, target_params, digest=digest, baseline=baseline, budget=budget)
+        if ndjson:
+            records = model_records(model, results, target_params)
+            if budget is not None:
+                records = chain(records, budget.records())
+            yield from ndjson_chunks(page(records, offset, limit))
+            return
+        yield check_all_intro
+        done = {}
+        for name, result in results:
+            done[name] = result
+            while order and order[0] in done:
+                yield from iter_check_all_report(order[0], done.pop(order.pop(0)))
+        # Checks the budget stopped before leave gaps in the report order
+        for name in order:
+            if name in done:
+                yield from iter_check_all_report(name, done.pop(name))
+        if budget is not None:
+            yield budget.report()
+
+def section_check_results(file_path, target_params, budget=None):
+    """Yield (model, name, result) for the check_all checks on ``file_path``, a param section at a time.
+
+    The model holds the sets and only the section being checked; the
+    essential items, which need every set, come last; with fail_fast they
+    come first, so that their errors stop the run before any section is
+    read, and each section's error checks run before its other checks.
+    A ``budget`` cuts the results down to it; a check is not run on further
+    sections once it has reported all it may, and the file is read no
+    further once the budget is spent or no check wants more (only the sets
+    are read then, for the essential items).
+    """
+    checks = [(name, function) for name, function in check_all_checks(target_params) if name != 'essential_items']
+    essentials_first = budget is not None and budget.fail_fast
+    if essentials_first:
+        checks = errors_first(checks)
+        model = parse_gams_data_file_mmap(file_path, params=())
+        yield model, 'essential_items', budget.take('essential_items', timed_check(
+            model, 'essential_items', essential_items_in_model, target_params))
+        if budget.stopped():
+            budget.cut_short(name for name, _ in checks)
+            return
+    # The checks the run stops short of, should the budget run out
+    left = checks if essentials_first else check_all_checks(target_params)
+    model = None
+    sections = iter_gams_sections(file_path)
+    for model, section in sections:
+        if section.kind != 'param':
+            continue
+        for name, function in checks:
+            if budget is None:
+                yield model, name, timed_check(model, name, function, target_params)
+            elif budget.wants(name):
+                yield model, name, budget.take(name, timed_check(model, name, function, target_params))
+            else:
+                budget.turn_away([name])
+        if budget is not None and budget.stopped():
+            sections.close()
+            budget.cut_short(name for name, _ in left)
+            return
+        if budget is not None and not any(budget.wants(name) for name, _ in checks):
+            sections.close()
+            budget.turn_away(name for name, _ in checks)
+            if essentials_first:
+                return
+            model = parse_gams_data_file_mmap(file_path, params=())
+            break
+    if essentials_first:
+        return
+    if model is None:
+        model = as_parsed_model(file_path)
+    result = timed_check(model, 'essential_items', essential_items_in_model, target_params)
+    yield model, 'essential_items', result if budget is None else budget.take('essential_items', result)
+
+def timed_check(model, name, function, target_params=()):
+    """``function(model)``, timed for /metrics when that is on."""
+    if not stage_metrics.enabled:
+        return function(model)
+    result, timing = timed_call(function, model)
+    record_timing(model, name, result, timing, target_params)
+    return result
+
+def stream_check_all(file_path, target_params, remove=False, ndjson=False, offset=0, limit=None, budget=None):
+    """Yield the check_all report for ``file_path`` a param section at a time.
+
+    Each section is parsed, checked and released before the next one is read,
+    so memory stays bounded by the largest section. Findings come out under a
+    heading per section rather than one per check. ``remove`` deletes the
+    file afterwards. With ``ndjson``, the findings from ``offset`` on (at most
+    ``limit`` of them) come out as NDJSON records instead. ``budget`` is as
+    for section_check_results, and the report ends with its note.
+    """
+    try:
+        if ndjson:
+            records = (
+                record
+                for model, name, result in section_check_results(file_path, target_params, budget)
+                for record in model_records(model, [(name, result)], target_params)
+            )
+            if budget is not None:
+                records = chain(records, budget.records())
+            yield from ndjson_chunks(page(records, offset, limit))
+            return
+        yield check_all_intro
+        for _, name, result in section_check_results(file_path, target_params, budget):
+            yield from iter_check_all_report(name, result)
+        if budget is not None:
+            yield budget.report()
+    finally:
+        if remove and os.path.exists(file_path):
+            os.remove(file_path)
+
+
+# Structural diff between two versions of a data file
+# How many added, removed and changed rows /diff lists per param by default
+diff_row_limit = int(os.environ.get('CLEWS_DIFF_ROW_LIMIT', 1000))
+
+@application.route('/diff', methods=['POST'])
+def diff():
+    old_file = request.files.get('old')
+    new_file = request.files.get('new')
+    if not old_file or not new_file:
+        return jsonify({'error': 'Provide the two versions to compare as the files old and new.'}), 400
+    limit = request.form.get('limit', diff_row_limit, type=int)
+
+    # The new version is parsed against the old one, so blocks that did not
+    # change are neither parsed nor compared again.
+    with uploaded_model(old_file) as old_model:
+        with saved_model(*save_upload(new_file), old_model) as new_model:
+            model_diff = diff_models(old_model, new_model)
+            return jsonify(model_diff.to_dict(limit))
+
+
+# Background jobs: POST /jobs queues check_all, or one of its checks, on an
+# upload and answers with the job's id straight away; GET /jobs/<id> gives
+# its progress per check and, once it is done, the report. Job records are
+# kept in memory, or in the SQLite database CLEWS_JOB_DB so that every
+# process of the app can answer for them.
+job_db = os.environ.get('CLEWS_JOB_DB')
+job_queue = JobQueue(
+    store=SQLiteJobStore(job_db) if job_db else MemoryJobStore(),
+    workers=int(os.environ.get('CLEWS_JOB_WORKERS', 2)),
+    max_pending=int(os.environ.get('CLEWS_JOB_QUEUE', 8)),
+    ttl=int(os.environ.get('CLEWS_JOB_TTL', 3600)),
+)
+# The checks a job can run on their own; the technology-commodity matches
+# have their own report format and routes.
+job_checks = ['zero_after_non_zero', 'zeros_in_params', 'abrupt_changes', 'duplicates', 'out_of_range', 'essential_items']
+
+def run_check_job(file_path, digest, check, target_params, baseline, progress):
+    with saved_model(file_path, digest, parsed_model_cache.get(baseline) if baseline else None) as model:
+        if check == 'check_all':
+            results = check_all_results(model, target_params, digest=digest, baseline=baseline, progress=progress)
+            return check_all_text(results, target_params)
+        result = dict(check_all_checks(target_params))[check](model)
+        progress(check)
+        return check_all_intro + check_all_report(check, result)
+
+@application.route('/jobs', methods=['POST'])
+def submit_job():
+    file = request.files.get('file')
+    if not file:
+        return jsonify({'error': 'No file provided.'}), 400
+    check = request.form.get('check', 'check_all')
+    if check != 'check_all' and check not in job_checks:
+        return jsonify({'error': f"Unknown check '{check}'; use check_all or one of {', '.join(job_checks)}."}), 400
+
+    target_params = default_target_params
+    steps = [name for name, _ in check_all_checks(target_params)] if check == 'check_all' else [check]
+
+    # Turn the upload away before saving it when nothing more can be queued
+    busy = (jsonify({'error': 'Too many jobs are waiting; try again shortly.'}), 429, {'Retry-After': '30'})
+    if job_queue.full():
+        return busy
+    file_path, digest = save_upload(file)
+    try:
+        job_id = job_queue.submit(
+            check, partial(run_check_job, file_path, digest, check, target_params, request.form.get('baseline')),
+            steps=steps, on_reject=lambda: os.remove(file_path))
+    except QueueFull:
+        return busy
+    status_url = url_for('job_status', job_id=job_id)
+    return jsonify({'id': job_id, 'status': 'queued', 'url': status_url}), 202, {'Location': status_url}
+
+@application.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'No such job.'}), 404
+    return jsonify(job)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,198 @@
+"""Benchmark: every read_gams_data_file* reader and every check_all check on generated data files.
+
+Run from the repository root:
+
+    python benchmarks/bench_checks.py [--sizes MB ...] [--repeat R] [--data-dir DIR]
+        [--results-dir DIR] [--compare RESULTS.json] [--threshold FRACTION]
+
+For each size (1, 50 and 500 MB by default) a data file is generated by
+generate_data.py, once, into --data-dir. Each reader is timed on the file
+path, parsing it as the routes do; each check is timed on a model parsed
+beforehand, so its time is the check's alone. Every stage records its best
+wall time of --repeat runs, CPU time, throughput in rows/s (of the params
+it reads) and MB/s (of the whole file) and peak RSS. On Linux peak RSS is
+reset before each stage, so it is the stage's own high-water mark;
+elsewhere it is the process's so far.
+
+Results are saved as JSON in --results-dir. --compare reads an earlier
+results file, prints each stage's change in wall time and exits with
+status 1 when any stage got slower by more than --threshold. Stages that
+took less than NOISE_SECONDS are listed but never count as slower.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clews_checks  # noqa: E402
+from clews_metrics import timed_call  # noqa: E402
+from clews_parser import parse_gams_data_file_mmap  # noqa: E402
+from generate_data import generate  # noqa: E402
+
+TARGET_PARAMS = clews_checks.default_target_params
+
+# Below this, run-to-run noise swamps any change in wall time
+NOISE_SECONDS = 0.01
+
+
+def readers():
+    """(name, function(path)) for each reader, with the params check_all gives it."""
+    return [
+        ('parse_gams_data_file_mmap', parse_gams_data_file_mmap),
+        ('read_gams_data_file', clews_checks.read_gams_data_file),
+        ('read_gams_data_file2', lambda path: clews_checks.read_gams_data_file2(path, TARGET_PARAMS)),
+        ('read_gams_data_file_part3', lambda path: clews_checks.read_gams_data_file_part3(path, clews_checks.data_ranges)),
+        ('read_gams_data_file_part4', lambda path: clews_checks.read_gams_data_file_part4(path, clews_checks.abrupt_change_params)),
+        ('read_gams_data_file5', lambda path: clews_checks.read_gams_data_file5(path, clews_checks.consistency_params)),
+    ]
+
+
+def reset_peak_rss():
+    """Reset the kernel's peak RSS of this process; False where that is not supported."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def measure(function, argument, repeat):
+    """Best wall time of ``repeat`` calls, with the CPU time of that call and the peak RSS over all of them."""
+    reset_peak_rss()
+    best = None
+    for _ in range(repeat):
+        _, timing = timed_call(function, argument)
+        if best is None or timing.wall < best.wall:
+            best = timing
+    return best, peak_rss_mb()
+
+
+def stage_record(kind, name, timing, peak_rss, rows, file_bytes):
+    return {
+        'kind': kind,
+        'stage': name,
+        'wall_seconds': round(timing.wall, 6),
+        'cpu_seconds': round(timing.cpu, 6),
+        'rows': rows,
+        'rows_per_second': round(rows / timing.wall, 1) if timing.wall else None,
+        'mb_per_second': round(file_bytes / (1024 * 1024) / timing.wall, 2) if timing.wall else None,
+        'peak_rss_mb': round(peak_rss, 1),
+    }
+
+
+def bench_size(size_mb, data_dir, repeat, seed=0):
+    """Generate (or reuse) a ``size_mb`` MB data file and time every reader and check on it."""
+    file_path = os.path.join(data_dir, f'clews-bench-{size_mb:g}mb-seed{seed}.txt')
+    if not os.path.exists(file_path):
+        started = time.perf_counter()
+        generate(file_path, size_mb=size_mb, seed=seed)
+        print(f"generated {file_path} in {time.perf_counter() - started:.1f} s")
+    file_bytes = os.path.getsize(file_path)
+
+    model = parse_gams_data_file_mmap(file_path)
+    rows = clews_checks.check_rows(model, 'parse')
+    print(f"{file_path}: {file_bytes / (1024 * 1024):.1f} MB, {rows} param rows, best of {repeat}")
+    stages = []
+    for name, read in readers():
+        timing, peak_rss = measure(read, file_path, repeat)
+        stages.append(stage_record('reader', name, timing, peak_rss, rows, file_bytes))
+    for name, check in clews_checks.check_all_checks(TARGET_PARAMS):
+        timing, peak_rss = measure(check, model, repeat)
+        stages.append(stage_record('check', name, timing, peak_rss, clews_checks.check_rows(model, name, TARGET_PARAMS), file_bytes))
+    for stage in stages:
+        print(f"  {stage['stage']:28} {stage['wall_seconds'] * 1000:10.1f} ms  {stage['rows_per_second'] or 0:12.0f} rows/s"
+              f"  {stage['mb_per_second'] or 0:8.1f} MB/s  {stage['peak_rss_mb']:8.1f} MB peak RSS")
+    return {'size_mb': size_mb, 'file_bytes': file_bytes, 'rows': rows, 'stages': stages}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous, threshold):
+    """Print each stage's change in wall time against ``previous``; return the stages slower beyond ``threshold``."""
+    before = {
+        (size['size_mb'], stage['stage']): stage['wall_seconds']
+        for size in previous['sizes'] for stage in size['stages']
+    }
+    slower = []
+    print(f"against {previous.get('commit') or 'previous run'} from {previous.get('created')}:")
+    for size in results['sizes']:
+        for stage in size['stages']:
+            old = before.get((size['size_mb'], stage['stage']))
+            if not old:
+                continue
+            change = stage['wall_seconds'] / old - 1
+            flag = ''
+            if change > threshold and old >= NOISE_SECONDS:
+                flag = '  SLOWER'
+                slower.append((size['size_mb'], stage['stage']))
+            print(f"  {size['size_mb']:g} MB {stage['stage']:28} {old:9.3f} s -> {stage['wall_seconds']:9.3f} s  {change:+7.1%}{flag}")
+    return slower
+
+
+def main(argv=None):
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1, 50, 500], help="data file sizes in MB")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=tempfile.gettempdir(), help="where generated data files are kept")
+    parser.add_argument('--results-dir', default=os.path.join(here, 'results'))
+    parser.add_argument('--compare', help="an earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1, help="slowdown that counts as a regression")
+    args = parser.parse_args(argv)
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'repeat': args.repeat,
+        'sizes': [bench_size(size_mb, args.data_dir, args.repeat, args.seed) for size_mb in args.sizes],
+    }
+    os.makedirs(args.results_dir, exist_ok=True)
+    results_path = os.path.join(args.results_dir, f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(results_path, 'w') as file:
+        json.dump(results, file, indent=1)
+    print(f"saved {results_path}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            previous = json.load(file)
+        if compare(results, previous, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark: the text reader against the mmap reader on one data file.
+
+Run from the repository root, on a data file of your own or on a generated one:
+
+    python benchmarks/bench_readers.py [--file PATH | --technologies N] [--repeat R]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clews_parser import parse_gams_data_file, parse_gams_data_file_mmap  # noqa: E402
+
+YEARS = list(range(2015, 2071))
+
+
+def write_sample(file, technologies, seed=0):
+    rng = random.Random(seed)
+    names = [f"PWR{rng.choice(['COA', 'SOL', 'WND', 'HYD'])}{i:03d}" for i in range(technologies)]
+    years = ' '.join(str(year) for year in YEARS)
+    file.write(f"set YEAR := {years} ;\n")
+    file.write("set REGION := RE1 ;\n")
+    file.write(f"set TECHNOLOGY := {' '.join(names)} ;\n")
+    for param in ('InputActivityRatio', 'OutputActivityRatio'):
+        file.write(f"param {param} default 0 :=\n")
+        for technology in names:
+            file.write(f"[RE1,{technology},ELC001,*,*]:\n{years} :=\n")
+            for mode in (1, 2):
+                file.write(f"{mode} " + ' '.join(f"{rng.uniform(0, 3):.4f}" for _ in YEARS) + "\n")
+        file.write(";\n")
+    file.write("param CapitalCost default 0 :=\n[RE1,*,*]:\n" + years + " :=\n")
+    for technology in names:
+        file.write(f"{technology} " + ' '.join(f"{rng.uniform(0, 5000):.2f}" for _ in YEARS) + "\n")
+    file.write(";\nend;\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--file', help="data file to read (default: a generated one)")
+    parser.add_argument('--technologies', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    file_path = args.file
+    if file_path is None:
+        with tempfile.NamedTemporaryFile('w', prefix='clews-bench-', suffix='.txt', delete=False) as file:
+            write_sample(file, args.technologies)
+        file_path = file.name
+    try:
+        timings = [
+            ("text reader", lambda: parse_gams_data_file(file_path)),
+            ("mmap reader", lambda: parse_gams_data_file_mmap(file_path)),
+            ("mmap, CapitalCost only", lambda: parse_gams_data_file_mmap(file_path, ['CapitalCost'])),
+        ]
+        size = os.path.getsize(file_path) / (1024 * 1024)
+        print(f"{file_path}: {size:.1f} MB, best of {args.repeat}")
+        baseline = None
+        for label, read in timings:
+            best = min(timeit.repeat(read, number=1, repeat=args.repeat))
+            baseline = baseline or best
+            print(f"  {label:24} {best * 1000:9.1f} ms  {size / best:7.1f} MB/s  {baseline / best:6.2f}x")
+    finally:
+        if args.file is None:
+            os.remove(file_path)
+
+
+if __name__ == '__main__':
+    main()
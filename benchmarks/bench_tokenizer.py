@@ -0,0 +1,74 @@
+"""Micro-benchmark: clews_parser.tokenize_line against the old try/except helpers.
+
+Run from the repository root:
+
+    python benchmarks/bench_tokenizer.py [--lines N] [--repeat R]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clews_parser import tokenize_line  # noqa: E402
+
+
+def legacy_is_float(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def legacy_is_year(value):
+    try:
+        year = int(value)
+        return 2015 <= year <= 2070
+    except ValueError:
+        return False
+
+
+def legacy_tokenize(line_content):
+    # What the readers used to do for every line: split, then classify and
+    # convert each token with the exception-raising helpers.
+    tokens = line_content.split()
+    years = [int(token) for token in tokens if legacy_is_year(token)]
+    values = [float(token) for token in tokens if legacy_is_float(token)]
+    return tokens, years, values
+
+
+def sample_lines(count, seed=0):
+    rng = random.Random(seed)
+    years = ' '.join(str(year) for year in range(2015, 2056))
+    lines = []
+    while len(lines) < count:
+        technology = f"PWR{rng.choice(['COA', 'SOL', 'WND', 'HYD'])}{rng.randint(0, 999):03d}"
+        lines.append(f"[RE{rng.randint(1, 9)},{technology},ELC001,*,*]:")
+        lines.append(f"{years} :=")
+        for mode in (1, 2):
+            lines.append(f"{mode} " + ' '.join(f"{rng.uniform(0, 3):.4f}" for _ in range(41)))
+        lines.append(f"{technology} " + ' '.join(f"{rng.uniform(0, 5000):.2f}" for _ in range(41)))
+    return lines[:count]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lines', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    lines = sample_lines(args.lines)
+    legacy = min(timeit.repeat(lambda: [legacy_tokenize(line) for line in lines], number=1, repeat=args.repeat))
+    current = min(timeit.repeat(lambda: [tokenize_line(line) for line in lines], number=1, repeat=args.repeat))
+
+    print(f"{args.lines} lines, best of {args.repeat}")
+    print(f"  try/except helpers: {legacy * 1000:9.1f} ms")
+    print(f"  tokenize_line:      {current * 1000:9.1f} ms")
+    print(f"  speedup:            {legacy / current:9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
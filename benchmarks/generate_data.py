@@ -0,0 +1,214 @@
+"""Generate a synthetic CLEWs data file with known rates of the problems the checks look for.
+
+Run from the repository root:
+
+    python benchmarks/generate_data.py OUTPUT [--size-mb MB | --technologies N] [--regions R]
+        [--first-year Y] [--last-year Y] [--zero-rate P] [--duplicate-rate P]
+        [--out-of-range-rate P] [--abrupt-rate P] [--seed S]
+
+Technologies and commodities are named the way the rules in rules/ expect:
+MIN* resource technologies, PWR* power plants, LND* land uses and DEM*
+demand technologies, each family reading and producing the commodities its
+rules allow. Values follow smooth per-row trends; each injected problem
+replaces a cell at its rate (a fraction of the cells of the params it
+applies to): zeros everywhere, duplicate values in the demand params,
+out-of-range values in the costs, and abrupt steps in every trend.
+"""
+import argparse
+import io
+import os
+
+import numpy as np
+
+CROPS = ['MAI', 'RIC', 'WHE', 'SOY', 'CAS', 'SUG', 'COT', 'VEG']
+FUELS = ['COA', 'BIO', 'SOL', 'WND', 'HYD', 'OHC', 'PVR']
+DEMANDS = ['AGRSURWAT', 'AGRGWTWAT', 'PUBSURWAT', 'PUBGWTWAT', 'PWRSURWAT', 'PWRGWTWAT']
+BASE_COMMODITIES = ['ELC001', 'ELC002', 'LND', 'LFOR', 'LBLT', 'LWAT', 'LOTH', 'WTRPRC', 'WTREVT', 'WTRGWT',
+                    'WTRSUR', 'AGRWAT', 'PUBWAT', 'PWRWAT', 'AGRDSL', 'COA', 'BIO', 'SOL', 'WND', 'HYD', 'OIL', 'PVR']
+
+# (param, low, high) of the values of the per-technology params; out-of-range
+# values are drawn from 2 to 10 times high.
+TECHNOLOGY_PARAMS = [
+    ('CapitalCost', 100, 5000),
+    ('FixedCost', 1, 120),
+    ('VariableCost', 0, 80),
+    ('CapacityFactors', 0.1, 0.95),
+    ('ResidualCapacity', 0, 20),
+    ('TotalTechnologyAnnualActivityLowerLimit', 0, 10),
+    ('TotalTechnologyAnnualActivityUpperLimit', 10, 100),
+]
+DEMAND_PARAMS = [
+    ('AccumulatedAnnualDemand', 1, 100),
+    ('SpecifiedAnnualDemand', 1, 100),
+]
+
+
+def technologies_and_commodities(count):
+    """``count`` technology names, each with the (inputs, outputs) commodities its family uses."""
+    families = [
+        *(('MIN' + fuel, [], [fuel]) for fuel in ('COA', 'BIO', 'OIL', 'HYD', 'SOL', 'WND')),
+        ('MINLND', [], ['LND']),
+        ('MINPRC', [], ['WTRPRC']),
+        ('LNDFOR', ['LND', 'WTRPRC'], ['LFOR', 'WTREVT', 'WTRGWT', 'WTRSUR']),
+        ('LNDBLT', ['LND', 'WTRPRC'], ['LBLT', 'WTREVT', 'WTRGWT', 'WTRSUR']),
+        ('LNDWAT', ['LND', 'WTRPRC'], ['LWAT', 'WTREVT', 'WTRGWT', 'WTRSUR']),
+        ('LNDOTH', ['LND', 'WTRPRC'], ['LOTH', 'WTREVT', 'WTRGWT', 'WTRSUR']),
+        *((f'LND{crop}HR', ['LND', 'WTRPRC', 'AGRDSL'], ['WTREVT', 'CRP' + crop]) for crop in CROPS),
+        *((f'LND{crop}HI', ['LND', 'WTRPRC', 'AGRWAT', 'AGRDSL'], ['WTREVT', 'CRP' + crop]) for crop in CROPS),
+        *((f'IMP{crop}', [], ['CRP' + crop]) for crop in CROPS),
+        *((f'DEM{demand}', ['ELC002', 'WTR' + demand[3:6]], [demand[:3] + 'WAT']) for demand in DEMANDS),
+        ('DEMTRABIO', ['CRPMAI'], ['BIO']),
+    ]
+    plants = [
+        (f'PWR{fuel}', [fuel if fuel != 'OHC' else 'OIL'] + (['PWRWAT'] if fuel in ('COA', 'OHC') else []),
+         ['ELC002' if fuel == 'PVR' else 'ELC001'])
+        for fuel in FUELS
+    ]
+    technologies = [(name, inputs, outputs) for name, inputs, outputs in families[:count]]
+    # Power plants, numbered like PWRCOA001, make up the rest
+    number = 0
+    while len(technologies) < count:
+        name, inputs, outputs = plants[number % len(plants)]
+        technologies.append((f'{name}{number // len(plants) + 1:03d}', inputs, outputs))
+        number += 1
+    commodities = list(BASE_COMMODITIES)
+    for _, inputs, outputs in technologies:
+        commodities.extend(commodity for commodity in inputs + outputs if commodity not in commodities)
+    return technologies, commodities
+
+
+class Generator:
+    """Writes the param rows of a data file with the given problem rates."""
+
+    def __init__(self, years, zero_rate=0.01, duplicate_rate=0.01, out_of_range_rate=0.005, abrupt_rate=0.01, seed=0):
+        self.years = years
+        self.zero_rate = zero_rate
+        self.duplicate_rate = duplicate_rate
+        self.out_of_range_rate = out_of_range_rate
+        self.abrupt_rate = abrupt_rate
+        self.rng = np.random.default_rng(seed)
+        self.row_format = ' '.join(['%.6g'] * len(years))
+
+    def values(self, rows, low, high, duplicates=False, out_of_range=False):
+        """A (rows, years) array of trends between ``low`` and ``high`` with the problems injected."""
+        rng = self.rng
+        shape = (rows, len(self.years))
+        start = rng.uniform(low, high, size=(rows, 1))
+        # Year-on-year drift within 1%, far from the 5% the abrupt change check looks for
+        trend = np.cumprod(rng.uniform(0.99, 1.01, size=shape), axis=1)
+        steps = np.where(rng.random(shape) < self.abrupt_rate, rng.choice([0.5, 1.5], size=shape), 1.0)
+        steps[:, 0] = 1.0
+        values = np.round(start * trend * np.cumprod(steps, axis=1), 4)
+        if duplicates:
+            repeat = rng.random(shape) < self.duplicate_rate
+            repeat[:, 0] = False
+            rows_at, columns_at = np.nonzero(repeat)
+            values[rows_at, columns_at] = values[rows_at, columns_at - 1]
+        if out_of_range:
+            outside = rng.random(shape) < self.out_of_range_rate
+            values[outside] = high * rng.uniform(2, 10, size=int(outside.sum()))
+        values[rng.random(shape) < self.zero_rate] = 0
+        return values
+
+    def write_rows(self, file, labels, values):
+        row_format = self.row_format
+        file.write(''.join(f"{label} {row_format % tuple(row)}\n" for label, row in zip(labels, values.tolist())))
+
+
+def write_data_file(file, technologies=100, regions=2, years=range(2015, 2051), seed=0, **rates):
+    """Write a data file with ``technologies`` technologies in each of ``regions`` regions to ``file``."""
+    years = list(years)
+    regions = [f'RE{number}' for number in range(1, regions + 1)]
+    technologies, commodities = technologies_and_commodities(technologies)
+    names = [name for name, _, _ in technologies]
+    generator = Generator(years, seed=seed, **rates)
+    header = ' '.join(map(str, years)) + ' :='
+
+    file.write("# Synthetic CLEWs data file\n")
+    file.write("set EMISSION := CO2 ;\n")
+    file.write(f"set REGION := {' '.join(regions)} ;\n")
+    file.write("set MODE_OF_OPERATION := 1 2 ;\n")
+    file.write("set TIMESLICE := S1 S2 ;\n")
+    file.write(f"set YEAR := {' '.join(map(str, years))} ;\n")
+    file.write("set STORAGE := ;\n")
+    file.write(f"set COMMODITY := {' '.join(commodities)} ;\n")
+    file.write("set SEASON := 1 ;\n")
+    file.write(f"set TECHNOLOGY := {' '.join(names)} ;\n\n")
+
+    demands = [commodity for commodity in commodities if commodity.endswith('WAT') or commodity.startswith('ELC')]
+    for param, low, high in DEMAND_PARAMS:
+        file.write(f"param {param} default 0 :=\n")
+        for region in regions:
+            file.write(f"[{region},*,*]:\n{header}\n")
+            generator.write_rows(file, demands, generator.values(len(demands), low, high, duplicates=True))
+        file.write(";\n")
+    for param, low, high in TECHNOLOGY_PARAMS:
+        file.write(f"param {param} default 0 :=\n")
+        for region in regions:
+            file.write(f"[{region},*,*]:\n{header}\n")
+            generator.write_rows(file, names, generator.values(len(names), low, high, out_of_range=True))
+        file.write(";\n")
+    file.write("param OperationalLife default 1 :=\n")
+    for region in regions:
+        file.write(f"[{region},*]:\n" + ''.join(f"{name} {30 if name.startswith('PWR') else 1}\n" for name in names))
+    file.write(";\n")
+    file.write("param DiscountRate default 0.05 := ;\n")
+    for param, side in (('InputActivityRatio', 1), ('OutputActivityRatio', 2)):
+        file.write(f"param {param} default 0 :=\n")
+        for region in regions:
+            for technology in technologies:
+                for commodity in technology[side]:
+                    file.write(f"[{region},{technology[0]},{commodity},*,*]:\n{header}\n")
+                    generator.write_rows(file, ['1', '2'], generator.values(2, 0.5, 3))
+        file.write(";\n")
+    file.write("param EmissionActivityRatio default 0 :=\n")
+    for region in regions:
+        for name in names:
+            if name.startswith(('PWRCOA', 'PWROHC')):
+                file.write(f"[{region},{name},CO2,*,*]:\n{header}\n")
+                generator.write_rows(file, ['1', '2'], generator.values(2, 0.05, 0.3))
+    file.write(";\nend;\n")
+
+
+def technologies_for_size(size_mb, regions=2, years=range(2015, 2051)):
+    """About how many technologies make a data file of ``size_mb`` MB."""
+    sample = io.StringIO()
+    write_data_file(sample, technologies=200, regions=regions, years=years)
+    per_technology = len(sample.getvalue()) / 200
+    return max(int(size_mb * 1024 * 1024 / per_technology), 1)
+
+
+def generate(path, size_mb=None, technologies=100, regions=2, years=range(2015, 2051), seed=0, **rates):
+    """Write a data file to ``path``, of about ``size_mb`` MB when given; return its size in bytes."""
+    if size_mb is not None:
+        technologies = technologies_for_size(size_mb, regions, years)
+    with open(path, 'w', buffering=1024 * 1024) as file:
+        write_data_file(file, technologies, regions, years, seed, **rates)
+    return os.path.getsize(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output')
+    parser.add_argument('--size-mb', type=float, help="about how large to make the file (overrides --technologies)")
+    parser.add_argument('--technologies', type=int, default=100)
+    parser.add_argument('--regions', type=int, default=2)
+    parser.add_argument('--first-year', type=int, default=2015)
+    parser.add_argument('--last-year', type=int, default=2050)
+    parser.add_argument('--zero-rate', type=float, default=0.01)
+    parser.add_argument('--duplicate-rate', type=float, default=0.01)
+    parser.add_argument('--out-of-range-rate', type=float, default=0.005)
+    parser.add_argument('--abrupt-rate', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    size = generate(
+        args.output, args.size_mb, args.technologies, args.regions, range(args.first_year, args.last_year + 1),
+        args.seed, zero_rate=args.zero_rate, duplicate_rate=args.duplicate_rate,
+        out_of_range_rate=args.out_of_range_rate, abrupt_rate=args.abrupt_rate,
+    )
+    print(f"{args.output}: {size / (1024 * 1024):.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+"""Run the check_all checks on many data files from the command line, without the web app.
+
+    python clews_batch.py FILE_OR_GLOB... [--output DIR] [--workers N]
+        [--reader text|mmap] [--section-store PATH | --no-dedup]
+        [--max-findings N] [--time-budget SECONDS] [--fail-fast]
+        [--fail-on info|warning|error|never]
+
+Files are checked in parallel, one file per worker process. Each one is
+parsed once and put through every check_all check. Its findings are written
+to DIR/<file name>.json as finding records (see clews_findings), with a
+count per check. DIR/summary.json lists every file's counts, or the error
+that stopped it being checked, and adds them all up.
+
+Scenario ensembles repeat most of their param sections from file to file,
+so each distinct section is checked only once (see clews_dedup): findings
+are stored per section in an SQLite file the workers share, a temporary one
+unless --section-store names one to keep for later runs. The first file is
+checked on its own before the others start, so the sections it shares with
+them are in the store by then. With the mmap reader, each worker also
+parses a file against the one it parsed before, so unchanged sections are
+not parsed again either.
+
+--max-findings, --time-budget and --fail-fast set a CheckBudget (see
+clews_budget) for each file: at most N findings per check, no further checks
+once the file has taken SECONDS, and none after the first one to find an
+error (the checks that can find errors go first). A file's entry names the
+checks cut short under 'truncated'.
+
+The exit status is 0 when no file has a finding of the --fail-on severity or
+worse (any finding, by default), 1 when one does and 2 when a file could not
+be checked at all. Only the checks and the parser are imported, not Flask.
+"""
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+from clews_budget import CheckBudget, budgeted, errors_first
+from clews_checks import check_all_checks, check_config, check_line_fields, default_target_params, model_records
+from clews_dedup import SectionChecker, SQLiteSectionStore
+from clews_findings import dumps
+from clews_parser import READERS, as_parsed_model, parse_gams_data_file_mmap
+from clews_runner import iter_checks
+
+SEVERITIES = ('info', 'warning', 'error')
+
+# What a worker process keeps between files: a SectionChecker per section
+# store and the model it parsed last, to parse the next file against.
+_checkers = {}
+_last_parsed = {}
+
+
+def expand(patterns):
+    """The files named by ``patterns``, globs expanded, each once; and the globs that matched nothing."""
+    paths, unmatched = [], []
+    for pattern in patterns:
+        if any(char in pattern for char in '*?['):
+            matches = sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+            if not matches:
+                unmatched.append(pattern)
+        else:
+            matches = [pattern]
+        paths.extend(path for path in matches if path not in paths)
+    return paths, unmatched
+
+
+def report_paths(paths, output_dir):
+    """A report path in ``output_dir`` for each data file, numbered where two files share a name."""
+    taken = Counter()
+    reports = []
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0] or 'data'
+        taken[stem] += 1
+        name = stem if taken[stem] == 1 else f"{stem}-{taken[stem]}"
+        reports.append(os.path.join(output_dir, name + '.json'))
+    return reports
+
+
+def section_checker(store_path, target_params):
+    """This process's SectionChecker for the store at ``store_path``."""
+    key = (store_path, tuple(target_params))
+    checker = _checkers.get(key)
+    if checker is None:
+        checker = _checkers[key] = SectionChecker(
+            SQLiteSectionStore(store_path), check_all_checks(target_params), check_config(target_params),
+            line_fields=check_line_fields, model_checks={'essential_items'})
+    return checker
+
+
+def parse(path, reader):
+    if reader != 'mmap':
+        return as_parsed_model(path, reader=reader)
+    model = parse_gams_data_file_mmap(path, baseline=_last_parsed.get('model'))
+    _last_parsed['model'] = model
+    return model
+
+
+def check_file(path, report_path, target_params=default_target_params, reader=None, store_path=None, limits=None):
+    """Check one data file and write its report; return its summary entry.
+
+    With a ``store_path``, sections checked before, by this or any other
+    process using the store, are not checked again. ``limits`` are the
+    CheckBudget arguments for the file, if any.
+    """
+    started = time.perf_counter()
+    checks = check_all_checks(target_params)
+    checker = section_checker(store_path, target_params) if store_path else None
+    budget = CheckBudget(*limits) if limits else None
+    try:
+        model = parse(path, reader)
+        fail_fast = budget is not None and budget.fail_fast
+        if checker is None:
+            order = errors_first(checks) if fail_fast else checks
+            results = iter_checks(model, order, executor='serial')
+        else:
+            checked, reused = checker.checked, checker.reused
+            results = checker.check(model).items()
+            results = iter(errors_first(results) if fail_fast else results)
+        if budget is not None:
+            results = budgeted(results, budget, [name for name, _ in checks])
+        findings = list(model_records(model, results, target_params))
+    except Exception as error:  # one unreadable file must not stop the batch
+        return {'file': path, 'error': f"{type(error).__name__}: {error}"}
+    counts = dict.fromkeys((name for name, _ in checks), 0)
+    counts.update(Counter(record['check'] for record in findings))
+    severities = dict.fromkeys(SEVERITIES, 0)
+    severities.update(Counter(record['severity'] for record in findings))
+    entry = {
+        'file': path,
+        'report': report_path,
+        'lines': model.line_count,
+        'seconds': round(time.perf_counter() - started, 3),
+        'findings': len(findings),
+        'counts': counts,
+        'severities': severities,
+    }
+    if checker is not None:
+        entry['sections'] = {'checked': checker.checked - checked, 'reused': checker.reused - reused}
+    if budget is not None and budget.truncated:
+        entry['truncated'] = budget.truncated
+    with open(report_path, 'wb') as file:
+        file.write(dumps({**entry, 'findings': findings}))
+    return entry
+
+
+def summarize(entries):
+    """Totals over the summary entries of every file."""
+    checked = [entry for entry in entries if 'error' not in entry]
+    counts, severities, sections = Counter(), Counter(), Counter()
+    for entry in checked:
+        counts.update(entry['counts'])
+        severities.update(entry['severities'])
+        sections.update(entry.get('sections', {}))
+    totals = {
+        'files': len(entries),
+        'checked': len(checked),
+        'failed': len(entries) - len(checked),
+        'findings': sum(entry['findings'] for entry in checked),
+        'truncated': sum(1 for entry in checked if entry.get('truncated')),
+        'counts': dict(counts),
+        'severities': {severity: severities[severity] for severity in SEVERITIES},
+    }
+    if sections:
+        totals['sections'] = dict(sections)
+    return totals
+
+
+def run(paths, output_dir, workers=None, reader='mmap', target_params=default_target_params, store_path=None, limits=None,
+        on_done=None):
+    """Check every file on a process pool; return their summary entries in the order of ``paths``.
+
+    ``store_path`` names the SQLite file that section findings are shared
+    through (None: check every file from scratch). ``limits`` are as for
+    check_file. ``on_done(entry)`` is called as each file is finished.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = list(zip(paths, report_paths(paths, output_dir)))
+    entries = {}
+
+    def done(path, entry):
+        entries[path] = entry
+        if on_done is not None:
+            on_done(entry)
+
+    workers = min(workers or os.cpu_count() or 1, len(jobs)) or 1
+    if workers == 1:
+        for path, report_path in jobs:
+            done(path, check_file(path, report_path, target_params, reader, store_path, limits))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            if store_path:
+                # Fill the store from the first file before the others look in it
+                path, report_path = jobs.pop(0)
+                done(path, pool.submit(check_file, path, report_path, target_params, reader, store_path, limits).result())
+            futures = {pool.submit(check_file, path, report_path, target_params, reader, store_path, limits): path
+                       for path, report_path in jobs}
+            for future in as_completed(futures):
+                done(futures[future], future.result())
+    return [entries[path] for path in paths]
+
+
+def exit_status(entries, fail_on='info'):
+    if any('error' in entry for entry in entries):
+        return 2
+    if fail_on == 'never':
+        return 0
+    failing = SEVERITIES[SEVERITIES.index(fail_on):]
+    return 1 if any(entry['severities'][severity] for entry in entries for severity in failing) else 0
+
+
+def print_entry(entry):
+    if 'error' in entry:
+        print(f"ERROR  {entry['file']}: {entry['error']}", file=sys.stderr)
+        return
+    severities = ', '.join(f"{count} {severity}" for severity, count in entry['severities'].items() if count)
+    truncated = f"; cut short: {', '.join(entry['truncated'])}" if entry.get('truncated') else ''
+    print(f"{'FOUND' if entry['findings'] else 'OK':6} {entry['file']}: {entry['findings']} findings"
+          f"{f' ({severities})' if severities else ''} in {entry['seconds']:.2f} s{truncated}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='+', help="data files or glob patterns (quote them to keep the shell out)")
+    parser.add_argument('--output', default='clews-reports', help="directory for the reports (default: clews-reports)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument('--reader', choices=sorted(READERS), default='mmap', help="data file reader (default: mmap)")
+    parser.add_argument('--section-store', help="SQLite file to keep section findings in between runs (default: a temporary one)")
+    parser.add_argument('--no-dedup', action='store_true', help="check every section of every file")
+    parser.add_argument('--max-findings', type=int, help="report at most N findings per check of each file")
+    parser.add_argument('--time-budget', type=float, help="stop checking a file after this many seconds")
+    parser.add_argument('--fail-fast', action='store_true', help="stop checking a file once a check finds an error")
+    parser.add_argument('--fail-on', choices=SEVERITIES + ('never',), default='info',
+                        help="least severe finding that makes the exit status 1 (default: info, i.e. any)")
+    args = parser.parse_args(argv)
+
+    paths, unmatched = expand(args.files)
+    for pattern in unmatched:
+        print(f"ERROR  no files match {pattern}", file=sys.stderr)
+    limits = None
+    if args.max_findings is not None or args.time_budget is not None or args.fail_fast:
+        limits = (args.max_findings, args.time_budget, args.fail_fast)
+    run_files = partial(run, paths, args.output, args.workers, args.reader, limits=limits, on_done=print_entry)
+    if args.no_dedup:
+        entries = run_files()
+    elif args.section_store:
+        entries = run_files(store_path=args.section_store)
+    else:
+        with tempfile.TemporaryDirectory(prefix='clews-sections-') as directory:
+            entries = run_files(store_path=os.path.join(directory, 'sections.db'))
+    entries.extend({'file': pattern, 'error': 'no files match'} for pattern in unmatched)
+
+    summary = {'totals': summarize(entries), 'files': entries}
+    summary_path = os.path.join(args.output, 'summary.json')
+    with open(summary_path, 'wb') as file:
+        file.write(dumps(summary))
+    totals = summary['totals']
+    reuse = f", {totals['sections']['reused']} of {sum(totals['sections'].values())} sections reused" if 'sections' in totals else ''
+    print(f"{totals['checked']} of {totals['files']} files checked, {totals['findings']} findings{reuse}; summary in {summary_path}")
+    return exit_status(entries, args.fail_on)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""Limits on a check_all run: findings per check, a time budget, and stopping at the first error.
+
+A half-finished data file can give tens of thousands of findings when the
+first few already say what to fix. A ``CheckBudget`` caps the findings each
+check reports, gives the whole run a deadline (counted from when the budget
+is made, so the upload and the parse count too) and, with ``fail_fast``,
+stops after the first check to report a finding of error severity.
+
+``budgeted`` passes (name, result) pairs through a budget, each result cut
+down to the findings its check may still report, and stops pulling results
+once the time is up or an error has stopped the run. Closing the source
+cancels the checks that have not started, and a section-at-a-time check
+reads no further into the file. ``CheckBudget.truncated`` then says which
+checks were cut short, and why, for the report.
+"""
+import time
+from collections import Counter
+
+from clews_checks import check_severity, count_findings, first_findings, report_block
+from clews_findings import finding
+
+# Why a check's findings are incomplete
+MAX_FINDINGS = 'max_findings'
+TIME_BUDGET = 'time_budget'
+FAIL_FAST = 'fail_fast'
+
+# Never cut down: the essential items are a short list, and an empty part
+# of it would read as "all present" in the report
+UNCAPPED = {'essential_items'}
+
+
+def errors_first(checks):
+    """``checks``, (name, ...) pairs, with the ones whose findings are errors first, as fail_fast runs them."""
+    return sorted(checks, key=lambda check: check_severity[check[0]] != 'error')
+
+
+class CheckBudget:
+    """How much a check_all run may report and for how long; None and False mean no limit."""
+
+    def __init__(self, max_findings=None, seconds=None, fail_fast=False):
+        self.max_findings = max_findings
+        self.deadline = time.monotonic() + seconds if seconds is not None else None
+        self.fail_fast = fail_fast
+        self.failed = False
+        self.found = Counter()
+        # {check name: MAX_FINDINGS, TIME_BUDGET or FAIL_FAST} for each check cut short
+        self.truncated = {}
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def stopped(self):
+        """True once the run should stop: the time is up, or fail_fast met an error."""
+        return self.failed or self.expired()
+
+    def stop_reason(self):
+        return FAIL_FAST if self.failed else TIME_BUDGET
+
+    def wants(self, name):
+        """Whether check ``name`` should run (again): the run goes on and it has findings left to report."""
+        return not self.stopped() and (self.max_findings is None or name in UNCAPPED or self.found[name] < self.max_findings)
+
+    def take(self, name, result):
+        """``result`` of check ``name`` cut down to the findings it may still report."""
+        count = allowed = count_findings(name, result)
+        if self.max_findings is not None and name not in UNCAPPED and allowed > self.max_findings - self.found[name]:
+            allowed = self.max_findings - self.found[name]
+            self.truncated.setdefault(name, MAX_FINDINGS)
+        if self.fail_fast and allowed and check_severity.get(name) == 'error':
+            self.failed = True
+        self.found[name] += allowed
+        return result if allowed == count else first_findings(name, result, allowed)
+
+    def turn_away(self, names):
+        """Note checks ``names``, which ``wants`` turned away from part of the data, as cut short."""
+        for name in names:
+            self.truncated.setdefault(name, self.stop_reason() if self.stopped() else MAX_FINDINGS)
+
+    def cut_short(self, names):
+        """Note checks ``names`` as cut short by whatever stopped the run."""
+        for name in names:
+            self.truncated.setdefault(name, self.stop_reason())
+
+    def report(self):
+        """The text report's closing note on the checks cut short ('' when none were)."""
+        if not self.truncated:
+            return ""
+        reasons = {
+            MAX_FINDINGS: f"only the first {self.max_findings} of its findings are listed",
+            TIME_BUDGET: "not run, or not finished, before the time budget ran out",
+            FAIL_FAST: "not run, or cut short, after the first error was found",
+        }
+        return "".join(report_block("This report is incomplete. Checks cut short:\n", (
+            f"- {name}: {reasons[reason]}" for name, reason in self.truncated.items()
+        )))
+
+    def records(self):
+        """Yield a record for each check cut short, to follow its finding records."""
+        for name, reason in self.truncated.items():
+            yield finding(name, 'info', detail=f"truncated: {reason}")
+
+
+def budgeted(results, budget, names):
+    """Yield the (name, result) pairs of ``results`` through ``budget``, stopping once it is spent.
+
+    ``names`` are the checks the run was to have; those it never got to are
+    noted in ``budget.truncated``.
+    """
+    done = set()
+    pairs = iter(results)
+    while not budget.stopped():
+        try:
+            name, result = next(pairs)
+        except StopIteration:
+            break
+        done.add(name)
+        yield name, budget.take(name, result)
+    else:
+        close = getattr(pairs, 'close', None)
+        if close is not None:
+            close()
+    budget.cut_short(name for name in names if name not in done)
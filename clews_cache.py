@@ -0,0 +1,242 @@
+"""Caches of parsed CLEWs models, keyed by the SHA-256 of the data file.
+
+Modellers tend to upload the same file to several routes in a row, so the
+Flask app keeps recently parsed models in a ``ParsedModelCache`` and only
+parses a file whose content it has not seen recently. Behind it, a
+``DiskModelCache`` keeps the parsed arrays in a directory so that restarts,
+other worker processes and repeated CLI runs can skip the parse too.
+"""
+import glob
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from collections import Counter, OrderedDict
+
+from clews_parser import PARSER_VERSION, load_model, parse_gams_data_file, save_model
+
+
+class ParsedModelCache:
+    """Thread-safe LRU cache of ParsedModel objects with entry-count and memory limits.
+
+    ``on_evict`` is called with each model dropped from the cache, which lets
+    the owner clean up the file the model was parsed from. A model taken
+    with ``pin=True`` stays in use until ``unpin``; if it is dropped in the
+    meantime, ``on_evict`` waits until its last user is done with it.
+    """
+
+    def __init__(self, max_entries=8, max_bytes=512 * 1024 * 1024, on_evict=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # Users of each pinned model, and the pinned models dropped since, by id
+        self._pins = Counter()
+        self._dropped = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, digest):
+        return digest in self._entries
+
+    def get(self, digest, pin=False):
+        """Return the cached model for ``digest`` or None, counting a hit or a miss."""
+        with self._lock:
+            model = self._entries.get(digest)
+            if model is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            if pin:
+                self._pins[id(model)] += 1
+            return model
+
+    def put(self, digest, model, pin=False):
+        """Cache ``model``; return False when it is not kept.
+
+        A model is not kept when it is too large to keep at all, or when
+        another one for ``digest`` was cached first; the caller then cleans
+        up after it.
+        """
+        size = model.nbytes
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return False
+        with self._lock:
+            if digest in self._entries:
+                return False
+            self._entries[digest] = model
+            self._bytes += size
+            if pin:
+                self._pins[id(model)] += 1
+            evicted = []
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, old = self._entries.popitem(last=False)
+                self._bytes -= old.nbytes
+                self.evictions += 1
+                evicted.append(old)
+            evicted = self._unused(evicted)
+        self._evict(evicted)
+        return True
+
+    def unpin(self, model):
+        """Mark one user of a model taken with ``pin=True`` as done with it."""
+        with self._lock:
+            self._pins[id(model)] -= 1
+            if self._pins[id(model)] > 0:
+                return
+            del self._pins[id(model)]
+            evicted = [self._dropped.pop(id(model))] if id(model) in self._dropped else []
+        self._evict(evicted)
+
+    def clear(self):
+        with self._lock:
+            evicted = self._unused(self._entries.values())
+            self._entries.clear()
+            self._bytes = 0
+        self._evict(evicted)
+
+    def _unused(self, models):
+        """Those of the dropped ``models`` not pinned; the others are kept until unpinned. Call with the lock held."""
+        unused = []
+        for model in models:
+            if self._pins[id(model)]:
+                self._dropped[id(model)] = model
+            else:
+                unused.append(model)
+        return unused
+
+    def _evict(self, models):
+        if self.on_evict is not None:
+            for model in models:
+                self.on_evict(model)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+            }
+
+
+class DiskModelCache:
+    """Parsed models saved as ``<sha256>-v<PARSER_VERSION>.npz`` files in ``directory``.
+
+    Files are written to a temporary name and renamed into place, so worker
+    processes sharing the directory never read a half-written model. Once the
+    directory grows past ``max_bytes`` the least recently used files are
+    removed; a file another process removes first is simply skipped.
+    """
+
+    # Temporary files older than this are left over from a crashed writer
+    STALE_TEMP_SECONDS = 3600
+
+    def __init__(self, directory, max_bytes=2 * 1024 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.directory, f"{digest}-v{PARSER_VERSION}.npz")
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def load(self, digest, file_path):
+        """Return the saved model for ``digest``, attached to ``file_path``, or None."""
+        path = self.path(digest)
+        try:
+            model = load_model(path, file_path)
+        except FileNotFoundError:
+            self._count('misses')
+            return None
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            # Unreadable or from another parser version: drop it and parse again
+            self._remove(path)
+            self._count('misses')
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            pass
+        self._count('hits')
+        return model
+
+    def store(self, digest, model):
+        fd, temp_path = tempfile.mkstemp(prefix='.tmp-', suffix='.npz', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                save_model(model, file)
+            os.replace(temp_path, self.path(digest))
+        except BaseException:
+            self._remove(temp_path)
+            raise
+        self.evict()
+
+    def load_or_parse(self, digest, file_path, parse=parse_gams_data_file):
+        model = self.load(digest, file_path)
+        if model is None:
+            model = parse(file_path)
+            self.store(digest, model)
+        return model
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _entries(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, '*.npz')):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if os.path.basename(path).startswith('.tmp-'):
+                if time.time() - stat.st_mtime > self.STALE_TEMP_SECONDS:
+                    self._remove(path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if self._remove(path):
+                self._count('evictions')
+            total -= size
+
+    def stats(self):
+        entries = self._entries()
+        with self._lock:
+            return {
+                'directory': self.directory,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries),
+                'max_bytes': self.max_bytes,
+            }
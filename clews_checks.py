@@ -0,0 +1,662 @@
+"""The data-file checks, their report text and their finding records, without the web app.
+
+Each check of the original troubleshooter keeps its reader, check and
+process_* functions here, grouped by part as in the app. Every
+read_gams_data_file* function accepts a file path or a parsed model.
+``check_all_checks`` lists the checks /check_all runs as (name,
+function(model)) pairs; ``iter_check_all_report`` and ``check_records``
+turn a check's result into report text or finding records.
+
+Nothing here imports Flask, so the batch command line (clews_batch) and
+the benchmarks start quickly and run where the app's dependencies are not
+installed.
+"""
+import hashlib
+import os
+import re
+from collections import defaultdict
+from functools import partial
+from itertools import islice
+
+import numpy as np
+
+from clews_findings import RowLocator, finding
+from clews_parser import PARSER_VERSION, as_parsed_model, is_year
+from clews_rules import RangeRules, TechnologyRules
+from clews_spelling import NameIndex
+
+# The params check_all looks for zeros in, as the routes define them
+default_target_params = ["InputActivityRatio", "OutputActivityRatio"]
+
+# The JSON rule tables of the range and technology-commodity checks
+rules_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules')
+
+# Every read_gams_data_file* function accepts either a file path or a
+# ParsedModel from parse_gams_data_file, so check_all can parse once and
+# hand the same model to all of them. Given a path, each one names the params
+# it reads, so the mmap reader (CLEWS_READER=mmap) only builds those.
+
+#Part 1
+
+skip_params = ['ResidualCapacity', 'TechnologyActivityByModeLowerLimit', 'TechnologyActivityByModeUpperLimit','TechnologyActivityIncreaseByModeLimit', 'TechnologyActivityDecreaseByModeLimit', 'InputActivityRatio', 'OutputActivityRatio']
+
+def read_gams_data_file(file_path):
+    model = as_parsed_model(file_path)
+    data = [
+        section for section in model.sections
+        if section.kind == 'param' and not any(section.name.startswith(p) for p in skip_params)
+    ]
+    return data, model.starting_year
+
+def line_float_values(section):
+    """Row values as float() sees the whole line: a numeric row label (a mode, say) is the first column."""
+    labelled = ~np.isnan(section.labels)
+    return np.column_stack([section.labels, section.values]), labelled
+
+def first_zero_position(float_values, labelled, rows):
+    # Position of the first zero in the line's float values, counting a
+    # numeric label as position 0 like list.index(0) did on the old rows.
+    positions = np.argmax(float_values[rows] == 0, axis=1)
+    return np.where(labelled[rows], positions, positions - 1)
+
+def flag_zero_after_non_zero(data):
+    flagged_lines = []
+    for section in data:
+        if not section.line_numbers.size:
+            continue
+        float_values, labelled = line_float_values(section)
+        previous = float_values[:, :-1]
+        hits = (float_values[:, 1:] == 0) & (previous != 0) & ~np.isnan(previous)
+        rows = np.flatnonzero(hits.any(axis=1))
+        for row, position in zip(rows, first_zero_position(float_values, labelled, rows)):
+            flagged_lines.append((int(section.line_numbers[row]), section.name, section.row_index(row)[-1], int(position)))
+    return flagged_lines
+
+def process_zero_after_non_zero(filename):
+    data, starting_year = read_gams_data_file(filename)
+    flagged_lines = flag_zero_after_non_zero(data)
+
+    results = []
+
+    for line_number, param_name, technology, position in sorted(flagged_lines):
+        results.append((line_number, param_name, technology, starting_year + position))
+
+    return results
+
+
+#Part 2
+
+def read_gams_data_file2(file_path, params=None):
+    model = as_parsed_model(file_path, params)
+    data = [section for section in model.sections if section.kind == 'param']
+    return data, model.starting_year
+
+def slice_fields(index):
+    """Split a [region,technology,commodity,...] row index into (technology, mode, commodity)."""
+    padded = tuple(index) + (None, None, None)
+    return padded[1], padded[0], padded[2]
+
+def flag_zeros_in_params(data, target_params):
+    flagged_lines = []
+    for section in data:
+        if section.name not in target_params or not section.line_numbers.size:
+            continue
+        float_values, labelled = line_float_values(section)
+        rows = np.flatnonzero((float_values == 0).any(axis=1))
+        for row, position in zip(rows, first_zero_position(float_values, labelled, rows)):
+            technology, mode, commodity = slice_fields(section.row_index(row))
+            flagged_lines.append((int(section.line_numbers[row]), section.name, technology, mode, commodity, int(position)))
+    return flagged_lines
+
+def process_zeros_in_params(filename, target_params):
+    data, starting_year = read_gams_data_file2(filename, target_params)
+    flagged_zeros = flag_zeros_in_params(data, target_params)
+
+    input_activity_ratios = []
+    output_activity_ratios = []
+
+    for line_number, param_name, technology, mode, commodity, position in sorted(flagged_zeros):
+        if param_name in target_params:
+            if param_name == 'InputActivityRatio':
+                input_activity_ratios.append((line_number, technology, mode, starting_year + position))
+            elif param_name == 'OutputActivityRatio':
+                output_activity_ratios.append((line_number, technology, mode, starting_year + position))
+
+    return input_activity_ratios, output_activity_ratios
+
+
+#Part 3
+
+def read_gams_data_file_part3(file_path, data_ranges):
+    model = as_parsed_model(file_path, data_ranges)
+    data_sections = {}
+    line_number_mapping = {}
+    for section in model.sections:
+        if section.kind == 'param' and section.name.strip(";") in data_ranges:
+            data_sections[section.name.strip(";")] = section
+            line_number_mapping[section.name.strip(";")] = section.line_numbers
+    return data_sections, line_number_mapping
+
+# The sensible range of each param's values, from a JSON rule table (see
+# clews_rules.RangeRules); set CLEWS_RANGE_RULES to use another table.
+data_ranges = RangeRules.from_file(
+    os.environ.get('CLEWS_RANGE_RULES', os.path.join(rules_dir, 'data_ranges.json')))
+
+def check_data_ranges(data_sections, data_ranges, line_number_mapping):
+    """Every value outside its range, as (param, line, 'too small' or 'too big', value, year) in file order."""
+    out_of_range = []
+    for param_name, section in data_sections.items():
+        if param_name not in data_ranges:
+            continue
+        lower, upper = data_ranges.bounds(param_name, section, section.model.sets)
+        values = section.values
+        too_small = values < lower
+        rows, columns = np.nonzero(too_small | (values > upper))
+        years = section.years
+        for row, column, value, small in zip(rows.tolist(), columns.tolist(), values[rows, columns].tolist(), too_small[rows, columns].tolist()):
+            year = int(years[column]) if column < len(years) else None
+            out_of_range.append((param_name, int(line_number_mapping[param_name][row]), "too small" if small else "too big", value, year))
+
+    return out_of_range
+
+def year_note(year):
+    return f", year {year}" if year is not None else ""
+
+def process_data_ranges(file_path):
+    data_sections, line_number_mapping = read_gams_data_file_part3(file_path, data_ranges)
+    out_of_range = check_data_ranges(data_sections, data_ranges, line_number_mapping)
+
+    results = []
+    for param_name, line_number, size, value, year in out_of_range:
+        results.append((line_number, param_name, size, value))
+
+    return results
+
+
+#part 4
+
+def read_gams_data_file_part4(file_path, data_ranges):
+    data_sections, line_number_mapping = read_gams_data_file_part3(file_path, data_ranges)
+    years = None
+    for section in data_sections.values():
+        # The first year header line with at least six fields sets the years
+        years = [year for year in section.years[5:] if is_year(str(year))]
+        if years:
+            break
+    return data_sections, line_number_mapping, years
+
+def check_abrupt_changes(data_sections, threshold, target_params, years, line_number_mapping):
+    flagged_lines = []
+    for param_name, section in data_sections.items():
+        if param_name not in target_params:
+            continue
+        if section.values.shape[1] < 7:
+            continue
+        # Pairs of neighbouring values from the seventh field of the line on
+        previous = section.values[:, 5:-1]
+        values = section.values[:, 6:]
+        valid = ~np.isnan(previous) & ~np.isnan(values)
+        changes_to_or_from_zero = valid & ((previous == 0) != (values == 0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = values / previous
+        abrupt = valid & (previous != 0) & (values != 0) & ((ratio < (1 - threshold)) | (ratio > (1 + threshold)))
+        # Each line is reported up to and including its first abrupt change
+        first_abrupt = np.where(abrupt.any(axis=1), np.argmax(abrupt, axis=1), abrupt.shape[1])
+        flagged = (changes_to_or_from_zero | abrupt) & (np.arange(abrupt.shape[1]) <= first_abrupt[:, None])
+        for row, column in zip(*np.nonzero(flagged)):
+            year = years[column + 1] if column + 1 < len(years) else None
+            flagged_lines.append((param_name, int(line_number_mapping[param_name][row]), section.row_index(row), year))
+    return flagged_lines
+
+abrupt_change_params = {
+    'CapitalCost',
+    'FixedCost',
+    'VariableCost',
+    'CapacityFactors',
+    'DiscountRate',
+    'EmissionActivityRatio',
+    'YearSplit',
+    'SpecifiedAnnualDemand',
+    'SpecifiedDemandProfile',
+    'InputActivityRatio',
+    'OutputActivityRatio',
+    'AccumulatedAnnualDemand',
+    'TotalTechnologyAnnualActivityLowerLimit',
+    'TotalTechnologyAnnualActivityUpperLimit',
+}
+
+def process_abrupt_changes(file_path, threshold=0.05):
+    target_params = abrupt_change_params
+    data_sections, line_number_mapping, years = read_gams_data_file_part4(file_path, target_params)
+    flagged_lines = check_abrupt_changes(data_sections, threshold, target_params, years, line_number_mapping)
+
+    flagged_lines_list = []
+    if flagged_lines:
+        for name, line_number, index, year in flagged_lines:
+            flagged_lines_list.append((line_number, name, index[-1], year))
+
+    return flagged_lines_list
+
+# Part 5
+
+# The params checked for repeated values; any param with values in rows can be added
+consistency_params = ['AccumulatedAnnualDemand', 'SpecifiedAnnualDemand']
+
+# Two values are the same when they differ by no more than this fraction of the larger one
+consistency_tolerance = 1e-9
+
+def read_gams_data_file5(file_path, params=None):
+    """The sections of every param, or only those of ``params`` when given, as {name: [sections]}."""
+    model = as_parsed_model(file_path, params)
+    data_sections = defaultdict(list)
+    for section in model.sections:
+        if section.kind == 'param' and (params is None or section.name.strip(";") in params):
+            data_sections[section.name.strip(";")].append(section)
+    return data_sections
+
+def same_values(first, second, tolerance):
+    # Blanks (NaN) are never the same as anything
+    return np.abs(first - second) <= tolerance * np.maximum(np.abs(first), np.abs(second))
+
+def repeated_value_runs(values, tolerance=consistency_tolerance):
+    """Runs of one value in the rows of ``values``, as arrays of (row, first column, length).
+
+    A run is a stretch of neighbouring cells holding the same value. It is
+    reported when it is longer than one cell, or when its value is already
+    in an earlier cell of the row. Zeros and blanks are never repeats.
+    """
+    rows, columns = values.shape
+    if not values.size:
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty, empty
+    valid = ~np.isnan(values) & (values != 0)
+    follows_same = np.zeros(values.shape, dtype=bool)
+    follows_same[:, 1:] = valid[:, :-1] & same_values(values[:, 1:], values[:, :-1], tolerance)
+
+    # Sorting each row puts equal values next to each other: a group of them
+    # is first seen at its lowest column, and every other cell of it is a repeat.
+    order = np.argsort(np.where(valid, values, np.inf), axis=1, kind='stable')
+    ordered = np.take_along_axis(values, order, axis=1)
+    starts_group = np.ones(values.shape, dtype=bool)
+    starts_group[:, 1:] = ~same_values(ordered[:, 1:], ordered[:, :-1], tolerance)
+    starts_group = starts_group.ravel()
+    group = np.cumsum(starts_group) - 1
+    first_seen = np.minimum.reduceat(order.ravel(), np.flatnonzero(starts_group))
+    seen_before = np.zeros(values.size, dtype=bool)
+    seen_before[(order + np.arange(rows)[:, None] * columns).ravel()] = order.ravel() > first_seen[group]
+
+    starts_run = (valid & ~follows_same).ravel()
+    run_starts = np.flatnonzero(starts_run)
+    lengths = np.bincount((np.cumsum(starts_run) - 1)[valid.ravel()], minlength=run_starts.size)
+    reported = (lengths > 1) | seen_before[run_starts]
+    run_starts = run_starts[reported]
+    return run_starts // columns, run_starts % columns, lengths[reported]
+
+def check_data_consistency(data_sections, target_params=consistency_params, tolerance=consistency_tolerance):
+    """Repeated values in the rows of ``target_params``: {param: [(row label, line, value, year, run length)]}."""
+    duplicate_entries = defaultdict(list)
+    for param, sections in data_sections.items():
+        if param not in target_params:
+            continue
+        for section in sections:
+            rows, columns, lengths = repeated_value_runs(section.values, tolerance)
+            values = section.values[rows, columns].tolist()
+            for row, column, value, length in zip(rows.tolist(), columns.tolist(), values, lengths.tolist()):
+                year = section.years[column] if column < len(section.years) else None
+                duplicate_entries[param].append((section.row_index(row)[-1], int(section.line_numbers[row]), value, year, length))
+    return duplicate_entries
+
+def duplicate_description(label, value, year, run):
+    text = f"{label}, in year {year}, Value: '{value:.15g}'"
+    return text if run == 1 else f"{text}, the same for {run} years"
+
+def process_data_consistency(file_path):
+    data_sections = read_gams_data_file5(file_path, consistency_params)
+    duplicates = check_data_consistency(data_sections)
+
+    results = []
+    for param, duplicate_values in duplicates.items():
+        for label, line_number, value, year, run in duplicate_values:
+            results.append((line_number, param, label, year))
+
+    return results
+
+
+# Part 6
+
+necessary_commodities = {
+    'BIO', 'ELC001', 'ELC002', 'LFOR', 'LBLT', 'LWAT', 'LOTH', 'WTRPRC', 'AGRWAT', 'WTREVT',
+    'WTRGWT', 'WTRSUR', 'PUBWAT', 'PWRWAT', 'AGRDSL', 'TRABIO', 'PVR'
+}
+
+necessary_technologies = {
+    'MINLND', 'LNDFOR', 'LNDBLT', 'LNDWAT', 'LNDOTH', 'MINPRC', 'DEMAGRSURWAT', 'DEMAGRGWTWAT',
+    'DEMPUBSURWAT', 'DEMPUBGWTWAT', 'DEMPWRSURWAT', 'DEMPWRGWTWAT',
+    'DEMAGRDSL', 'DEMTRABIO'
+}
+
+def check_essential_items(file_path):
+    model = as_parsed_model(file_path, params=())
+    commodities = set(model.set_members('COMMODITY'))
+    technologies = set(model.set_members('TECHNOLOGY'))
+
+    missing_commodities = necessary_commodities - commodities
+    missing_technologies = necessary_technologies - technologies
+
+    return missing_commodities, missing_technologies
+
+def suggest_essential_items(file_path, missing_commodities, missing_technologies, limit=3):
+    """The closest names in the COMMODITY and TECHNOLOGY sets to each missing item, as {item: [names]}."""
+    model = as_parsed_model(file_path, params=())
+    suggestions = {}
+    for set_name, missing in (('COMMODITY', missing_commodities), ('TECHNOLOGY', missing_technologies)):
+        if not missing:
+            continue
+        index = NameIndex(model.set_members(set_name))
+        for item in sorted(missing):
+            suggestions[item] = index.suggest(item, limit)
+    return suggestions
+
+def essential_items_in_model(model):
+    missing_commodities, missing_technologies = check_essential_items(model)
+    return missing_commodities, missing_technologies, suggest_essential_items(model, missing_commodities, missing_technologies)
+
+def did_you_mean(item, suggestions):
+    names = suggestions.get(item)
+    return f"{item} (did you mean {', '.join(names)}?)" if names else item
+
+
+
+#part 7
+
+# The technology-commodity rules live in rules/*.json; point
+# CLEWS_INPUT_RULES or CLEWS_OUTPUT_RULES at another table to replace them.
+tech_commodity_rules = TechnologyRules.from_file(
+    os.environ.get('CLEWS_INPUT_RULES', os.path.join(rules_dir, 'input_activity_ratio.json')))
+
+def activity_ratio_slice_headers(model, param_name):
+    """Yield (line_number, header) for the slice headers of a param up to its closing ';'."""
+    for section in model.sections:
+        if section.kind != 'param' or not section.header.startswith("param " + param_name):
+            continue
+        for line_number, header in section.slice_headers:
+            if section.closing_line is not None and line_number > section.closing_line:
+                break
+            yield line_number, header
+
+def check_technology_commodity_match(filename):
+    pattern = re.compile(r"\[(\w+),(\w+),(\w+),[^,\]]+,\*")
+    flagged_lines = []
+
+    model = as_parsed_model(filename, ["InputActivityRatio"])
+    for line_number, header in activity_ratio_slice_headers(model, "InputActivityRatio"):
+        match = pattern.match(header)
+        if match:
+            region, technology, commodity = match.groups()
+
+            allowed = tech_commodity_rules.allows(technology, commodity)
+            if allowed is None:
+                flagged_lines.append((line_number, technology, "UNEXPECTED"))
+            elif not allowed:
+                flagged_lines.append((line_number, technology, commodity))
+
+    return flagged_lines
+
+
+
+        #Part 8
+
+#Part 8
+
+tech_commodity_rules_output = TechnologyRules.from_file(
+    os.environ.get('CLEWS_OUTPUT_RULES', os.path.join(rules_dir, 'output_activity_ratio.json')))
+
+def check_technology_commodity_match_output(filename):
+    pattern = re.compile(r"\[(\w+),(\w+),(\w+),[^,\]]+,\*")
+    flagged_lines = []
+
+    model = as_parsed_model(filename, ["OutputActivityRatio"])
+    for line_number, header in activity_ratio_slice_headers(model, "OutputActivityRatio"):
+        match = pattern.match(header)
+        if match:
+            region, technology, commodity = match.groups()
+
+            if not tech_commodity_rules_output.allows(technology, commodity):
+                flagged_lines.append((line_number, technology, commodity))
+
+    return flagged_lines
+
+def duplicates_in_model(model):
+    return check_data_consistency(read_gams_data_file5(model, consistency_params))
+
+def out_of_range_in_model(model):
+    data_sections, line_number_mapping = read_gams_data_file_part3(model, data_ranges)
+    return check_data_ranges(data_sections, data_ranges, line_number_mapping)
+
+def check_all_checks(target_params):
+    """The check_all checks as (name, function(model)) pairs, in report order."""
+    return [
+        ('zero_after_non_zero', process_zero_after_non_zero),
+        ('zeros_in_params', partial(process_zeros_in_params, target_params=target_params)),
+        ('abrupt_changes', process_abrupt_changes),
+        ('duplicates', duplicates_in_model),
+        ('out_of_range', out_of_range_in_model),
+        ('essential_items', essential_items_in_model),
+        ('input_match', check_technology_commodity_match),
+        ('output_match', check_technology_commodity_match_output),
+    ]
+
+check_all_intro = "Line number refers to line in data file (open file in Notepad, use 'Ctrl G' to search line no. for extra clarity on issue)\n\n"
+
+# Report lines are joined and sent this many at a time when streaming
+report_chunk_lines = 1000
+
+def report_block(heading, lines):
+    """Yield ``heading`` + "\n".join(lines) + "\n\n" a chunk of lines at a time."""
+    yield heading
+    lines = iter(lines)
+    separator = ""
+    while True:
+        chunk = list(islice(lines, report_chunk_lines))
+        if not chunk:
+            break
+        yield separator + "\n".join(chunk)
+        separator = "\n"
+    yield "\n\n"
+
+def iter_check_all_report(name, result):
+    """Yield the check_all report text for one check's result in chunks (nothing when there is nothing to say)."""
+    if name == 'zero_after_non_zero':
+        if result:
+            yield from report_block("Hey! We found a zero after a non-zero value at:\n", (
+                f"- At line {line_number}: See {param_name}, {technology}, year {year}"
+                for line_number, param_name, technology, year in result
+            ))
+
+    elif name == 'zeros_in_params':
+        if result[0] or result[1]:
+            yield from report_block("Oi Muppet! We found a zero in the InputActivityRatio:\n", (
+                f"- At line {line_number}. See {param_name}, {technology}, year {year}"
+                for line_number, param_name, technology, year in result[0]
+            ))
+            yield from report_block("Oi Muppet! We found a zero in the OutputActivityRatio:\n", (
+                f"- At line {line_number}. See {param_name}, {technology}, year {year}"
+                for line_number, param_name, technology, year in result[1]
+            ))
+
+    elif name == 'abrupt_changes':
+        if result:
+            yield from report_block("Hmmm...We found an abrupt 5%+ change between values at\n", (
+                f"- At line {line_number}. See {param_name}, {technology}, year {year}"
+                for line_number, param_name, technology, year in result
+            ))
+
+    elif name == 'duplicates':
+        if any(result.values()):
+            yield from report_block("Uh-oh! We found duplicate values:\n", (
+                f"- At line {line_number}. {duplicate_description(label, value, year, run)}"
+                for param_name, duplicate_list in result.items()
+                for label, line_number, value, year, run in duplicate_list
+            ))
+
+    elif name == 'out_of_range':
+        if result:
+            yield from report_block("Whoa! We found a value that might be out of sensible range in:\n", (
+                f"- '{param_name}' is possibly {error_type} ({value}) at line {line_number}{year_note(year)}."
+                for param_name, line_number, error_type, value, year in result
+            ))
+
+    elif name == 'essential_items':
+        missing_commodities_set, missing_technologies_set, suggestions = result
+
+        if missing_commodities_set:
+            yield from report_block("Missing Commodities:\n", (did_you_mean(item, suggestions) for item in missing_commodities_set))
+        else:
+            yield "All necessary commodities are present.\n\n"
+
+        if missing_technologies_set:
+            yield from report_block("Missing Technologies:\n", (did_you_mean(item, suggestions) for item in missing_technologies_set))
+        else:
+            yield "All necessary technologies are present.\n\n"
+
+    # The technology-commodity matches have their own routes and are not reported here
+
+def check_all_report(name, result):
+    """The check_all report text for one check's result ('' when there is nothing to say)."""
+    return "".join(iter_check_all_report(name, result))
+
+# How much attention each check's findings need, for the structured reports
+check_severity = {
+    'zero_after_non_zero': 'warning',
+    'zeros_in_params': 'warning',
+    'abrupt_changes': 'info',
+    'duplicates': 'info',
+    'out_of_range': 'warning',
+    'essential_items': 'error',
+    'input_match': 'error',
+    'output_match': 'error',
+}
+
+def check_records(name, result, target_params=()):
+    """Yield a finding record (see clews_findings) for each finding of a check_all check."""
+    severity = check_severity[name]
+    if name in ('zero_after_non_zero', 'abrupt_changes'):
+        # The last index component, reported as the technology by the text report
+        for line_number, param_name, technology, year in result:
+            yield finding(name, severity, line=line_number, param=param_name, year=year, detail=technology)
+    elif name == 'zeros_in_params':
+        for param_name, findings in zip(target_params, result):
+            for line_number, technology, mode, year in findings:
+                yield finding(name, severity, line=line_number, param=param_name, technology=technology,
+                              mode=mode, year=year, value=0.0)
+    elif name == 'duplicates':
+        for param_name, duplicate_list in result.items():
+            for label, line_number, value, year, run in duplicate_list:
+                yield finding(name, severity, line=line_number, param=param_name, year=year, value=value,
+                              detail='duplicate' if run == 1 else f"the same for {run} years")
+    elif name == 'out_of_range':
+        for param_name, line_number, error_type, value, year in result:
+            yield finding(name, severity, line=line_number, param=param_name, year=year, value=value, detail=error_type)
+    elif name == 'essential_items':
+        missing_commodities_set, missing_technologies_set, suggestions = result
+        for field, missing in (('commodity', missing_commodities_set), ('technology', missing_technologies_set)):
+            for item in missing:
+                yield finding(name, severity, detail=did_you_mean(item, suggestions), **{field: item})
+    elif name in ('input_match', 'output_match'):
+        param_name = 'InputActivityRatio' if name == 'input_match' else 'OutputActivityRatio'
+        for line_number, technology, commodity in result:
+            yield finding(name, severity, line=line_number, param=param_name, technology=technology,
+                          commodity=None if commodity == "UNEXPECTED" else commodity, detail='unexpected commodity')
+
+def model_records(model, results, target_params=()):
+    """Yield the finding records of [(check name, result)], with the index fields of their rows filled in."""
+    locator = RowLocator(model)
+    for name, result in results:
+        yield from locator.annotate(check_records(name, result, target_params))
+
+# Where each check keeps the line number in its findings, when that is not first
+check_line_fields = {'duplicates': 1, 'out_of_range': 1}
+
+# The params each check reads, for the rows-scanned metric; zero_after_non_zero
+# reads every param but skip_params and essential_items only the sets.
+def check_rows(model, name, target_params=()):
+    """How many param rows of ``model`` check ``name`` scans (every row, for the 'parse' stage)."""
+    params = {
+        'zeros_in_params': target_params,
+        'abrupt_changes': abrupt_change_params,
+        'duplicates': consistency_params,
+        'out_of_range': data_ranges,
+        'input_match': ['InputActivityRatio'],
+        'output_match': ['OutputActivityRatio'],
+    }.get(name, ())
+    if name == 'parse':
+        reads = lambda param_name: True
+    elif name == 'zero_after_non_zero':
+        reads = lambda param_name: not any(param_name.startswith(p) for p in skip_params)
+    else:
+        reads = lambda param_name: param_name.strip(';') in params
+    return sum(len(section.line_numbers) for section in model.sections if section.kind == 'param' and reads(section.name))
+
+def check_all_text(results, target_params):
+    """The check_all report of ``results``, leaving out the checks it has no result for."""
+    response = check_all_intro
+    for name, _ in check_all_checks(target_params):
+        if name in results:
+            response += check_all_report(name, results[name])
+    return response
+
+def _findings(name, result):
+    # The essential items' suggestions are not findings of their own
+    return result[:2] if name == 'essential_items' else result
+
+def count_findings(name, result):
+    """How many findings a check_all check's result holds."""
+    result = _findings(name, result)
+    if isinstance(result, tuple):
+        return sum(count_findings(None, part) for part in result)
+    if isinstance(result, dict):
+        return sum(len(findings) for findings in result.values())
+    return len(result)
+
+def _first(result, limit):
+    """(the first ``limit`` findings of ``result``, in its shape; how many of the limit are left)."""
+    if isinstance(result, tuple):
+        parts = []
+        for part in result:
+            part, limit = _first(part, limit)
+            parts.append(part)
+        return tuple(parts), limit
+    if isinstance(result, dict):
+        kept = {}
+        for key, findings in result.items():
+            findings, limit = _first(findings, limit)
+            if findings:
+                kept[key] = findings
+        return kept, limit
+    if isinstance(result, (set, frozenset)):
+        kept = type(result)(islice(result, limit))
+    else:
+        kept = result[:limit]
+    return kept, limit - len(kept)
+
+def first_findings(name, result, limit):
+    """A check_all check's result cut down to its first ``limit`` findings, in report order."""
+    first, _ = _first(_findings(name, result), limit)
+    return first + result[2:] if name == 'essential_items' else first
+
+def check_config(target_params=default_target_params):
+    """A digest of everything but the data file that check_all findings depend on, to key stored findings by."""
+    config = (
+        PARSER_VERSION,
+        list(target_params),
+        skip_params,
+        data_ranges.key(),
+        sorted(abrupt_change_params),
+        consistency_params,
+        consistency_tolerance,
+        sorted(necessary_commodities),
+        sorted(necessary_technologies),
+        [(rule.technology, rule.commodities) for rule in tech_commodity_rules.rules],
+        [(rule.technology, rule.commodities) for rule in tech_commodity_rules_output.rules],
+    )
+    return hashlib.blake2b(repr(config).encode(), digest_size=16).hexdigest()
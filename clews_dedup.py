@@ -0,0 +1,192 @@
+"""Check each distinct param section once across many data files.
+
+Scenario ensembles are many data files that differ in a few param sections.
+The parser hashes every section's text (Section.digest), and the checks of a
+section only read the rest of the model through its sets, years and year
+header (clews_incremental.shared_context). So findings are stored per
+section, keyed by the section digest, that context and the check
+configuration, with line numbers relative to the start of the section.
+
+``SectionChecker.check`` runs the checks only on the sections of a model
+that are not in the store yet, all together on one subset of the model,
+stores each section's share of the findings, and builds the model's results
+from the stored findings with the lines shifted to where each section sits
+in this file. Checks that only look at the sets (``model_checks``) are
+stored once per context.
+
+Findings are kept in memory (``MemorySectionStore``) or in an SQLite file
+(``SQLiteSectionStore``) that worker processes, and later runs, share.
+"""
+import hashlib
+import pickle
+import sqlite3
+import threading
+
+import numpy as np
+
+from clews_incremental import shared_context
+from clews_runner import merge_by_line, run_checks
+
+
+class MemorySectionStore:
+    """Stored findings in a dict, for one process."""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        with self._lock:
+            return {key: self._values[key] for key in keys if key in self._values}
+
+    def put_many(self, values):
+        with self._lock:
+            self._values.update(values)
+
+
+class SQLiteSectionStore:
+    """Stored findings pickled in an SQLite table, shared by every process using ``path``."""
+
+    # SQLite allows this many parameters in one statement on every build
+    BATCH = 500
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS sections (key TEXT PRIMARY KEY, value BLOB NOT NULL)')
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, keys):
+        keys = list(keys)
+        values = {}
+        connection = self._connection()
+        for start in range(0, len(keys), self.BATCH):
+            batch = keys[start:start + self.BATCH]
+            rows = connection.execute(
+                f"SELECT key, value FROM sections WHERE key IN ({', '.join('?' * len(batch))})", batch)
+            values.update((key, pickle.loads(value)) for key, value in rows)
+        return values
+
+    def put_many(self, values):
+        with self._connection() as connection:
+            connection.executemany('INSERT OR IGNORE INTO sections VALUES (?, ?)',
+                                   [(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)) for key, value in values.items()])
+
+
+def _split(result, owners, count, line_field):
+    """Split a check result into one result per section; ``owners(lines)`` gives each line's section."""
+    if isinstance(result, tuple):
+        parts = [_split(part, owners, count, line_field) for part in result]
+        return [tuple(part[section] for part in parts) for section in range(count)]
+    if isinstance(result, dict):
+        split = [{} for _ in range(count)]
+        for key, findings in result.items():
+            for section, part in enumerate(_split(findings, owners, count, line_field)):
+                if part:
+                    split[section][key] = part
+        return split
+    split = [[] for _ in range(count)]
+    lines = np.fromiter((finding[line_field] for finding in result), dtype=np.int64, count=len(result))
+    for finding, section in zip(result, owners(lines).tolist()):
+        split[section].append(finding)
+    return split
+
+
+def _shift(result, offset, line_field):
+    """A check result with ``offset`` added to the line number of every finding."""
+    if isinstance(result, tuple):
+        return tuple(_shift(part, offset, line_field) for part in result)
+    if isinstance(result, dict):
+        return {key: _shift(findings, offset, line_field) for key, findings in result.items()}
+    return [finding[:line_field] + (finding[line_field] + offset,) + finding[line_field + 1:] for finding in result]
+
+
+class SectionChecker:
+    """Runs ``checks`` on models, reusing the stored findings of every section seen before.
+
+    ``config`` identifies the check configuration (clews_checks.check_config),
+    so findings stored under another configuration are never reused.
+    ``line_fields`` and ``model_checks`` are as for run_checks_by_region.
+    ``checked`` and ``reused`` count the sections checked and reused so far.
+    """
+
+    def __init__(self, store, checks, config, line_fields=None, model_checks=(), executor='serial', max_workers=None):
+        self.store = store
+        self.checks = checks
+        self.config = config
+        self.line_fields = line_fields or {}
+        self.model_checks = set(model_checks)
+        self.executor = executor
+        self.max_workers = max_workers
+        self.checked = 0
+        self.reused = 0
+
+    def _context_key(self, context):
+        return hashlib.blake2b(repr((self.config, context)).encode(), digest_size=16).hexdigest()
+
+    def check(self, model):
+        """{name: result} of every check on ``model``, in check order."""
+        context = shared_context(model)
+        sections = [(position, section) for position, section in enumerate(model.sections) if section.kind == 'param']
+        if context is None or not sections or not all(section.digest for _, section in sections):
+            return run_checks(model, self.checks, self.executor, self.max_workers)
+
+        context_key = self._context_key(context)
+        keys = [f"{context_key}:{section.digest}" for _, section in sections]
+        model_key = f"{context_key}:model"
+        stored = self.store.get_many(set(keys) | {model_key})
+
+        missing = {}
+        for key, (position, section) in zip(keys, sections):
+            if key not in stored and key not in missing:
+                missing[key] = (position, section)
+        new = {}
+        if missing:
+            new.update(self._check_sections(model, missing))
+        if model_key not in stored:
+            new[model_key] = run_checks(model, [(name, function) for name, function in self.checks
+                                                if name in self.model_checks], 'serial')
+        if new:
+            self.store.put_many(new)
+            stored.update(new)
+        self.checked += len(missing)
+        self.reused += len(sections) - len(missing)
+
+        results = {}
+        for name, _ in self.checks:
+            if name in self.model_checks:
+                results[name] = stored[model_key][name]
+                continue
+            line_field = self.line_fields.get(name, 0)
+            parts = [_shift(stored[key][name], section.line_number, line_field)
+                     for key, (_, section) in zip(keys, sections)]
+            results[name] = merge_by_line(parts, line_field)
+        return results
+
+    def _check_sections(self, model, missing):
+        """Check the ``missing`` {key: (position, section)} together; return {key: {name: result}} per section."""
+        positions = [position for position, _ in missing.values()]
+        section_checks = [(name, function) for name, function in self.checks if name not in self.model_checks]
+        results = run_checks(model.subset(dict.fromkeys(positions, True)), section_checks, self.executor, self.max_workers)
+        starts = np.array([section.line_number for _, section in missing.values()], dtype=np.int64)
+        order = np.argsort(starts, kind='stable')
+        sorted_starts = starts[order]
+
+        def owners(lines):
+            return order[np.maximum(np.searchsorted(sorted_starts, lines, side='right') - 1, 0)]
+
+        per_section = [{} for _ in missing]
+        for name, result in results.items():
+            for index, part in enumerate(_split(result, owners, len(missing), self.line_fields.get(name, 0))):
+                per_section[index][name] = part
+        return {
+            key: {name: _shift(part, -section.line_number, self.line_fields.get(name, 0)) for name, part in found.items()}
+            for (key, (_, section)), found in zip(missing.items(), per_section)
+        }
@@ -0,0 +1,180 @@
+"""Structural diff of two versions of a CLEWs data file.
+
+``diff_models`` lines the params of two parsed models up by name and,
+within a param, lines rows up by their index tuple (region, technology,
+commodity, mode...) through hashed row keys, so rows that were reordered
+or moved to another slice are not reported as changes. Values are then
+compared a whole param at a time as arrays, year by year where both files
+give the param the same year header, column by column otherwise.
+"""
+import numpy as np
+
+from clews_incremental import match_rows
+from clews_parser import parse_gams_data_file_mmap
+
+
+def _columns(section):
+    """Label of each value column of a param section: its year, or its position without a year header."""
+    width = section.values.shape[1]
+    if len(section.years) == width:
+        return list(section.years)
+    return list(range(width))
+
+
+def _cell(value):
+    return None if np.isnan(value) else value
+
+
+class ParamDiff:
+    """Rows added, removed and changed in one param between two models.
+
+    Row numbers index the param's rows in the old (``removed``,
+    ``changed_old``) or new (``added``, ``changed_new``) section. For each
+    changed row, ``changed_cells`` marks the compared columns (``columns``)
+    whose value differs and ``deltas`` holds new minus old for every column.
+    """
+
+    def __init__(self, name, old, new):
+        self.name = name
+        self.old = old
+        self.new = new
+        old_columns = _columns(old) if old is not None else []
+        new_columns = _columns(new) if new is not None else []
+        self.columns = [column for column in old_columns if column in new_columns]
+        self.added_columns = [column for column in new_columns if column not in old_columns]
+        self.removed_columns = [column for column in old_columns if column not in new_columns]
+
+        if old is not None and new is not None:
+            old_rows, new_rows = match_rows(old, new)
+        else:
+            old_rows = new_rows = np.empty(0, dtype=np.intp)
+        self.added = self._unmatched(new, new_rows)
+        self.removed = self._unmatched(old, old_rows)
+
+        before = old.values[old_rows][:, [old_columns.index(column) for column in self.columns]] if old_rows.size else np.empty((0, len(self.columns)))
+        after = new.values[new_rows][:, [new_columns.index(column) for column in self.columns]] if new_rows.size else np.empty((0, len(self.columns)))
+        changed = (before != after) & ~(np.isnan(before) & np.isnan(after))
+        rows = changed.any(axis=1)
+        self.changed_old = old_rows[rows]
+        self.changed_new = new_rows[rows]
+        self.changed_cells = changed[rows]
+        self.before = before[rows]
+        self.after = after[rows]
+        self.deltas = self.after - self.before
+
+    @staticmethod
+    def _unmatched(section, matched):
+        if section is None:
+            return np.empty(0, dtype=np.intp)
+        unmatched = np.ones(len(section.line_numbers), dtype=bool)
+        unmatched[matched] = False
+        return np.flatnonzero(unmatched)
+
+    def __bool__(self):
+        return bool(self.added.size or self.removed.size or self.changed_old.size
+                    or self.added_columns or self.removed_columns)
+
+    def summary(self):
+        return {
+            'param': self.name,
+            'added_rows': int(self.added.size),
+            'removed_rows': int(self.removed.size),
+            'changed_rows': int(self.changed_old.size),
+            'changed_cells': int(self.changed_cells.sum()),
+            'added_years': self.added_columns,
+            'removed_years': self.removed_columns,
+        }
+
+    def _rows(self, section, rows, limit):
+        columns = _columns(section)
+        return [
+            {
+                'index': list(section.row_index(row)),
+                'line': int(section.line_numbers[row]),
+                'values': dict(zip(columns, map(_cell, section.values[row].tolist()))),
+            }
+            for row in rows[:limit].tolist()
+        ]
+
+    def changes(self, limit=None):
+        """The changed rows as dicts, each with its changed cells as {column: [old, new, delta]}."""
+        changes = []
+        for i in range(min(len(self.changed_old), limit if limit is not None else len(self.changed_old))):
+            cells = np.flatnonzero(self.changed_cells[i]).tolist()
+            before, after, deltas = self.before[i].tolist(), self.after[i].tolist(), self.deltas[i].tolist()
+            changes.append({
+                'index': list(self.new.row_index(self.changed_new[i])),
+                'old_line': int(self.old.line_numbers[self.changed_old[i]]),
+                'new_line': int(self.new.line_numbers[self.changed_new[i]]),
+                'cells': {self.columns[j]: [_cell(before[j]), _cell(after[j]), _cell(deltas[j])] for j in cells},
+            })
+        return changes
+
+    def to_dict(self, limit=None):
+        """The summary plus the added, removed and changed rows, up to ``limit`` of each."""
+        result = self.summary()
+        result['added'] = self._rows(self.new, self.added, limit) if self.new is not None else []
+        result['removed'] = self._rows(self.old, self.removed, limit) if self.old is not None else []
+        result['changed'] = self.changes(limit)
+        return result
+
+    def __repr__(self):
+        summary = self.summary()
+        return f"ParamDiff({self.name!r}, +{summary['added_rows']} -{summary['removed_rows']} ~{summary['changed_rows']} rows)"
+
+
+class ModelDiff:
+    """Everything that differs between two parsed models: set members and param rows."""
+
+    def __init__(self, old, new):
+        self.old = old
+        self.new = new
+        self.sets = {}
+        for name in list(old.sets) + [name for name in new.sets if name not in old.sets]:
+            before, after = old.sets.get(name, []), new.sets.get(name, [])
+            before_members, after_members = set(before), set(after)
+            added = [member for member in after if member not in before_members]
+            removed = [member for member in before if member not in after_members]
+            if added or removed:
+                self.sets[name] = {'added': added, 'removed': removed}
+
+        old_params = {name.strip(';'): section for name, section in old.params.items()}
+        new_params = {name.strip(';'): section for name, section in new.params.items()}
+        self.params = {}
+        for name in list(new_params) + [name for name in old_params if name not in new_params]:
+            before, after = old_params.get(name), new_params.get(name)
+            if before is not None and after is not None and before.digest and before.digest == after.digest:
+                continue
+            param_diff = ParamDiff(name, before, after)
+            if param_diff:
+                self.params[name] = param_diff
+        self.added_params = [name for name in new_params if name not in old_params]
+        self.removed_params = [name for name in old_params if name not in new_params]
+
+    def __bool__(self):
+        return bool(self.sets or self.params)
+
+    def summary(self):
+        return {
+            'sets': self.sets,
+            'added_params': self.added_params,
+            'removed_params': self.removed_params,
+            'params': [param_diff.summary() for param_diff in self.params.values()],
+        }
+
+    def to_dict(self, limit=None):
+        """The summary with each param's rows, up to ``limit`` added, removed and changed rows per param."""
+        result = self.summary()
+        result['params'] = [param_diff.to_dict(limit) for param_diff in self.params.values()]
+        return result
+
+
+def diff_models(old, new):
+    """Compare two ParsedModels; return a ModelDiff."""
+    return ModelDiff(old, new)
+
+
+def diff_files(old_path, new_path):
+    """Compare two data files, parsing the unchanged blocks of the second only once."""
+    old = parse_gams_data_file_mmap(old_path)
+    return ModelDiff(old, parse_gams_data_file_mmap(new_path, baseline=old))
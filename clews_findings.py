@@ -0,0 +1,105 @@
+"""One record shape for the findings of every check, and fast JSON/NDJSON encoding.
+
+Each check reports findings as tuples of its own shape. ``finding`` builds
+the record every route returns as JSON, with the same fields whatever the
+check, None where a field does not apply. ``RowLocator`` fills in the
+region, technology, commodity and mode of a finding from the index of the
+param row at its line, by looking the index components up in the model's
+sets.
+
+Records are encoded with orjson when it is installed, and with the json
+module otherwise. ``page`` and ``ndjson_chunks`` work on iterators, so a
+large result set is sliced and encoded as it is produced rather than
+built as one list or string.
+"""
+import json
+from itertools import islice
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FIELDS = ('check', 'param', 'line', 'region', 'technology', 'mode', 'commodity', 'year', 'value', 'severity', 'detail')
+
+# Index components are told apart by the set they belong to
+INDEX_FIELDS = (
+    ('region', 'REGION'),
+    ('technology', 'TECHNOLOGY'),
+    ('commodity', 'COMMODITY'),
+    ('mode', 'MODE_OF_OPERATION'),
+)
+
+# Records are encoded and sent this many at a time
+CHUNK_RECORDS = 1000
+
+
+def finding(check, severity, **fields):
+    """A finding record: every field in FIELDS, None unless given."""
+    record = dict.fromkeys(FIELDS)
+    record['check'] = check
+    record['severity'] = severity
+    record.update(fields)
+    return record
+
+
+def _default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(value):
+    """Encode ``value`` as JSON bytes; NumPy scalars and arrays are allowed."""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(value, default=_default).encode()
+
+
+def ndjson_chunks(records, chunk_records=CHUNK_RECORDS):
+    """Encode records as NDJSON, yielding the bytes of ``chunk_records`` lines at a time."""
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, chunk_records))
+        if not chunk:
+            break
+        yield b"".join(dumps(record) + b"\n" for record in chunk)
+
+
+def page(records, offset=0, limit=None):
+    """The records from ``offset`` on, at most ``limit`` of them, without building the skipped ones into a list."""
+    return islice(records, offset, None if limit is None else offset + limit)
+
+
+class RowLocator:
+    """Look up the index components of the param row at a given line of a model."""
+
+    def __init__(self, model):
+        self.model = model
+        self.members = [(field, frozenset(model.sets.get(set_name, ()))) for field, set_name in INDEX_FIELDS]
+
+    def fields(self, param, line):
+        """{field: component} for the row of ``param`` at ``line``, or {} when there is no such row."""
+        section = self.model.params.get(param)
+        if section is None or line is None or not section.line_numbers.size:
+            return {}
+        row = int(np.searchsorted(section.line_numbers, line))
+        if row == len(section.line_numbers) or section.line_numbers[row] != line:
+            return {}
+        fields = {}
+        for component in section.row_index(row):
+            for field, members in self.members:
+                if field not in fields and component in members:
+                    fields[field] = component
+                    break
+        return fields
+
+    def annotate(self, records):
+        """Yield ``records`` with the index fields of the row each one points at filled in."""
+        for record in records:
+            record.update(self.fields(record['param'], record['line']))
+            yield record
@@ -0,0 +1,199 @@
+"""Re-run checks on only the parts of a data file that changed since a baseline.
+
+``revalidate`` lines the param sections of a new model up with those of a
+baseline model (by name and order) and, within a section, lines rows up by
+their index tuple. Findings for a section that only moved in the file are
+reused with their line numbers shifted. Within a changed section, findings
+for rows whose index and values are unchanged are reused too, and the checks
+only run again on the changed rows and the section's slice headers.
+
+Checks that read across sections look at the sets and the year headers, so
+when either of those changes, or a set sits below a param, every check runs
+again on the whole model.
+"""
+from collections import Counter
+
+import numpy as np
+
+from clews_metrics import timed_call
+from clews_runner import map_lines, merge_by_line
+
+
+def _section_keys(model):
+    """(kind, name, occurrence) of each section, to line the sections of two models up."""
+    seen = Counter()
+    keys = []
+    for section in model.sections:
+        key = (section.kind, section.name)
+        keys.append(key + (seen[key],))
+        seen[key] += 1
+    return keys
+
+
+def _year_headers(model):
+    return list(dict.fromkeys(tuple(section.years) for section in model.params.values() if section.years))
+
+
+def _sets_below_params(model):
+    kinds = [section.kind for section in model.sections]
+    return 'param' in kinds and 'set' in kinds[kinds.index('param'):]
+
+
+def shared_context(model):
+    """What checks of one param section read from the rest of ``model``: sets, years and the year header.
+
+    Two param sections with the same content give the same findings in any
+    two models with equal shared contexts. None when that cannot be relied
+    on: a set sits below a param, or the params use more than one year header.
+    """
+    headers = _year_headers(model)
+    if _sets_below_params(model) or len(headers) > 1:
+        return None
+    return model.sets, model.starting_year, model.years, headers
+
+
+def _relative_layout(section):
+    start = section.line_number
+    closing = section.closing_line - start if section.closing_line is not None else None
+    return (
+        section.header,
+        section.end_line - start,
+        closing,
+        [(line_number - start, header) for line_number, header in section.slice_headers],
+    )
+
+
+def same_section(old, new):
+    """Whether two param sections hold the same rows in the same layout, wherever they sit in the file."""
+    return (
+        _relative_layout(old) == _relative_layout(new)
+        and np.array_equal(old.line_numbers - old.line_number, new.line_numbers - new.line_number)
+        and old.values.shape == new.values.shape
+        and np.array_equal(old.values, new.values, equal_nan=True)
+        and np.array_equal(old.labels, new.labels, equal_nan=True)
+        and old.index == new.index
+    )
+
+
+def _same_raw_rows(old, new):
+    rows = lambda section: [(row.line_number - section.line_number, row.tokens) for row in section.rows]
+    return rows(old) == rows(new)
+
+
+_ROW_KEY = np.dtype([('hash', np.int64), ('occurrence', np.int64)])
+
+
+def row_keys(section):
+    """A key per row: the hash of its index tuple and how many earlier rows share that tuple."""
+    index = section.index
+    hashes = np.fromiter(map(hash, index), dtype=np.int64, count=len(index))
+    order = np.argsort(hashes, kind='stable')
+    ordered = hashes[order]
+    starts = np.r_[True, ordered[1:] != ordered[:-1]] if ordered.size else np.empty(0, dtype=bool)
+    positions = np.arange(ordered.size)
+    occurrence = np.empty(ordered.size, dtype=np.int64)
+    occurrence[order] = positions - np.maximum.accumulate(np.where(starts, positions, 0))
+    keys = np.empty(ordered.size, dtype=_ROW_KEY)
+    keys['hash'] = hashes
+    keys['occurrence'] = occurrence
+    return keys
+
+
+def match_rows(old, new):
+    """Align the rows of two param sections by index tuple; return (old rows, new rows) as arrays.
+
+    Repeated index tuples are paired up in file order.
+    """
+    _, new_rows, old_rows = np.intersect1d(row_keys(new), row_keys(old), assume_unique=True, return_indices=True)
+    order = np.argsort(new_rows)
+    old_rows, new_rows = old_rows[order], new_rows[order]
+    # Drop the pairs only a hash collision put together
+    same = [old.index[i] == new.index[j] for i, j in zip(old_rows.tolist(), new_rows.tolist())]
+    return old_rows[same], new_rows[same]
+
+
+def _same_values(first, second):
+    return (first == second) | (np.isnan(first) & np.isnan(second))
+
+
+def unchanged_rows(old, new):
+    """(old rows, new rows) of the rows whose index tuple, label and values are the same in both sections."""
+    old_rows, new_rows = match_rows(old, new)
+    if old.values.shape[1] != new.values.shape[1] or not old_rows.size:
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty
+    same = _same_values(old.values[old_rows], new.values[new_rows]).all(axis=1)
+    same &= _same_values(old.labels[old_rows], new.labels[new_rows])
+    return old_rows[same], new_rows[same]
+
+
+def plan(baseline, model, raw_params=()):
+    """Work out what to reuse from ``baseline``: (line map, rows to re-check) or None to check everything.
+
+    The line map is an array giving each baseline line's number in ``model``,
+    or -1 where its findings have to be worked out again. The rows to re-check
+    are in the form ParsedModel.subset takes. Sections
+    named in ``raw_params`` are read by a check as raw text, so any change
+    in them re-checks the whole section.
+    """
+    context = shared_context(baseline)
+    if context is None or context != shared_context(model):
+        return None
+
+    old_sections = dict(zip(_section_keys(baseline), baseline.sections))
+    line_map = np.full(max((section.end_line for section in baseline.sections), default=0) + 1, -1, dtype=np.int64)
+    keep = {}
+    for position, (key, section) in enumerate(zip(_section_keys(model), model.sections)):
+        if section.kind != 'param':
+            continue
+        old = old_sections.get(key)
+        if old is None:
+            keep[position] = True
+            continue
+        name = section.name.strip(';')
+        identical = old.digest is not None and old.digest == section.digest
+        if identical or (same_section(old, section) and (name not in raw_params or _same_raw_rows(old, section))):
+            line_map[old.line_number:old.end_line + 1] = np.arange(section.line_number, section.line_number + old.end_line - old.line_number + 1)
+            continue
+        if name in raw_params:
+            keep[position] = True
+            continue
+        old_rows, new_rows = unchanged_rows(old, section)
+        line_map[old.line_numbers[old_rows]] = section.line_numbers[new_rows]
+        changed = np.ones(len(section.line_numbers), dtype=bool)
+        changed[new_rows] = False
+        keep[position] = changed
+    return line_map, keep
+
+
+def revalidate(baseline, baseline_results, model, checks, line_fields=None, model_checks=(), raw_params=(), on_timing=None):
+    """Run ``checks`` on ``model``, reusing ``baseline_results`` wherever it matches ``baseline``.
+
+    ``baseline_results`` are {name: result} from the same checks on the
+    baseline. ``line_fields`` gives the position of the line number in each
+    check's findings (default 0). Checks named in ``model_checks`` only read
+    the sets, so their baseline result is reused whenever the sets match.
+    ``on_timing(name, timing)`` is given the Timing of each check that runs.
+    """
+    def run(name, function, checked):
+        if on_timing is None:
+            return function(checked)
+        result, timing = timed_call(function, checked)
+        on_timing(name, timing)
+        return result
+
+    line_fields = line_fields or {}
+    reuse = plan(baseline, model, raw_params)
+    if reuse is None:
+        return {name: run(name, function, model) for name, function in checks}
+    line_map, keep = reuse
+    changed = model.subset(keep)
+    results = {}
+    for name, function in checks:
+        if name in model_checks:
+            results[name] = baseline_results[name]
+            continue
+        line_field = line_fields.get(name, 0)
+        reused = map_lines(baseline_results[name], line_map, line_field)
+        results[name] = merge_by_line([reused, run(name, function, changed)], line_field)
+    return results
@@ -0,0 +1,185 @@
+"""Background jobs for checks too slow to run inside a request.
+
+``JobQueue`` runs submitted jobs on a fixed set of worker threads. At most
+``max_pending`` jobs may wait for a worker; ``submit`` raises ``QueueFull``
+beyond that, so a burst of large uploads is turned away instead of piling
+up behind each other. A job is a function taking a ``progress(name, state)``
+callback and returning the job's result.
+
+Each job's record (status, per-step progress, result or error) lives in a
+store: ``MemoryJobStore`` within one process, or ``SQLiteJobStore`` in a
+database file, so every process of the app, and the app after a restart,
+can answer for jobs another process ran. Finished jobs are forgotten after
+``ttl`` seconds.
+"""
+import json
+import queue
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when ``max_pending`` jobs are already waiting."""
+
+
+def new_job(kind, steps=()):
+    return {
+        'id': uuid.uuid4().hex,
+        'kind': kind,
+        'status': QUEUED,
+        'progress': {step: 'pending' for step in steps},
+        'created': time.time(),
+        'started': None,
+        'finished': None,
+        'result': None,
+        'error': None,
+    }
+
+
+class MemoryJobStore:
+    """Job records in a dict, for a single-process app."""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job):
+        with self._lock:
+            self._jobs[job['id']] = job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return json.loads(json.dumps(job)) if job is not None else None
+
+    def update(self, job_id, progress=None, **fields):
+        """Set top-level ``fields`` of a job and merge ``progress`` into its progress."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields)
+            if progress:
+                job['progress'].update(progress)
+
+    def prune(self, finished_before):
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items()
+                           if job['finished'] is not None and job['finished'] < finished_before]:
+                del self._jobs[job_id]
+
+
+class SQLiteJobStore:
+    """Job records as JSON in an SQLite table, shared by every process using ``path``."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, finished REAL, record TEXT NOT NULL)')
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            self._local.connection = connection
+        return connection
+
+    def create(self, job):
+        with self._connection() as connection:
+            connection.execute('INSERT INTO jobs VALUES (?, ?, ?)', (job['id'], job['finished'], json.dumps(job)))
+
+    def get(self, job_id):
+        row = self._connection().execute('SELECT record FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def update(self, job_id, progress=None, **fields):
+        """Set top-level ``fields`` of a job and merge ``progress`` into its progress."""
+        connection = self._connection()
+        with connection:
+            # Take the write lock before reading, so concurrent updates of one job do not lose each other
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute('SELECT record FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None:
+                return
+            job = json.loads(row[0])
+            job.update(fields)
+            if progress:
+                job['progress'].update(progress)
+            connection.execute('UPDATE jobs SET finished = ?, record = ? WHERE id = ?',
+                               (job['finished'], json.dumps(job), job_id))
+
+    def prune(self, finished_before):
+        with self._connection() as connection:
+            connection.execute('DELETE FROM jobs WHERE finished < ?', (finished_before,))
+
+
+class JobQueue:
+    """A bounded queue of jobs run by ``workers`` background threads, started with the first job."""
+
+    def __init__(self, store=None, workers=2, max_pending=8, ttl=3600):
+        self.store = store if store is not None else MemoryJobStore()
+        self.workers = workers
+        self.ttl = ttl
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f'clews-job-{len(self._threads)}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def full(self):
+        return self._queue.full()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def submit(self, kind, function, steps=(), on_reject=None):
+        """Queue ``function(progress)`` and return the new job's id.
+
+        ``steps`` names the steps it reports progress for. Raises QueueFull,
+        after calling ``on_reject`` (to clean up what the job would have
+        owned), when the queue is full.
+        """
+        self._start()
+        self.store.prune(time.time() - self.ttl)
+        job = new_job(kind, steps)
+        self.store.create(job)
+        try:
+            self._queue.put_nowait((job['id'], function))
+        except queue.Full:
+            self.store.update(job['id'], status=FAILED, finished=time.time(), error='queue full')
+            if on_reject is not None:
+                on_reject()
+            raise QueueFull(f"{self._queue.maxsize} jobs are already waiting") from None
+        return job['id']
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def _work(self):
+        while True:
+            job_id, function = self._queue.get()
+            self.store.update(job_id, status=RUNNING, started=time.time())
+            try:
+                result = function(lambda step, state=DONE: self.store.update(job_id, progress={step: state}))
+            except Exception as error:
+                traceback.print_exc()
+                self.store.update(job_id, status=FAILED, finished=time.time(), error=f"{type(error).__name__}: {error}")
+            else:
+                self.store.update(job_id, status=DONE, finished=time.time(), result=result)
+            finally:
+                self._queue.task_done()
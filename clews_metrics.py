@@ -0,0 +1,112 @@
+"""Wall time, CPU time, peak memory, rows and findings of each parse and check.
+
+``timed_call`` runs a function and returns its result with a ``Timing``:
+wall and CPU seconds, and the peak memory allocated during the call when
+tracemalloc is tracing (start it with ``tracemalloc.start()`` or
+PYTHONTRACEMALLOC; it slows every allocation, so it is off by default).
+``timed_call`` is a module-level function, so process-pool workers can run
+it and send the timing back with the result. CPU time is the calling
+thread's, so it stays right on a thread pool. Peak memory is process-wide,
+and each call resets it for the whole process: it is exact for calls made
+one at a time, but calls that overlap on a thread pool reset each other's
+peak and report too little.
+
+``Metrics`` adds timings up per stage (a check, or the parse) and renders
+the totals in the Prometheus text format.
+"""
+import threading
+import time
+import tracemalloc
+from collections import namedtuple
+
+Timing = namedtuple('Timing', 'wall cpu peak_bytes')
+
+
+def timed_call(function, *args):
+    """Call ``function(*args)``; return (its result, a Timing of the call)."""
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+    wall, cpu = time.perf_counter(), time.thread_time()
+    result = function(*args)
+    wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+    peak_bytes = max(tracemalloc.get_traced_memory()[1] - base, 0) if tracing and tracemalloc.is_tracing() else None
+    return result, Timing(wall, cpu, peak_bytes)
+
+
+def combine(first, second):
+    """One Timing for two runs of a stage (on two region shards, say): times add up, peaks do not."""
+    if first is None:
+        return second
+    peaks = [peak for peak in (first.peak_bytes, second.peak_bytes) if peak is not None]
+    return Timing(first.wall + second.wall, first.cpu + second.cpu, max(peaks) if peaks else None)
+
+
+def timing_record(timing, rows=0, findings=0):
+    """A Timing with its rows scanned and findings produced, as a JSON-ready dict."""
+    return {
+        'wall_seconds': round(timing.wall, 6),
+        'cpu_seconds': round(timing.cpu, 6),
+        'peak_bytes': timing.peak_bytes,
+        'rows': rows,
+        'findings': findings,
+    }
+
+
+# (metric suffix, type, help, total field) in the order they are rendered
+_SERIES = (
+    ('runs_total', 'counter', 'Times the stage has run.', 'runs'),
+    ('wall_seconds_total', 'counter', 'Wall-clock seconds spent in the stage.', 'wall'),
+    ('cpu_seconds_total', 'counter', 'CPU seconds spent in the stage.', 'cpu'),
+    ('rows_total', 'counter', 'Param rows the stage has scanned.', 'rows'),
+    ('findings_total', 'counter', 'Findings the stage has produced.', 'findings'),
+    ('last_wall_seconds', 'gauge', 'Wall-clock seconds of the last run of the stage.', 'last_wall'),
+    ('peak_bytes', 'gauge', 'Largest peak of memory allocated during one run (needs tracemalloc).', 'peak_bytes'),
+)
+
+
+class Metrics:
+    """Running totals per stage, safe to update from several threads."""
+
+    def __init__(self, prefix='clews_stage', enabled=True):
+        self.prefix = prefix
+        self.enabled = enabled
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, timing, rows=0, findings=0):
+        with self._lock:
+            totals = self._totals.get(stage)
+            if totals is None:
+                totals = self._totals[stage] = dict(runs=0, wall=0.0, cpu=0.0, rows=0, findings=0, last_wall=0.0, peak_bytes=None)
+            totals['runs'] += 1
+            totals['wall'] += timing.wall
+            totals['cpu'] += timing.cpu
+            totals['rows'] += rows
+            totals['findings'] += findings
+            totals['last_wall'] = timing.wall
+            if timing.peak_bytes is not None:
+                totals['peak_bytes'] = max(totals['peak_bytes'] or 0, timing.peak_bytes)
+
+    def stats(self):
+        with self._lock:
+            return {stage: dict(totals) for stage, totals in self._totals.items()}
+
+    def clear(self):
+        with self._lock:
+            self._totals.clear()
+
+    def prometheus(self):
+        """The totals in the Prometheus text exposition format, one series per stage."""
+        stats = self.stats()
+        lines = []
+        for suffix, kind, help_text, field in _SERIES:
+            name = f"{self.prefix}_{suffix}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for stage, totals in stats.items():
+                if totals[field] is not None:
+                    label = stage.replace('\\', '\\\\').replace('"', '\\"')
+                    lines.append(f'{name}{{stage="{label}"}} {totals[field]}')
+        return "\n".join(lines) + "\n"
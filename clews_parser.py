@@ -0,0 +1,771 @@
+"""Single-pass parser for CLEWs GAMS data files.
+
+``parse_gams_data_file`` walks the data file once and builds a ``ParsedModel``
+holding the sets, the param sections and every data row together with its
+line number, slice index and values. The Part 1-8 readers in
+``TroubleShoot_CLEWs`` all derive their views from this object, so checking
+a file costs one parse plus the checks themselves.
+
+Each param section keeps its numbers column-wise: ``values`` is a 2-D float64
+array (rows x years, NaN-padded when rows are ragged) and ``index``,
+``line_numbers`` and ``labels`` are aligned with its rows, so the checks can
+work on whole sections at once.
+
+``iter_gams_sections`` parses the same way but hands over each section as
+soon as its block ends and then lets it go, for files too large to hold.
+
+``parse_gams_data_file_mmap`` builds the same model from a memory-mapped
+file, scanning it as bytes and only building the arrays of the params asked
+for. ``as_parsed_model`` picks between the two readers.
+"""
+import hashlib
+import json
+import mmap
+import os
+import re
+from array import array
+from collections import namedtuple
+
+import numpy as np
+
+# Bump whenever the ParsedModel layout or parsing rules change, so models
+# saved by save_model under an older version are parsed again.
+PARSER_VERSION = 2
+
+
+# Token classification is done with anchored regexes rather than try/except
+# around float()/int(): most tokens on a line are labels such as RE1 or
+# PWRCOA001, and raising for each of them dominated parse time.
+# Written so a token can only match one way: with \d+\.?\d* a failing
+# _NUMERIC_ROW match backtracks through every split of every number.
+_NUMBER = re.compile(r'[+-]?(?:(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?|inf(?:inity)?|nan)\Z', re.IGNORECASE)
+_INTEGER = re.compile(r'[+-]?\d+\Z')
+_NUMBER_PATTERN = _NUMBER.pattern[:-2]
+_NUMERIC_ROW = re.compile(r'\S+(?:\s+' + _NUMBER_PATTERN + r')*\s*\Z', re.IGNORECASE)
+_YEAR_HEADER = re.compile(r'(?:\d+\s+)*\d+\s*:=\Z')
+
+# The same patterns for the mmap reader, which never decodes data rows
+_BYTES_NUMBER = re.compile(_NUMBER.pattern.encode(), re.IGNORECASE)
+_BYTES_NUMERIC_ROW = re.compile(_NUMERIC_ROW.pattern.encode(), re.IGNORECASE)
+_BYTES_YEAR_HEADER = re.compile(_YEAR_HEADER.pattern.encode())
+_SECTION_HEADER = re.compile(rb'^[^\S\n]*(?:set|param)', re.MULTILINE)
+# Bytes that can make up a plain decimal number, or separate two of them
+_DECIMAL_BYTES = b'0123456789.eE+- \t'
+
+# Which reader as_parsed_model uses for a file path: 'text' or 'mmap'
+READERS = ('text', 'mmap')
+DEFAULT_READER = os.environ.get('CLEWS_READER', 'text')
+
+SLICE = 'slice'
+YEARS = 'years'
+DATA = 'data'
+OTHER = 'other'
+
+
+def is_float(value):
+    return _NUMBER.match(value) is not None
+
+
+def is_year(value):
+    return _INTEGER.match(value) is not None and 2015 <= int(value) <= 2070
+
+
+# A classified line from inside a set or param block:
+#   SLICE  a bracket slice header such as [RE1,PWRCOA001,COA,*,*]: (``components`` holds its fields)
+#   YEARS  a year header such as "2015 2016 2017 :=" (``values`` holds the years as ints)
+#   DATA   a label followed by numbers (``label_value`` is the label as a float when numeric)
+#   OTHER  anything else, such as the closing ';'
+TokenizedLine = namedtuple('TokenizedLine', ['kind', 'tokens', 'label', 'label_value', 'values', 'components'])
+
+
+def tokenize_line(line_content):
+    """Classify a stripped, non-empty data line, converting each token at most once."""
+    tokens = line_content.split()
+    first = tokens[0]
+    if first[0] == '[':
+        return TokenizedLine(SLICE, tokens, None, None, [], _slice_components(line_content))
+    if first[0] == ';':
+        return TokenizedLine(OTHER, tokens, None, None, [], None)
+    if _YEAR_HEADER.match(line_content):
+        return TokenizedLine(YEARS, tokens, None, None, [int(token) for token in tokens[:-1]], None)
+    if _NUMERIC_ROW.match(line_content):
+        values = list(map(float, tokens[1:]))
+    else:
+        values = [float(token) for token in tokens[1:] if _NUMBER.match(token)]
+    label_value = float(first) if _NUMBER.match(first) else None
+    return TokenizedLine(DATA, tokens, first, label_value, values, None)
+
+
+# One tokenized line of the data file. ``index`` is the row's position in the
+# param (slice header components with the row label filled in), or None for
+# slice headers, year headers and other non-data lines.
+DataRow = namedtuple('DataRow', ['line_number', 'tokens', 'index'])
+
+
+class Section:
+    """A ``set`` or ``param`` block: its header line and the rows under it.
+
+    Param data lives in the columnar arrays. The tokenized ``rows`` are kept
+    from a text parse; a section restored from the disk cache re-reads them
+    from the data file on first use.
+    """
+
+    def __init__(self, kind, name, line_number, header):
+        self.kind = kind
+        self.name = name
+        self.line_number = line_number
+        self.end_line = line_number
+        self.header = header
+        self.tokens = header.split()
+        self.years = []
+        # (line_number, header) of each [..] slice header, and the line of the
+        # ';' closing the block, for the technology-commodity matchers
+        self.slice_headers = []
+        self.closing_line = None
+        self.values = np.empty((0, 0))
+        self.line_numbers = np.empty(0, dtype=np.int64)
+        self.labels = np.empty(0)
+        self.model = None
+        # Byte spans to re-read rows from when they are not held in memory;
+        # None means the whole block below the header
+        self.row_spans = None
+        # Hash of the block's raw bytes, header line included, so an unchanged
+        # section can be recognised in another version of the file
+        self.digest = None
+        self._rows = None
+        self._index = None
+        self._index_table = None
+        self._pending_values = []
+        self._pending_labels = []
+        self._pending_index = []
+        self._pending_lines = []
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            if self.row_spans is not None:
+                numbered_lines = self.model.read_spans(self.row_spans)
+            elif self.end_line > self.line_number:
+                numbered_lines = self.model.lines(self.line_number + 1, self.end_line)
+            else:
+                numbered_lines = []
+            self._rows = _section_rows(self, numbered_lines)
+        return self._rows
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = [tuple(component for component in row if component) for row in self._index_table.tolist()]
+        return self._index
+
+    def row_index(self, row):
+        """Index tuple of one data row, without building the whole ``index`` list."""
+        if self._index is not None:
+            return self._index[row]
+        return tuple(component for component in self._index_table[row].tolist() if component)
+
+    @property
+    def index_table(self):
+        """The row index tuples as a 2-D string array, padded with ''."""
+        if self._index_table is None:
+            width = max((len(index) for index in self._index), default=0)
+            self._index_table = np.array([index + ('',) * (width - len(index)) for index in self._index], dtype=str).reshape(len(self._index), width)
+        return self._index_table
+
+    def finalise(self):
+        """Pack the data rows collected while parsing into the columnar arrays."""
+        self._index = self._pending_index
+        self.line_numbers = np.array(self._pending_lines, dtype=np.int64)
+        # A numeric row label (a mode of operation, say) keeps its value here;
+        # text labels such as technology names are NaN.
+        self.labels = np.array(self._pending_labels, dtype=np.float64)
+        rows = self._pending_values
+        width = max((len(values) for values in rows), default=0)
+        if all(len(values) == width for values in rows):
+            self.values = np.array(rows, dtype=np.float64).reshape(len(rows), width)
+        else:
+            self.values = np.full((len(rows), width), np.nan)
+            for i, values in enumerate(rows):
+                self.values[i, :len(values)] = values
+        self._pending_values = []
+        self._pending_labels = []
+        self._pending_index = []
+        self._pending_lines = []
+
+    def __repr__(self):
+        return f"Section({self.kind!r}, {self.name!r}, line {self.line_number}, {len(self.line_numbers)} rows)"
+
+
+class ParsedModel:
+    """Everything the checks need from one data file, built in a single pass."""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.sections = []
+        self.sets = {}
+        self.params = {}
+        self.starting_year = None
+        self.years = []
+        # Byte offset of the start of every line, plus the end of the file, so
+        # any line can be fetched again with a single seek.
+        self.line_offsets = array('q')
+        self.token_bytes = 0
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the model: the arrays plus the token lists."""
+        total = self.token_bytes + self.line_offsets.itemsize * len(self.line_offsets)
+        for section in self.params.values():
+            total += section.values.nbytes + section.labels.nbytes + section.line_numbers.nbytes
+        return total
+
+    @property
+    def line_count(self):
+        return max(len(self.line_offsets) - 1, 0)
+
+    def line(self, line_number):
+        """Return the raw text of a 1-based line number without rescanning the file."""
+        return self.lines(line_number, line_number)[0][1]
+
+    def lines(self, first, last):
+        """Return [(line_number, text)] for the inclusive range first..last."""
+        first = max(first, 1)
+        last = min(last, self.line_count)
+        if first > last:
+            raise IndexError(f"line {first} is outside {self.file_path}")
+        return self.read_spans([self.span(first, last)])
+
+    def span(self, first, last):
+        """(first, start byte, end byte) of the lines first..last, for read_spans."""
+        return first, self.line_offsets[first - 1], self.line_offsets[last]
+
+    def read_spans(self, spans):
+        """Return [(line_number, text)] for each (first_line, start, end) byte span."""
+        numbered_lines = []
+        with open(self.file_path, 'rb') as file:
+            for first, start, end in spans:
+                file.seek(start)
+                texts = file.read(end - start).decode().splitlines()
+                numbered_lines.extend(zip(range(first, first + len(texts)), texts))
+        return numbered_lines
+
+    def regions(self):
+        """Regions declared in the REGION set, in file order."""
+        return list(self.sets.get('REGION', []))
+
+    def split_by_region(self):
+        """Return {region: model} shards, each holding only that region's param rows.
+
+        A row belongs to the region its index starts with. Rows of params
+        without a region index, and every set, go to the shard keyed None.
+        Shards share the sets but have no line index, so they are for running
+        checks rather than fetching source context.
+        """
+        regions = self.regions()
+        shards = {}
+        for region in regions + [None]:
+            shard = ParsedModel(self.file_path)
+            shard.sets = self.sets
+            shard.starting_year = self.starting_year
+            shard.years = self.years
+            shards[region] = shard
+        for section in self.sections:
+            if section.kind != 'param':
+                shard = shards[None]
+                spans = [self.span(section.line_number + 1, section.end_line)] if section.end_line > section.line_number else []
+                shard.sections.append(_section_shard(section, shard, None, spans, None))
+                continue
+            row_regions = section.index_table[:, 0] if section.index_table.shape[1] else np.full(len(section.line_numbers), '')
+            spans = _region_spans(self, section, regions)
+            for region, shard in shards.items():
+                if region is None:
+                    keep = ~np.isin(row_regions, regions)
+                    in_shard = lambda header_region: header_region not in regions
+                else:
+                    keep = row_regions == region
+                    in_shard = lambda header_region, region=region: header_region == region
+                part = _section_shard(section, shard, keep, spans.get(region, []), in_shard)
+                shard.sections.append(part)
+                shard.params[part.name] = part
+        return shards
+
+    def subset(self, keep):
+        """Return a copy holding only some param rows, for re-running checks on part of a model.
+
+        ``keep`` maps the position of a param section in ``sections`` to True
+        (the whole section) or to a boolean mask over its rows; a masked
+        section keeps all its slice headers but no tokenized rows. Param
+        sections not in ``keep`` are left empty, and every set is kept.
+        """
+        subset = ParsedModel(self.file_path)
+        subset.sets = self.sets
+        subset.starting_year = self.starting_year
+        subset.years = self.years
+        for position, section in enumerate(self.sections):
+            whole = [self.span(section.line_number + 1, section.end_line)] if section.end_line > section.line_number else []
+            if section.kind != 'param':
+                subset.sections.append(_section_shard(section, subset, None, whole, None))
+                continue
+            rows = keep.get(position)
+            if rows is None:
+                part = _section_shard(section, subset, np.zeros(len(section.line_numbers), dtype=bool), [], lambda region: False)
+            elif rows is True:
+                part = _section_shard(section, subset, np.ones(len(section.line_numbers), dtype=bool), whole, lambda region: True)
+            else:
+                part = _section_shard(section, subset, rows, [], lambda region: True)
+            subset.sections.append(part)
+            subset.params[part.name] = part
+        return subset
+
+    def context(self, line_number, radius=2):
+        """Return up to ``radius`` lines either side of a flagged line for a report."""
+        return self.lines(max(line_number - radius, 1), min(line_number + radius, self.line_count))
+
+    def param(self, name):
+        return self.params.get(name)
+
+    def set_members(self, name):
+        return self.sets.get(name, [])
+
+    def __repr__(self):
+        return f"ParsedModel({self.file_path!r}, {len(self.sets)} sets, {len(self.params)} params)"
+
+
+def _slice_components(header):
+    return header.strip().rstrip(':').strip('[]').split(',')
+
+
+def _row_index(components, label):
+    if not components:
+        return (label,)
+    filled = []
+    placed = False
+    for component in components:
+        if component == '*' and not placed:
+            filled.append(label)
+            placed = True
+        elif component != '*':
+            filled.append(component)
+    return tuple(filled)
+
+
+def _set_members(section):
+    tokens = section.tokens[2:]
+    for row in section.rows:
+        tokens.extend(row.tokens)
+    return [token for token in tokens if token not in (':=', ';')]
+
+
+def _add_row(section, line_number, line_content, components, collect=True):
+    """Classify one block line into ``section``; return the slice components now in force.
+
+    ``collect`` is False when re-reading rows for a section whose arrays are
+    already built, so only the tokenized row is kept.
+    """
+    line = tokenize_line(line_content)
+    if line.kind == SLICE:
+        components = line.components
+        row = DataRow(line_number, line.tokens, None)
+        if collect:
+            section.slice_headers.append((line_number, line.tokens[0]))
+    elif line.kind == YEARS:
+        row = DataRow(line_number, line.tokens, None)
+        if collect:
+            section.years = line.values
+    elif line.kind == DATA and section.kind == 'param':
+        row = DataRow(line_number, line.tokens, _row_index(components, line.label))
+        if collect:
+            section._pending_values.append(line.values)
+            section._pending_labels.append(np.nan if line.label_value is None else line.label_value)
+            section._pending_index.append(row.index)
+            section._pending_lines.append(line_number)
+    else:
+        row = DataRow(line_number, line.tokens, None)
+        if collect and line.tokens[0].startswith(';') and section.closing_line is None:
+            section.closing_line = line_number
+    if section._rows is not None:
+        section._rows.append(row)
+    return components
+
+
+def _section_rows(section, numbered_lines):
+    section._rows = []
+    components = None
+    for line_number, line in numbered_lines:
+        line_content = line.strip()
+        if line_content.startswith('*') or line_content.startswith('#') or not line_content:
+            continue
+        components = _add_row(section, line_number, line_content, components, collect=False)
+    rows, section._rows = section._rows, None
+    return rows
+
+
+def _header_region(header):
+    return header.lstrip('[').split(',')[0].rstrip(']:')
+
+
+def _region_spans(model, section, regions):
+    """Byte spans of the rows under each region's slice headers, keyed by region (None for the rest)."""
+    spans = {}
+    starts = [(section.line_number + 1, None)] + [
+        (line_number, _header_region(header) if _header_region(header) in regions else None)
+        for line_number, header in section.slice_headers
+    ]
+    for i, (first, region) in enumerate(starts):
+        last = starts[i + 1][0] - 1 if i + 1 < len(starts) else section.end_line
+        if first <= last:
+            spans.setdefault(region, []).append(model.span(first, last))
+    return spans
+
+
+def _section_shard(section, model, keep, row_spans, in_shard):
+    """Copy of ``section`` for a region shard holding the data rows selected by ``keep``.
+
+    ``in_shard(region)`` says whether a slice header's region belongs to the shard.
+    """
+    part = Section(section.kind, section.name, section.line_number, section.header)
+    part.model = model
+    part.end_line = section.end_line
+    part.years = section.years
+    part.closing_line = section.closing_line
+    part.row_spans = row_spans
+    if section.kind == 'param':
+        part.values = section.values[keep]
+        part.labels = section.labels[keep]
+        part.line_numbers = section.line_numbers[keep]
+        part._index_table = section.index_table[keep]
+        part.slice_headers = [
+            (line_number, header) for line_number, header in section.slice_headers
+            if in_shard(_header_region(header))
+        ]
+    return part
+
+
+def _new_section(model, kind, name, line_number, header):
+    section = Section(kind, name, line_number, header)
+    section.model = model
+    section._rows = []
+    model.sections.append(section)
+    return section
+
+
+def _block_digest(data=b''):
+    return hashlib.blake2b(data, digest_size=16)
+
+
+def _end_section(model, section, end_line, start_byte, end_byte):
+    section.end_line = end_line
+    if section.kind == 'param':
+        section.finalise()
+        if section._rows is None and end_line > section.line_number:
+            section.row_spans = [(section.line_number + 1, start_byte, end_byte)]
+    elif section.kind == 'set':
+        name = section.name.strip(';')
+        model.sets[name] = _set_members(section)
+        if name == 'YEAR':
+            model.years = [int(year) for year in model.sets[name] if year.isdigit()]
+
+
+def _parse_sections(model, file, keep_rows=True):
+    """Parse the binary ``file`` into ``model``, yielding each section once its block has ended.
+
+    Line offsets are only recorded when ``model.line_offsets`` is not None.
+    With ``keep_rows`` False, param sections keep only their arrays and the
+    byte span of their block, and re-read their tokenized rows on demand.
+    """
+    section = None
+    components = None
+    offsets = model.line_offsets
+    offset = 0
+    block_start = 0
+    line_number = 0
+    digest = _block_digest()
+    for line_number, line in enumerate(file, start=1):
+        if offsets is not None:
+            offsets.append(offset)
+        line_start = offset
+        offset += len(line)
+        line_content = line.decode().strip()
+        if line_content.startswith("set") or line_content.startswith("param"):
+            if section is not None:
+                section.digest = digest.hexdigest()
+                _end_section(model, section, line_number - 1, block_start, line_start)
+                yield section
+            digest = _block_digest()
+        digest.update(line)
+        if line_content.startswith('*') or line_content.startswith('#') or not line_content:
+            continue
+        # Rough CPython cost of the row's token list and its strings
+        model.token_bytes += 56 + len(line_content) + 57 * (line_content.count(' ') + 1)
+        if line_content.startswith("set") or line_content.startswith("param"):
+            tokens = line_content.split()
+            kind = 'set' if line_content.startswith("set") else 'param'
+            name = tokens[1] if len(tokens) > 1 else None
+            section = _new_section(model, kind, name, line_number, line_content)
+            components = None
+            block_start = offset
+            if kind == 'param' and not keep_rows:
+                section._rows = None
+            if kind == 'param':
+                model.params[name] = section
+            if line_content.startswith("set YEAR"):
+                model.starting_year = int(re.search(r'\d+', line_content).group())
+            continue
+        if section is None:
+            section = _new_section(model, None, None, 0, '')
+        components = _add_row(section, line_number, line_content, components)
+    if offsets is not None:
+        offsets.append(offset)
+    if section is not None:
+        section.digest = digest.hexdigest()
+        _end_section(model, section, line_number, block_start, offset)
+        yield section
+
+
+def parse_gams_data_file(file_path):
+    model = ParsedModel(file_path)
+    with open(file_path, 'rb') as file:
+        for _ in _parse_sections(model, file):
+            pass
+    return model
+
+
+def iter_gams_sections(file_path):
+    """Parse ``file_path`` one section at a time, yielding (model, section) as each block ends.
+
+    The model holds the sets read so far and only the section just yielded,
+    which is dropped again before the next one is parsed, so memory is bounded
+    by the largest section rather than the file. It keeps no line offsets, so
+    ``model.lines`` and ``model.context`` are not available on it.
+    """
+    model = ParsedModel(file_path)
+    model.line_offsets = None
+    with open(file_path, 'rb') as file:
+        for section in _parse_sections(model, file, keep_rows=False):
+            yield model, section
+            if section.kind != 'set':
+                model.sections.remove(section)
+                model.params.pop(section.name, None)
+
+
+def _map_block_rows(section, block, first_line):
+    """Tokenize a decoded block through _add_row, as the text reader does."""
+    components = None
+    for line_number, line in enumerate(block.decode().split('\n'), start=first_line):
+        line_content = line.strip()
+        if line_content.startswith('*') or line_content.startswith('#') or not line_content:
+            continue
+        components = _add_row(section, line_number, line_content, components)
+
+
+def _map_param(section, block, first_line):
+    """Fill a param section's arrays from its raw block, decoding only labels and headers."""
+    components = None
+    year_header = None
+    for line_number, line in enumerate(block.split(b'\n'), start=first_line):
+        line = line.strip()
+        if not line or line[:1] in (b'*', b'#'):
+            continue
+        first = line[:1]
+        if first == b'[':
+            header = line.decode()
+            components = _slice_components(header)
+            section.slice_headers.append((line_number, header.split()[0]))
+            continue
+        if first == b';':
+            if section.closing_line is None:
+                section.closing_line = line_number
+            continue
+        if line.endswith(b':=') and _BYTES_YEAR_HEADER.match(line):
+            # Every slice usually repeats the same header
+            if line != year_header:
+                section.years = [int(token) for token in line.split()[:-1]]
+                year_header = line
+            continue
+        tokens = line.split()
+        label = tokens[0]
+        values = None
+        if not line[len(label):].translate(None, _DECIMAL_BYTES):
+            # Only digits, signs, points and exponents: float() takes exactly
+            # the tokens _NUMBER would, so skip the regex unless one is malformed
+            try:
+                values = list(map(float, tokens[1:]))
+            except ValueError:
+                pass
+        if values is None:
+            if _BYTES_NUMERIC_ROW.match(line):
+                values = list(map(float, tokens[1:]))
+            else:
+                values = [float(token) for token in tokens[1:] if _BYTES_NUMBER.match(token)]
+        section._pending_values.append(values)
+        section._pending_labels.append(float(label) if _BYTES_NUMBER.match(label) else np.nan)
+        section._pending_index.append(_row_index(components, label.decode()))
+        section._pending_lines.append(line_number)
+
+
+def _reuse_param(section, old):
+    """Give ``section`` the parsed rows of ``old``, an identical block elsewhere in another file."""
+    delta = section.line_number - old.line_number
+    section._rows = None
+    section.years = old.years
+    section.values = old.values
+    section.labels = old.labels
+    section.line_numbers = old.line_numbers + delta
+    section._index = old._index
+    section._index_table = old._index_table
+    section.slice_headers = [(line_number + delta, header) for line_number, header in old.slice_headers]
+    section.closing_line = old.closing_line + delta if old.closing_line is not None else None
+
+
+def parse_gams_data_file_mmap(file_path, params=None, baseline=None):
+    """Build a ParsedModel from a memory-mapped data file.
+
+    Line offsets and section boundaries are found by scanning the raw bytes,
+    and sets are tokenized as usual. Param sections named in ``params`` (all
+    of them when None) get their arrays built from their block's bytes; the
+    others are left empty. Tokenized param rows are not kept; ``rows``
+    re-reads them from the file on demand.
+
+    A param block byte-for-byte identical to one in the ``baseline`` model,
+    wherever it sits in either file, takes that section's arrays instead of
+    being parsed again.
+    """
+    if os.path.getsize(file_path) == 0:
+        return parse_gams_data_file(file_path)
+    model = ParsedModel(file_path)
+    reusable = {}
+    if baseline is not None:
+        reusable = {(section.name, section.digest): section for section in baseline.params.values() if section.digest}
+    with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        newlines = np.flatnonzero(np.frombuffer(mapped, dtype=np.uint8) == ord('\n'))
+        starts = np.concatenate(([0], newlines + 1))
+        if starts[-1] != len(mapped):
+            starts = np.append(starts, len(mapped))
+        model.line_offsets = array('q', starts.astype(np.int64).tobytes())
+        del newlines
+
+        headers = [match.start() for match in _SECTION_HEADER.finditer(mapped)]
+        header_lines = np.searchsorted(starts, headers, side='right').tolist()
+        if not headers or header_lines[0] > 1:
+            # Anything above the first set or param goes to a header-less section
+            prelude = Section(None, None, 0, '')
+            prelude.model = model
+            prelude._rows = []
+            last = header_lines[0] - 1 if headers else model.line_count
+            _map_block_rows(prelude, mapped[0:int(starts[last])], 1)
+            prelude.digest = _block_digest(mapped[0:int(starts[last])]).hexdigest()
+            if prelude._rows:
+                prelude.end_line = last
+                model.sections.append(prelude)
+
+        for i, line_number in enumerate(header_lines):
+            header_end = int(starts[line_number])
+            end_line = header_lines[i + 1] - 1 if i + 1 < len(header_lines) else model.line_count
+            block_end = int(starts[end_line])
+            line_content = mapped[int(starts[line_number - 1]):header_end].decode().strip()
+            tokens = line_content.split()
+            kind = 'set' if line_content.startswith("set") else 'param'
+            name = tokens[1] if len(tokens) > 1 else None
+            section = _new_section(model, kind, name, line_number, line_content)
+            section.digest = _block_digest(mapped[int(starts[line_number - 1]):block_end]).hexdigest()
+            old = None
+            if kind == 'param':
+                model.params[name] = section
+                section._rows = None
+                old = reusable.get((name, section.digest))
+                if old is None or not old.line_numbers.size:
+                    old = None
+                    if params is None or name.strip(';') in params:
+                        _map_param(section, mapped[header_end:block_end], line_number + 1)
+            else:
+                _map_block_rows(section, mapped[header_end:block_end], line_number + 1)
+            if line_content.startswith("set YEAR"):
+                model.starting_year = int(re.search(r'\d+', line_content).group())
+            _end_section(model, section, end_line, header_end, block_end)
+            if old is not None:
+                _reuse_param(section, old)
+    return model
+
+
+def as_parsed_model(source, params=None, reader=None):
+    """Return ``source`` if it is already parsed, otherwise parse the file it names.
+
+    ``reader`` is 'text' or 'mmap' (default: DEFAULT_READER, from the
+    CLEWS_READER environment variable). With the mmap reader only the params
+    named in ``params`` have their arrays built.
+    """
+    if isinstance(source, ParsedModel):
+        return source
+    reader = reader or DEFAULT_READER
+    if reader not in READERS:
+        raise ValueError(f"reader must be one of {', '.join(READERS)}, not {reader!r}")
+    if reader == 'mmap':
+        return parse_gams_data_file_mmap(source, params)
+    return parse_gams_data_file(source)
+
+
+def save_model(model, file):
+    """Write the model's arrays and section metadata to ``file`` as an uncompressed .npz."""
+    arrays = {'line_offsets': np.frombuffer(model.line_offsets, dtype=np.int64)}
+    sections = []
+    for i, section in enumerate(model.sections):
+        sections.append({
+            'kind': section.kind,
+            'name': section.name,
+            'line_number': section.line_number,
+            'end_line': section.end_line,
+            'header': section.header,
+            'years': section.years,
+            'closing_line': section.closing_line,
+            'digest': section.digest,
+        })
+        arrays[f'slice_lines_{i}'] = np.array([line for line, _ in section.slice_headers], dtype=np.int64)
+        arrays[f'slice_headers_{i}'] = np.array([header for _, header in section.slice_headers], dtype=str)
+        if section.kind == 'param':
+            arrays[f'values_{i}'] = section.values
+            arrays[f'labels_{i}'] = section.labels
+            arrays[f'line_numbers_{i}'] = section.line_numbers
+            arrays[f'index_{i}'] = section.index_table
+    meta = {
+        'parser_version': PARSER_VERSION,
+        'starting_year': model.starting_year,
+        'years': model.years,
+        'sets': model.sets,
+        'token_bytes': model.token_bytes,
+        'sections': sections,
+    }
+    arrays['meta'] = np.array(json.dumps(meta))
+    np.savez(file, **arrays)
+
+
+def load_model(file, file_path):
+    """Rebuild a model saved by save_model; ``file_path`` is the data file it describes.
+
+    Raises ValueError when the saved model came from another PARSER_VERSION.
+    """
+    with np.load(file, allow_pickle=False) as saved:
+        meta = json.loads(saved['meta'].item())
+        if meta['parser_version'] != PARSER_VERSION:
+            raise ValueError(f"saved model is parser version {meta['parser_version']}, not {PARSER_VERSION}")
+        model = ParsedModel(file_path)
+        model.line_offsets = array('q', saved['line_offsets'].tobytes())
+        model.starting_year = meta['starting_year']
+        model.years = meta['years']
+        model.sets = meta['sets']
+        model.token_bytes = meta['token_bytes']
+        for i, info in enumerate(meta['sections']):
+            section = Section(info['kind'], info['name'], info['line_number'], info['header'])
+            section.model = model
+            section.end_line = info['end_line']
+            section.years = info['years']
+            section.closing_line = info['closing_line']
+            section.digest = info['digest']
+            section.slice_headers = list(zip(saved[f'slice_lines_{i}'].tolist(), saved[f'slice_headers_{i}'].tolist()))
+            if section.kind == 'param':
+                section.values = saved[f'values_{i}']
+                section.labels = saved[f'labels_{i}']
+                section.line_numbers = saved[f'line_numbers_{i}']
+                section._index_table = saved[f'index_{i}']
+                model.params[section.name] = section
+            model.sections.append(section)
+    return model
@@ -0,0 +1,263 @@
+"""Rule tables for the checks: technology-commodity rules and value ranges.
+
+A rule table is an ordered list of rules, each pairing a technology glob
+with the commodity globs allowed for it; the first rule whose technology
+glob matches a technology decides for it. ``*`` and ``?`` in a technology
+glob capture what they match, and ``$1``, ``$2``... in a commodity glob are
+replaced by those captures, so ``IMP???`` can require ``CRP$1``.
+
+``TechnologyRules`` compiles a table into a prefix trie keyed on the literal
+start of each technology glob, so a technology is only tested against the
+rules that can match it, and remembers the outcome for every technology
+name, so a model's rows cost one lookup per distinct technology. Tables are
+kept as JSON files::
+
+    {"rules": [{"technology": "PWR*BIO*", "commodities": ["BIO"]}, ...]}
+
+``RangeRules`` holds the sensible ranges of param values. Each rule gives a
+param a ``min`` and/or ``max``, optionally only for the rows whose
+technology or commodity matches a glob and for the years from ``years[0]``
+to ``years[1]`` (either may be null). Where several rules apply to a value,
+the later ones override the earlier ones, so a table can start with a
+param's general range and narrow it for some technologies or years after::
+
+    {"rules": [{"param": "CapitalCost", "min": 0, "max": 7000},
+               {"param": "CapitalCost", "technology": "PWRSOL*", "max": 3000, "years": [2030, null]}, ...]}
+
+``RangeRules.bounds`` compiles the rules of a section's param into arrays of
+lower and upper bounds the shape of its values, so a whole section is
+checked in one comparison.
+"""
+import json
+import re
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+_CAPTURE = re.compile(r'\$(\d+)')
+
+
+def _literal_prefix(pattern):
+    return re.split(r'[*?\[]', pattern, maxsplit=1)[0]
+
+
+def _glob_regex(pattern, capture=False):
+    """Compile a glob with ``*``, ``?`` and ``[...]``; with ``capture``, each wildcard run is a group."""
+    parts = []
+    for token in re.findall(r'\*+|\?+|\[[^\]]*\]|[^*?\[]+', pattern):
+        if token[0] == '*':
+            parts.append('(.*)' if capture else '.*')
+        elif token[0] == '?':
+            parts.append(f'(.{{{len(token)}}})' if capture else f'.{{{len(token)}}}')
+        elif token[0] == '[' and len(token) > 2:
+            negate = token[1] == '!'
+            body = token[2:-1] if negate else token[1:-1]
+            parts.append('[' + ('^' if negate else '') + body.replace('\\', '\\\\') + ']')
+        else:
+            parts.append(re.escape(token))
+    return re.compile(''.join(parts), re.DOTALL)
+
+
+class _Rule:
+    def __init__(self, order, technology, commodities):
+        self.order = order
+        self.technology = technology
+        self.commodities = list(commodities)
+        self.regex = _glob_regex(technology, capture=True)
+
+
+class _Allowed:
+    """The commodities one technology may use: exact names plus compiled globs."""
+
+    def __init__(self, patterns):
+        self.names = {pattern for pattern in patterns if _literal_prefix(pattern) == pattern}
+        self.globs = [_glob_regex(pattern) for pattern in patterns if pattern not in self.names]
+
+    def __contains__(self, commodity):
+        return commodity in self.names or any(glob.fullmatch(commodity) for glob in self.globs)
+
+
+class TechnologyRules:
+    """An ordered technology-commodity rule table compiled for repeated lookups."""
+
+    # Forget the resolved technologies once this many have been seen, so a
+    # long-running server checking many unrelated models stays bounded.
+    MAX_RESOLVED = 100000
+
+    def __init__(self, rules):
+        self.rules = [_Rule(order, technology, commodities) for order, (technology, commodities) in enumerate(rules)]
+        self._trie = {}
+        for rule in self.rules:
+            node = self._trie
+            for char in _literal_prefix(rule.technology):
+                node = node.setdefault(char, {})
+            node.setdefault(None, []).append(rule)
+        self._resolved = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path):
+        """Load a rule table saved as JSON (see the module docstring)."""
+        with open(path) as file:
+            table = json.load(file)
+        return cls((rule['technology'], rule['commodities']) for rule in table['rules'])
+
+    def to_file(self, path):
+        with open(path, 'w') as file:
+            json.dump({'rules': [{'technology': rule.technology, 'commodities': rule.commodities} for rule in self.rules]}, file, indent=2)
+
+    def _candidates(self, technology):
+        node = self._trie
+        candidates = list(node.get(None, []))
+        for char in technology:
+            node = node.get(char)
+            if node is None:
+                break
+            candidates.extend(node.get(None, []))
+        return sorted(candidates, key=lambda rule: rule.order)
+
+    def _resolve(self, technology):
+        for rule in self._candidates(technology):
+            match = rule.regex.fullmatch(technology)
+            if match:
+                captures = match.groups()
+                return _Allowed([
+                    _CAPTURE.sub(lambda ref: captures[int(ref.group(1)) - 1], pattern)
+                    for pattern in rule.commodities
+                ])
+        return None
+
+    def allowed(self, technology):
+        """The commodities allowed for ``technology``, or None when no rule covers it."""
+        try:
+            return self._resolved[technology]
+        except KeyError:
+            pass
+        allowed = self._resolve(technology)
+        with self._lock:
+            if len(self._resolved) >= self.MAX_RESOLVED:
+                self._resolved.clear()
+            self._resolved[technology] = allowed
+        return allowed
+
+    def allows(self, technology, commodity):
+        """True or False for a covered technology, None when no rule covers it."""
+        allowed = self.allowed(technology)
+        if allowed is None:
+            return None
+        return commodity in allowed
+
+    def __len__(self):
+        return len(self.rules)
+
+
+class _RangeRule:
+    FIELDS = ('param', 'technology', 'commodity', 'years', 'min', 'max')
+
+    def __init__(self, param, technology=None, commodity=None, years=None, min=None, max=None):
+        self.param = param
+        self.technology = technology
+        self.commodity = commodity
+        self.years = tuple(years) if years is not None else None
+        self.min = min
+        self.max = max
+        self.regexes = [(field, _glob_regex(pattern)) for field, pattern in (('technology', technology), ('commodity', commodity))
+                        if pattern is not None]
+
+    def as_dict(self):
+        rule = {field: getattr(self, field) for field in self.FIELDS}
+        if rule['years'] is not None:
+            rule['years'] = list(rule['years'])
+        return {field: value for field, value in rule.items() if value is not None}
+
+    def key(self):
+        return tuple(getattr(self, field) for field in self.FIELDS)
+
+
+def _row_members(index_table, members):
+    """Each row's first index component that is in ``members``, '' for rows with none."""
+    if not index_table.size or not members:
+        return np.full(len(index_table), '')
+    found = np.isin(index_table, list(members))
+    names = index_table[np.arange(len(index_table)), np.argmax(found, axis=1)]
+    return np.where(found.any(axis=1), names, '')
+
+
+def _glob_rows(regex, names):
+    """A mask of the rows whose name matches ``regex``, testing each distinct name once."""
+    distinct, inverse = np.unique(names, return_inverse=True)
+    matches = np.array([bool(name) and regex.fullmatch(name) is not None for name in distinct.tolist()], dtype=bool)
+    return matches[inverse].reshape(len(names))
+
+
+class RangeRules:
+    """Sensible value ranges per param, scoped by technology, commodity and year (see the module docstring)."""
+
+    def __init__(self, rules):
+        self.rules = [rule if isinstance(rule, _RangeRule) else _RangeRule(**rule) for rule in rules]
+        self._by_param = defaultdict(list)
+        for rule in self.rules:
+            self._by_param[rule.param].append(rule)
+
+    @classmethod
+    def from_file(cls, path):
+        """Load a range table saved as JSON (see the module docstring)."""
+        with open(path) as file:
+            table = json.load(file)
+        return cls(table['rules'])
+
+    def to_file(self, path):
+        with open(path, 'w') as file:
+            json.dump({'rules': [rule.as_dict() for rule in self.rules]}, file, indent=2)
+
+    def __contains__(self, param):
+        return param in self._by_param
+
+    def __iter__(self):
+        return iter(self._by_param)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def key(self):
+        """The rules as plain tuples, to tell two tables apart."""
+        return [rule.key() for rule in self.rules]
+
+    def bounds(self, param, section, sets):
+        """(lower, upper) arrays of bounds on the values of ``section``, -inf/inf where a value is unbounded.
+
+        Row technologies and commodities are the index components found in
+        the TECHNOLOGY and COMMODITY ``sets``; column years come from the
+        section's year header, and year-scoped rules skip the columns it
+        does not cover.
+        """
+        shape = section.values.shape
+        lower, upper = np.full(shape, -np.inf), np.full(shape, np.inf)
+        rules = self._by_param.get(param, [])
+        if not rules or not section.values.size:
+            return lower, upper
+        names = {}
+        years = np.full(shape[1], np.nan)
+        known = min(len(section.years), shape[1])
+        years[:known] = section.years[:known]
+        for rule in rules:
+            rows = np.ones(shape[0], dtype=bool)
+            for field, regex in rule.regexes:
+                if field not in names:
+                    names[field] = _row_members(section.index_table, sets.get(field.upper(), ()))
+                rows &= _glob_rows(regex, names[field])
+            columns = np.ones(shape[1], dtype=bool)
+            if rule.years is not None:
+                first, last = rule.years
+                columns = ~np.isnan(years)
+                if first is not None:
+                    columns &= years >= first
+                if last is not None:
+                    columns &= years <= last
+            cells = np.ix_(rows, columns)
+            if rule.min is not None:
+                lower[cells] = rule.min
+            if rule.max is not None:
+                upper[cells] = rule.max
+        return lower, upper
@@ -0,0 +1,187 @@
+"""Run independent checks against one parsed model on a thread or process pool.
+
+Checks are ``(name, function)`` pairs where ``function(model)`` returns that
+check's result. ``run_checks`` returns the results keyed by name in the order
+the checks were given, whatever order they finish in, so reports built from
+them keep their section order; ``iter_checks`` yields them as they finish.
+
+``run_checks_by_region`` instead splits a multi-region model into one shard
+per region, checks every shard on a process pool and merges each check's
+findings back into line-number order.
+
+Given ``on_timing(name, timing)``, each check is run through
+clews_metrics.timed_call and its Timing reported as it finishes (once per
+shard when sharding). Without it checks are called as they are.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from operator import itemgetter
+
+import numpy as np
+
+from clews_metrics import timed_call
+
+EXECUTORS = ('serial', 'thread', 'process')
+
+# The model a process-pool worker checks, sent once per worker by the pool
+# initializer rather than once per check.
+_worker_model = None
+
+
+def _init_worker(model):
+    global _worker_model
+    _worker_model = model
+
+
+def _run_in_worker(function):
+    return function(_worker_model)
+
+
+def _timed_in_worker(function):
+    return timed_call(function, _worker_model)
+
+
+def iter_checks(model, checks, executor='thread', max_workers=None, on_timing=None):
+    """Run every check against ``model``, yielding (name, result) as each one finishes.
+
+    ``executor`` is 'serial', 'thread' (checks share the model in memory) or
+    'process' (each worker gets one pickled copy; check functions must be
+    picklable, i.e. module-level functions or functools.partial of them).
+    Closing the generator early cancels the checks that have not started
+    and returns without waiting for the ones still running.
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"executor must be one of {', '.join(EXECUTORS)}, not {executor!r}")
+    if executor == 'serial' or len(checks) < 2:
+        for name, function in checks:
+            if on_timing is None:
+                yield name, function(model)
+            else:
+                result, timing = timed_call(function, model)
+                on_timing(name, timing)
+                yield name, result
+        return
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(checks))
+    if executor == 'thread':
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+        if on_timing is None:
+            futures = {pool.submit(function, model): name for name, function in checks}
+        else:
+            futures = {pool.submit(timed_call, function, model): name for name, function in checks}
+    else:
+        pool = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(model,))
+        run = _run_in_worker if on_timing is None else _timed_in_worker
+        futures = {pool.submit(run, function): name for name, function in checks}
+    try:
+        for future in as_completed(futures):
+            if on_timing is None:
+                yield futures[future], future.result()
+            else:
+                result, timing = future.result()
+                on_timing(futures[future], timing)
+                yield futures[future], result
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run_checks(model, checks, executor='thread', max_workers=None, on_done=None, on_timing=None):
+    """Run every check against ``model`` and return {name: result} in check order.
+
+    ``executor`` and ``on_timing`` are as for iter_checks. ``on_done(name)``
+    is called as each check finishes.
+    """
+    results = {}
+    for name, result in iter_checks(model, checks, executor, max_workers, on_timing):
+        results[name] = result
+        if on_done is not None:
+            on_done(name)
+    return {name: results[name] for name, _ in checks}
+
+
+def _run_shard(shard, checks, timed=False):
+    if not timed:
+        return {name: function(shard) for name, function in checks}
+    return {name: timed_call(function, shard) for name, function in checks}
+
+
+def merge_by_line(results, line_field=0):
+    """Merge one check's results from several shards into line-number order.
+
+    Results are lists of finding tuples with the line number at ``line_field``,
+    tuples of such lists, or dicts of them; the merge keeps that shape.
+    Findings from the same line keep the order their check produced them in.
+    """
+    first = results[0]
+    if isinstance(first, tuple):
+        return tuple(merge_by_line(list(parts), line_field) for parts in zip(*results))
+    if isinstance(first, dict):
+        merged = {}
+        for result in results:
+            for key, findings in result.items():
+                merged.setdefault(key, []).extend(findings)
+        by_line = {key: merge_by_line([findings], line_field) for key, findings in merged.items()}
+        return dict(sorted(by_line.items(), key=lambda item: item[1][0][line_field] if item[1] else 0))
+    merged = [finding for result in results for finding in result]
+    merged.sort(key=itemgetter(line_field))
+    return merged
+
+
+def run_checks_by_region(model, checks, line_fields=None, model_checks=(), max_workers=None, on_timing=None):
+    """Run ``checks`` on each region shard of ``model`` in parallel; return {name: merged result}.
+
+    Checks named in ``model_checks`` look at the model as a whole (the sets,
+    say) and run once on the full model instead. ``line_fields`` maps a check
+    name to the position of the line number in its findings (default 0).
+    """
+    line_fields = line_fields or {}
+    shards = list(model.split_by_region().values())
+    shard_checks = [(name, function) for name, function in checks if name not in model_checks]
+    timed = on_timing is not None
+    with ProcessPoolExecutor(max_workers=min(max_workers or os.cpu_count() or 1, len(shards))) as pool:
+        futures = [pool.submit(_run_shard, shard, shard_checks, timed) for shard in shards]
+        whole_model = {}
+        for name, function in checks:
+            if name in model_checks:
+                if timed:
+                    whole_model[name], timing = timed_call(function, model)
+                    on_timing(name, timing)
+                else:
+                    whole_model[name] = function(model)
+        shard_results = [future.result() for future in futures]
+    if timed:
+        for index, result in enumerate(shard_results):
+            for name, (findings, timing) in result.items():
+                on_timing(name, timing)
+            shard_results[index] = {name: findings for name, (findings, _) in result.items()}
+    results = {}
+    for name, _ in checks:
+        if name in whole_model:
+            results[name] = whole_model[name]
+        else:
+            results[name] = merge_by_line([result[name] for result in shard_results], line_fields.get(name, 0))
+    return results
+
+
+def map_lines(result, line_map, line_field=0):
+    """Renumber the findings in a check result through ``line_map``, dropping those it maps to -1.
+
+    ``line_map`` is an int64 array indexed by old line number; ``result``
+    has one of the shapes merge_by_line handles.
+    """
+    if isinstance(result, tuple):
+        return tuple(map_lines(part, line_map, line_field) for part in result)
+    if isinstance(result, dict):
+        mapped = {key: map_lines(findings, line_map, line_field) for key, findings in result.items()}
+        return {key: findings for key, findings in mapped.items() if findings}
+    lines = np.fromiter((finding[line_field] for finding in result), dtype=np.int64, count=len(result))
+    moved = np.full(len(lines), -1, dtype=np.int64)
+    inside = (lines >= 0) & (lines < len(line_map))
+    moved[inside] = line_map[lines[inside]]
+    mapped = []
+    for finding, line_number, new_line in zip(result, lines.tolist(), moved.tolist()):
+        if new_line == line_number:
+            mapped.append(finding)
+        elif new_line >= 0:
+            mapped.append(finding[:line_field] + (new_line,) + finding[line_field + 1:])
+    return mapped
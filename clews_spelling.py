@@ -0,0 +1,64 @@
+"""Spelling suggestions for set members, from an n-gram index of the names in a model.
+
+``NameIndex`` maps every character n-gram of the indexed names (padded so the
+first and last characters count) to the names containing it. A lookup only
+computes the edit distance to the names sharing the most n-grams with the
+misspelt word, so it stays fast with thousands of technology codes.
+"""
+from collections import Counter, defaultdict
+
+
+def edit_distance(first, second, limit=None):
+    """Levenshtein distance between two strings; anything over ``limit`` is returned as limit + 1."""
+    if len(first) < len(second):
+        first, second = second, first
+    if limit is not None and len(first) - len(second) > limit:
+        return limit + 1
+    previous = list(range(len(second) + 1))
+    for i, char in enumerate(first, start=1):
+        current = [i]
+        for j, other in enumerate(second, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other)))
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class NameIndex:
+    """An n-gram index over a collection of names, for suggesting the closest ones to a word."""
+
+    # How many of the names sharing the most n-grams get an exact distance
+    CANDIDATES = 50
+
+    def __init__(self, names, n=2):
+        self.n = n
+        self.names = sorted(set(names))
+        self._postings = defaultdict(list)
+        for name in self.names:
+            for gram in self._grams(name):
+                self._postings[gram].append(name)
+
+    def _grams(self, word):
+        padded = f"^{word}$"
+        return {padded[i:i + self.n] for i in range(len(padded) - self.n + 1)}
+
+    def suggest(self, word, limit=3, max_distance=None):
+        """Up to ``limit`` indexed names within ``max_distance`` edits of ``word``, closest first.
+
+        ``max_distance`` defaults to a third of the word's length (at least 1).
+        """
+        if max_distance is None:
+            max_distance = max(1, len(word) // 3)
+        shared = Counter()
+        for gram in sorted(self._grams(word)):
+            shared.update(self._postings.get(gram, ()))
+        scored = []
+        for name, count in shared.most_common(self.CANDIDATES):
+            distance = edit_distance(word, name, max_distance)
+            if distance <= max_distance:
+                scored.append((distance, -count, name))
+        return [name for _, _, name in sorted(scored)[:limit]]
+
+    def __len__(self):
+        return len(self.names)
@@ -0,0 +1,108 @@
+"""Turn an uploaded data file, plain or compressed, into one hashed temp file.
+
+``spool_upload`` reads an upload stream once, a chunk at a time: it
+decompresses gzip and zip uploads on the way, hashes the data file's bytes
+and writes them to a temp file with a unique name, so concurrent uploads of
+files with the same name never clash. The hash is of the decompressed data,
+so a model uploaded compressed and uncompressed shares one cache entry.
+
+Compressed uploads are recognised by their leading bytes rather than their
+file name. A zip upload must hold exactly one file.
+"""
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import zipfile
+import zlib
+
+CHUNK_SIZE = 1024 * 1024
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZIP_MAGIC = b'PK\x03\x04'
+
+
+class UploadError(ValueError):
+    """An upload that cannot be read as a data file: a corrupt archive, say, or one too large."""
+
+
+class _Prefixed:
+    """A read-only stream returning ``head`` and then the rest of ``stream``."""
+
+    def __init__(self, head, stream):
+        self.head = head
+        self.stream = stream
+
+    def read(self, size=-1):
+        if not self.head:
+            return self.stream.read(size)
+        if size is None or size < 0:
+            data, self.head = self.head + self.stream.read(), b''
+            return data
+        data, self.head = self.head[:size], self.head[size:]
+        return data
+
+
+def _zip_member(stream):
+    """Open the single file inside a zip upload; zip needs a seekable stream, so spool it first when it is not."""
+    seekable = getattr(stream, 'seekable', lambda: False)()
+    if not seekable:
+        spooled = tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024)
+        shutil.copyfileobj(stream, spooled, CHUNK_SIZE)
+        stream = spooled
+    stream.seek(0)
+    try:
+        archive = zipfile.ZipFile(stream)
+    except zipfile.BadZipFile as error:
+        raise UploadError(f"not a readable zip file: {error}") from None
+    members = [info for info in archive.infolist() if not info.is_dir()]
+    if len(members) != 1:
+        raise UploadError(f"a zip upload must hold exactly one data file, not {len(members)}")
+    return archive.open(members[0])
+
+
+def decompressed(stream):
+    """Wrap an upload stream so that reading it returns the data file, decompressing gzip and zip."""
+    head = stream.read(len(ZIP_MAGIC))
+    if head.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=_Prefixed(head, stream), mode='rb')
+    if head.startswith(ZIP_MAGIC):
+        if getattr(stream, 'seekable', lambda: False)():
+            return _zip_member(stream)
+        return _zip_member(_Prefixed(head, stream))
+    return _Prefixed(head, stream)
+
+
+def _read(data, size):
+    try:
+        return data.read(size)
+    except (gzip.BadGzipFile, EOFError, zlib.error, zipfile.BadZipFile) as error:
+        raise UploadError(f"could not decompress the upload: {error}") from None
+
+
+def spool_upload(stream, directory=None, max_bytes=None, chunk_size=CHUNK_SIZE):
+    """Decompress, hash and save an upload stream; return (temp file path, SHA-256 of the data).
+
+    Raises UploadError for a corrupt archive or, with ``max_bytes``, for a
+    data file that decompresses to more than that.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(prefix='clews-', suffix='.txt', dir=directory, delete=False) as temp_file:
+        try:
+            data = decompressed(stream)
+            while True:
+                chunk = _read(data, chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise UploadError(f"the data file is larger than {max_bytes // (1024 * 1024)} MB")
+                digest.update(chunk)
+                temp_file.write(chunk)
+        except BaseException:
+            temp_file.close()
+            os.remove(temp_file.name)
+            raise
+    return temp_file.name, digest.hexdigest()